@@ -2,21 +2,16 @@ import os
 from flask import Flask
 from flask_bootstrap import Bootstrap
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
-from flask_mail import Mail
-from dotenv import load_dotenv
 from flask_moment import Moment
-
-# Load environment variables from .env
-load_dotenv()
+from .routing import RoutingSession
 
 # --- Extensions ---
-db = SQLAlchemy()
+# Flask-Migrate is set up by ragtime.py for the CLI, and Flask-Mail by
+# app/email.py on the first send, so neither is imported here.
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 bootstrap = Bootstrap()
-migrate = Migrate()
 login_manager = LoginManager()
-mail = Mail()
 moment = Moment()
 
 def create_app(config_name='default'):
@@ -30,13 +25,22 @@ def create_app(config_name='default'):
 
     # --- Initialize extensions ---
     db.init_app(app)
+    from . import assets, avatars, engine, routing, profiling, metrics, ratelimit, templating, serializers, streaming
+    templating.init_app(app)
+    streaming.init_app(app)
+    serializers.init_app(app)
+    engine.init_app(app)
+    routing.init_app(app)
+    profiling.init_app(app)
+    metrics.init_app(app)
+    ratelimit.init_app(app)
     bootstrap.init_app(app)
-    migrate.init_app(app, db)
+    assets.init_app(app)
+    avatars.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.register'
     login_manager.login_message = "Please log in to access this page."
     login_manager.login_message_category = "warning"
-    mail.init_app(app)
     moment.init_app(app)
 
     # --- Register blueprints ---
@@ -52,12 +56,10 @@ def create_app(config_name='default'):
 
     # --- Import models and inject context ---
     from .models import Permission, ReleaseType  # 👈 ahora aquí
+    from . import feed  # registers the feed fan-out listeners
     @app.context_processor
     def inject_permissions_and_releases():
         return dict(Permission=Permission, ReleaseType=ReleaseType)
 
-    # --- Create database tables if they don't exist ---
-    with app.app_context():
-        db.create_all()
-
+    # Tables are created by `flask deploy`, not here (see ragtime.py)
     return app
@@ -1,9 +1,11 @@
 # app/api/authentication.py
 from flask_httpauth import HTTPBasicAuth
+from app import db
 from app.models import User
 from .errors import unauthorized, forbidden
 from flask import g, jsonify
 from . import api
+from ..decorators import rate_limit
 
 
 auth = HTTPBasicAuth()
@@ -21,13 +23,19 @@ def verify_password(email_or_token, password):
         return False
     g.current_user = user
     g.token_used = False
-    return user.verify_password(password)
+    if not user.verify_password(password):
+        return False
+    if db.session.is_modified(user):
+        db.session.commit()  # the password was rehashed
+    return True
 
 @auth.error_handler
 def auth_error():
     return unauthorized('Invalid credentials')
 
 @api.route('/tokens/', methods=['POST'])
+@rate_limit('30/minute', key='ip')
+@rate_limit('10/minute', key='token')
 def get_token():
     if g.current_user.is_anonymous or g.token_used:
         return unauthorized('Invalid credentials')
@@ -1,11 +1,16 @@
 # app/api/compositions.py
 from .. import db
 from . import api
-from flask import request, url_for, current_app, g, jsonify
+from flask import abort, request, url_for, current_app, g, jsonify
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from ..exceptions import ValidationError
 from ..models import Composition, Permission
+from ..serializers import CompositionSerializer
 from .decorators import permission_required
 from .errors import forbidden
 from functools import wraps
+from itertools import islice
 
 def permission_required(permission):
     def decorator(f):
@@ -20,27 +25,33 @@ def permission_required(permission):
 @api.route('/compositions/')
 def get_compositions():
     """Return all compositions paginated"""
-    page = request.args.get('page', 1, type=int)
-    pagination = Composition.query.paginate(
-        page,
-        per_page=current_app.config['RAGTIME_COMPS_PER_PAGE'],
-        error_out=False
-    )
-    compositions = pagination.items
-    prev = url_for('api.get_compositions', page=page-1) if pagination.has_prev else None
-    next = url_for('api.get_compositions', page=page+1) if pagination.has_next else None
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['RAGTIME_COMPS_PER_PAGE']
+    serializer = CompositionSerializer.from_request()
+    total = db.session.scalar(select(func.count()).select_from(Composition))
+    rows = db.session.execute(
+        serializer.select().order_by(Composition.id)
+        .limit(per_page).offset((page - 1) * per_page))
+    # keep fields/include on the neighbouring pages
+    args = request.args.to_dict()
+    prev = url_for('api.get_compositions', **dict(args, page=page-1)) if page > 1 else None
+    next = url_for('api.get_compositions', **dict(args, page=page+1)) \
+        if page * per_page < total else None
     return jsonify({
-        'compositions': [c.to_json() for c in compositions],
+        'compositions': serializer.many(rows),
         'prev': prev,
         'next': next,
-        'count': pagination.total
+        'count': total
     })
 
 @api.route('/compositions/<int:id>')
 def get_composition(id):
     """Return a single composition"""
-    composition = Composition.query.get_or_404(id)
-    return jsonify(composition.to_json())
+    serializer = CompositionSerializer.from_request()
+    row = db.session.execute(serializer.select().where(Composition.id == id)).first()
+    if row is None:
+        abort(404)
+    return jsonify(serializer(row))
 
 @api.route('/compositions/', methods=['POST'])
 @permission_required(Permission.PUBLISH)
@@ -49,10 +60,10 @@ def new_composition():
     composition = Composition.from_json(request.json)
     composition.artist = g.current_user
     db.session.add(composition)
+    db.session.flush()
+    composition.generate_slug(commit=False)
     db.session.commit()
 
-    composition.generate_slug()
-
     return jsonify(composition.to_json()), 201, {
         'Location': url_for('api.get_composition', id=composition.id)
     }
@@ -74,3 +85,148 @@ def edit_composition(id):
     db.session.add(composition)
     db.session.commit()
     return jsonify(composition.to_json())
+
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines')
+
+
+def batch_items():
+    """Yield the items of a batch request: a JSON array, or one JSON object
+    per line (NDJSON), which is read from the stream as it arrives"""
+    if request.mimetype in NDJSON_MIMETYPES:
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield current_app.json.loads(line)
+            except ValueError:
+                yield None
+        return
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValidationError("Expected a JSON array or NDJSON")
+    yield from items
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def item_error(index, status, error, message):
+    return {'index': index, 'status': status, 'error': error, 'message': message}
+
+
+def batch_response(results):
+    return jsonify({
+        'results': results,
+        'count': len(results),
+        'errors': sum(1 for result in results if result['status'] >= 400),
+    })
+
+
+def create_chunk(chunk):
+    """Insert the valid items of ``chunk`` in one transaction"""
+    results, pending = [], []
+    for index, item in chunk:
+        try:
+            if not isinstance(item, dict):
+                raise ValidationError("Item must be a JSON object")
+            composition = Composition.from_json(item)
+        except ValidationError as e:
+            results.append(item_error(index, 400, 'bad request', e.args[0]))
+            continue
+        composition.artist_id = g.current_user.id
+        pending.append((index, composition))
+    if not pending:
+        return results
+
+    db.session.add_all(composition for _, composition in pending)
+    try:
+        # one batched INSERT; the new ids come back with it
+        db.session.flush()
+        created = []
+        for index, composition in pending:
+            composition.slug = Composition.make_slug(composition.id, composition.title)
+            created.append({'index': index, 'status': 201, 'id': composition.id,
+                            'url': url_for('api.get_composition', id=composition.id)})
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        results.extend(item_error(index, 409, 'conflict', 'Chunk rolled back')
+                       for index, _ in pending)
+    else:
+        results.extend(created)
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+def edit_chunk(chunk):
+    """Apply the edits in ``chunk`` in one transaction"""
+    ids = {item['id'] for _, item in chunk
+           if isinstance(item, dict) and isinstance(item.get('id'), int)}
+    found = {composition.id: composition for composition in
+             Composition.query.filter(Composition.id.in_(ids))} if ids else {}
+    is_admin = g.current_user.can(Permission.ADMIN)
+
+    results, updated = [], []
+    for index, item in chunk:
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+            results.append(item_error(index, 400, 'bad request',
+                                      "Item must be a JSON object with an integer id"))
+            continue
+        composition = found.get(item['id'])
+        if composition is None:
+            results.append(item_error(index, 404, 'not found', 'No such composition'))
+            continue
+        if composition.artist_id != g.current_user.id and not is_admin:
+            results.append(item_error(index, 403, 'forbidden', 'Insufficient permissions'))
+            continue
+        for field in ('title', 'description'):
+            if field in item and not isinstance(item[field], str):
+                results.append(item_error(index, 400, 'bad request',
+                                          f"Composition {field} must be a string"))
+                break
+        else:
+            composition.release_type = item.get('release_type', composition.release_type)
+            composition.title = item.get('title', composition.title)
+            composition.description = item.get('description', composition.description)
+            updated.append({'index': index, 'status': 200, 'id': composition.id,
+                            'url': url_for('api.get_composition', id=composition.id)})
+    if not updated:
+        return results
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        results.extend(item_error(result['index'], 409, 'conflict', 'Chunk rolled back')
+                       for result in updated)
+    else:
+        results.extend(updated)
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+@api.route('/compositions/batch', methods=['POST'])
+@permission_required(Permission.PUBLISH)
+def new_compositions():
+    """Create many compositions, one transaction per chunk"""
+    results = []
+    for chunk in chunks(enumerate(batch_items()),
+                        current_app.config['RAGTIME_BATCH_CHUNK_SIZE']):
+        results.extend(create_chunk(chunk))
+    return batch_response(results)
+
+
+@api.route('/compositions/batch', methods=['PUT'])
+@permission_required(Permission.PUBLISH)
+def edit_compositions():
+    """Edit many compositions, one transaction per chunk"""
+    results = []
+    for chunk in chunks(enumerate(batch_items()),
+                        current_app.config['RAGTIME_BATCH_CHUNK_SIZE']):
+        results.extend(edit_chunk(chunk))
+    return batch_response(results)
@@ -1,12 +1,22 @@
 # app/api/errors.py
 from flask import jsonify
 from . import api
-from ..exceptions import ValidationError
+from ..exceptions import HasherBusy, ValidationError
 
 @api.errorhandler(ValidationError)
 def validation_error(e):
     return bad_request(e.args[0])
 
+@api.errorhandler(HasherBusy)
+def hasher_busy(e):
+    response = service_unavailable(e.args[0])
+    response.headers['Retry-After'] = '1'
+    return response
+
+@api.errorhandler(429)
+def rate_limited(e):
+    return too_many_requests('Rate limit exceeded, see the Retry-After header')
+
 def bad_request(message):
     response = jsonify({'error': 'bad request', 'message': message})
     response.status_code = 400
@@ -22,3 +32,12 @@ def forbidden(message):
     response.status_code = 403
     return response
 
+def too_many_requests(message):
+    response = jsonify({'error': 'too many requests', 'message': message})
+    response.status_code = 429
+    return response
+
+def service_unavailable(message):
+    response = jsonify({'error': 'service unavailable', 'message': message})
+    response.status_code = 503
+    return response
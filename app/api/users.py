@@ -1,32 +1,46 @@
 # app/api/users.py
 from .. import db
 from . import api
-from flask import request, url_for, jsonify, g
+from flask import abort, request, url_for, jsonify, g
+from sqlalchemy import select
 from ..models import Permission, Composition, User
+from ..serializers import CompositionSerializer, UserSerializer
 from .errors import forbidden
 from .decorators import permission_required
 
 @api.route('/users/<int:id>')
 def get_user(id):
-    user = User.query.get_or_404(id)
-    return jsonify(user.to_json())
+    serializer = UserSerializer()
+    row = db.session.execute(serializer.select().where(User.id == id)).first()
+    if row is None:
+        abort(404)
+    return jsonify(serializer(row))
+
+def require_user(id):
+    if db.session.scalar(select(User.id).where(User.id == id)) is None:
+        abort(404)
 
 @api.route('/users/<int:id>/compositions/')
 def get_user_compositions(id):
     """Return all the compositions written by a user"""
-    user = User.query.get_or_404(id)
-    compositions = user.compositions.all()
+    require_user(id)
+    serializer = CompositionSerializer.from_request()
+    compositions = serializer.many(db.session.execute(
+        serializer.select().where(Composition.artist_id == id)))
     return jsonify({
-        'compositions': [c.to_json() for c in compositions],
+        'compositions': compositions,
         'count': len(compositions)
     })
 
 @api.route('/users/<int:id>/timeline/')
 def get_user_timeline(id):
     """Return all the compositions followed by a user"""
-    user = User.query.get_or_404(id)
-    compositions = user.followed_compositions.all()
+    require_user(id)
+    serializer = CompositionSerializer.from_request()
+    compositions = serializer.many(db.session.execute(
+        serializer.select()
+        .where(Composition.artist_id.in_(User.timeline_artist_ids(id)))))
     return jsonify({
-        'timeline': [c.to_json() for c in compositions],
+        'timeline': compositions,
         'count': len(compositions)
     })
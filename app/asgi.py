@@ -0,0 +1,298 @@
+# app/asgi.py
+"""ASGI entry point with async handlers for the read-only JSON API.
+
+The GET endpoints of ``/api/v1`` that only read (users, their compositions
+and timelines, single compositions) are served by coroutines on an async
+SQLAlchemy engine, so a slow client or a slow query holds a socket and not
+a worker thread. They return exactly what ``User.to_json`` and
+``Composition.to_json`` return. Every other request, and any request the
+fast path can't answer cleanly (bad credentials, unconfirmed account,
+missing rows), is handed to the Flask app through ``asgiref``. So are
+endpoints with rate limits (when ``RAGTIME_RATELIMIT`` is on) and logins
+whose password hash is due to be rehashed, which only the Flask app does.
+
+The fast path does what the app's own hooks would for these reads: it
+counts the request in the metrics, and with ``RAGTIME_PROFILER`` it sends
+``Server-Timing`` and records the request and its slow queries in the
+profiler. Password checks run in an app context, so the hasher pool is
+sized by the app's settings.
+
+Needs ``aiosqlite`` (or ``asyncpg`` for PostgreSQL) and ``asgiref``, see
+requirements/asgi.txt. Run it with e.g.::
+
+    uvicorn --factory app.asgi:create_asgi_app
+"""
+import asyncio
+import base64
+import contextvars
+import os
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadData, URLSafeTimedSerializer
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from . import create_app, metrics, passwords, profiling
+from .exceptions import HasherBusy
+from .models import RELEASE_TYPE_LABELS, Composition, User
+
+# Sync driver prefix -> async driver
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+users = User.__table__
+compositions = Composition.__table__
+
+# The profile of the fast-path request being served, as g.profile is for
+# a Flask one; the async engine's statements run in the request's context
+_profile = contextvars.ContextVar('asgi_profile', default=None)
+
+
+def async_database_uri(app):
+    uri = app.config.get('RAGTIME_ASYNC_DATABASE_URI')
+    if uri:
+        return uri
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    scheme, rest = uri.split(':', 1)
+    return ASYNC_DRIVERS.get(scheme.split('+')[0], scheme) + ':' + rest
+
+
+class _Request:
+    def __init__(self, app, scope):
+        self.app = app
+        self.scope = scope
+        headers = {}
+        for name, value in scope['headers']:
+            headers[name.decode('latin-1').lower()] = value.decode('latin-1')
+        self.headers = headers
+        host = headers.get('host') or '%s:%s' % tuple(scope.get('server') or ('localhost', 80))
+        self.urls = app.flask_app.url_map.bind(
+            host, script_name=scope.get('root_path') or None,
+            url_scheme=scope.get('scheme', 'http'))
+
+    def url_for(self, endpoint, external=False, **values):
+        return self.urls.build(endpoint, values, force_external=external)
+
+    def credentials(self):
+        header = self.headers.get('authorization', '')
+        scheme, _, encoded = header.partition(' ')
+        if scheme.lower() != 'basic':
+            return None
+        try:
+            username, _, password = base64.b64decode(encoded).decode('utf-8').partition(':')
+        except (ValueError, UnicodeDecodeError):
+            return None
+        return username, password
+
+
+class _Fallback(Exception):
+    """The request has to be served by the Flask app"""
+
+
+class AsyncAPI:
+    """ASGI app: async handlers for some API reads, Flask for the rest"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.routes = flask_app.url_map.bind('localhost')
+        self.engine = create_async_engine(async_database_uri(flask_app))
+        self.tokens = URLSafeTimedSerializer(flask_app.config['SECRET_KEY'] or '')
+        self.record_metrics = bool(flask_app.config.get('RAGTIME_METRICS'))
+        self.profiler = flask_app.extensions.get('profiler')
+        if self.profiler is not None:
+            event.listen(self.engine.sync_engine, 'before_cursor_execute',
+                         self._before_cursor_execute)
+            event.listen(self.engine.sync_engine, 'after_cursor_execute',
+                         self._after_cursor_execute)
+        handlers = {
+            'api.get_user': self.get_user,
+            'api.get_composition': self.get_composition,
+            'api.get_user_compositions': self.get_user_compositions,
+            'api.get_user_timeline': self.get_user_timeline,
+        }
+        if 'ratelimit' in flask_app.extensions:
+            # limits are checked by the Flask app's before_request
+            handlers = {endpoint: handler for endpoint, handler in handlers.items()
+                        if not getattr(flask_app.view_functions[endpoint],
+                                       'rate_limits', None)}
+        self.handlers = handlers
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return await self.wsgi(scope, receive, send)
+        try:
+            endpoint, args = self.routes.match(
+                scope['path'], method=scope['method'])
+        except HTTPException:
+            return await self.wsgi(scope, receive, send)
+        handler = self.handlers.get(endpoint)
+        if handler is None or scope.get('query_string'):
+            # ?fields= and ?include= are only implemented by the Flask views
+            return await self.wsgi(scope, receive, send)
+
+        start = time.perf_counter()
+        profile = profiling.new_profile()
+        profile['endpoint'] = endpoint
+        token = _profile.set(profile)
+        request = _Request(self, scope)
+        try:
+            async with self.engine.connect() as conn:
+                await self.authenticate(conn, request)
+                body = await handler(conn, request, **args)
+        except _Fallback:
+            return await self.wsgi(scope, receive, send)
+        finally:
+            _profile.reset(token)
+        payload = (self.flask_app.json.dumps(body) + '\n').encode('utf-8')
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode('ascii')),
+        ]
+        if self.profiler is not None:
+            profile['total_ms'] = (time.perf_counter() - start) * 1000
+            headers.append((b'server-timing',
+                            profiling.server_timing(profile).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send({'type': 'http.response.body',
+                    'body': payload if scope['method'] == 'GET' else b''})
+        if self.profiler is not None:
+            self.profiler.record_request(endpoint, profile)
+        if self.record_metrics:
+            metrics.requests_total.inc(('api', endpoint, scope['method'], '200'))
+            metrics.request_duration.observe(time.perf_counter() - start, ('api', endpoint))
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _profile.get() is not None:
+            conn.info.setdefault('asgi_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context,
+                              executemany):
+        profile = _profile.get()
+        if profile is None or not conn.info.get('asgi_query_start'):
+            return
+        duration_ms = (time.perf_counter() - conn.info['asgi_query_start'].pop()) * 1000
+        profile['sql_count'] += 1
+        profile['sql_ms'] += duration_ms
+        self.profiler.record_query(statement, duration_ms, profile['endpoint'])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def authenticate(self, conn, request):
+        """Accept what ``api.authentication.verify_password`` accepts from a
+        confirmed user; leave everything else to Flask's error responses."""
+        credentials = request.credentials()
+        if credentials is None or credentials[0] == '':
+            raise _Fallback
+        email_or_token, password = credentials
+        if password == '':
+            try:
+                data = self.tokens.loads(email_or_token, max_age=3600)
+            except BadData:
+                raise _Fallback
+            where = users.c.id == data.get('id')
+        else:
+            where = users.c.email == email_or_token
+        user = (await conn.execute(
+            select(users.c.id, users.c.confirmed, users.c.password_hash).where(where)
+        )).first()
+        if user is None or not user.confirmed:
+            raise _Fallback
+        if password != '':
+            if user.password_hash is None:
+                raise _Fallback
+            # hashing is CPU bound; keep it off the event loop, on the
+            # same bounded pool the Flask views use, sized by the app's
+            # settings. An outdated hash is left to the Flask view, which
+            # replaces it.
+            with self.flask_app.app_context():
+                if passwords.needs_rehash(user.password_hash):
+                    raise _Fallback
+                try:
+                    future = passwords.submit_check(user.password_hash, password)
+                except HasherBusy:
+                    raise _Fallback
+            if not await asyncio.wrap_future(future):
+                raise _Fallback
+
+    def composition_json(self, request, row):
+        return {
+            'url': request.url_for('api.get_composition', id=row.id, external=True),
+            'release_type': RELEASE_TYPE_LABELS.get(row.release_type, 'Unknown'),
+            'title': row.title,
+            'description': row.description,
+            'description_html': row.description_html,
+            'timestamp': row.timestamp.isoformat(),
+            'artist_url': request.url_for('api.get_user', id=row.artist_id, external=True),
+        }
+
+    async def get_user(self, conn, request, id):
+        user = (await conn.execute(
+            select(users.c.id, users.c.username, users.c.last_seen,
+                   select(func.count()).select_from(compositions)
+                   .where(compositions.c.artist_id == users.c.id)
+                   .scalar_subquery().label('composition_count'))
+            .where(users.c.id == id)
+        )).first()
+        if user is None:
+            raise _Fallback
+        return {
+            'url': request.url_for('api.get_user', id=user.id),
+            'username': user.username,
+            'last_seen': user.last_seen.isoformat(),
+            'compositions_url': request.url_for(
+                'api.get_user_compositions', id=user.id, external=True),
+            'followed_compositions_url': request.url_for(
+                'api.get_user_timeline', id=user.id, external=True),
+            'composition_count': user.composition_count,
+        }
+
+    async def get_composition(self, conn, request, id):
+        row = (await conn.execute(
+            select(compositions).where(compositions.c.id == id))).first()
+        if row is None:
+            raise _Fallback
+        return self.composition_json(request, row)
+
+    async def _require_user(self, conn, id):
+        if (await conn.execute(select(users.c.id).where(users.c.id == id))).first() is None:
+            raise _Fallback
+
+    async def get_user_compositions(self, conn, request, id):
+        await self._require_user(conn, id)
+        rows = (await conn.execute(
+            select(compositions).where(compositions.c.artist_id == id))).all()
+        return {
+            'compositions': [self.composition_json(request, row) for row in rows],
+            'count': len(rows),
+        }
+
+    async def get_user_timeline(self, conn, request, id):
+        await self._require_user(conn, id)
+        rows = (await conn.execute(
+            select(compositions)
+            .where(compositions.c.artist_id.in_(User.timeline_artist_ids(id))))).all()
+        return {
+            'timeline': [self.composition_json(request, row) for row in rows],
+            'count': len(rows),
+        }
+
+
+def create_asgi_app(config_name=None):
+    return AsyncAPI(create_app(config_name or os.getenv('FLASK_CONFIG') or 'default'))
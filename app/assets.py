@@ -0,0 +1,249 @@
+# app/assets.py
+"""Bundled, fingerprinted static assets.
+
+The stylesheets and scripts every page loads are concatenated into one CSS
+and one JS bundle (see BUNDLES), the CSS minified, and each file written
+under a name carrying a hash of its content, e.g. ``ragtime.3f9c0a1e2b7d.css``.
+A new build gets new names, so ``/assets/`` can tell browsers to keep what
+it serves for a year without asking again (``Cache-Control: immutable``):
+a repeat visit costs no asset requests at all. Templates link bundles with
+``asset_url('ragtime.css')``.
+
+Files referenced from the CSS with ``url()`` (Bootstrap's glyphicon fonts)
+are fingerprinted and copied alongside, and the references rewritten.
+Each file is also written gzipped, and brotli-compressed when brotli is
+installed, and the smallest one the client accepts is sent, so nothing is
+compressed per request. With ``RAGTIME_ASSETS_ACCEL_REDIRECT`` set to an
+internal nginx location aliasing the assets directory, the view only sets
+the headers and nginx sends the file (``USE_X_SENDFILE`` does the same for
+Apache and lighttpd).
+
+``flask build-assets`` (run by ``flask deploy``) builds them; an app also
+builds them when it starts if the sources changed since the last build.
+Files from earlier builds are left in place for pages still linking them.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+
+from flask import abort, current_app, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:  # optional, see requirements/prod.txt
+    brotli = None
+
+# Bundle name -> (source folder, path) for each file, in order. The source
+# folder is 'static' for the app's own or a blueprint's name for its static
+# folder ('bootstrap' is Flask-Bootstrap's copy of Bootstrap and jQuery).
+# static/moment.min.js is the moment.js release Flask-Moment would load from
+# its CDN; templates include Flask-Moment's own script with ``no_js=True``.
+BUNDLES = {
+    'ragtime.css': [('bootstrap', 'css/bootstrap.min.css'),
+                    ('static', 'style.css')],
+    'ragtime.js': [('bootstrap', 'jquery.min.js'),
+                   ('bootstrap', 'js/bootstrap.min.js'),
+                   ('static', 'moment.min.js')],
+}
+
+MANIFEST = 'manifest.json'
+
+# Bump when the output of build() changes for the same sources
+BUILD_VERSION = 1
+
+# Preferred first
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+ONE_YEAR = 365 * 24 * 3600
+
+_CSS_STRING_OR_COMMENT = re.compile(
+    r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/''', re.S)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r' ?([{};,>]) ?')
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+_SOURCE_MAP = re.compile(r'^\s*(?://|/\*)# sourceMappingURL=.*$', re.M)
+
+
+class Assets:
+    """A build's manifest: the fingerprinted name of each bundle, and the
+    encodings written for every file served"""
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.sources = manifest['sources']
+        self.bundles = manifest['bundles']
+        self.files = manifest['files']
+
+
+def assets_dir(app):
+    return app.config['RAGTIME_ASSETS_DIR'] or \
+        os.path.join(app.instance_path, 'assets')
+
+
+def minify_css(css):
+    """Drop comments and the whitespace that doesn't change the meaning.
+    Strings are copied as they are."""
+    out, pos = [], 0
+    for match in _CSS_STRING_OR_COMMENT.finditer(css):
+        out.append(css[pos:match.start()])
+        out.append(match.group(1) or ' ')
+        pos = match.end()
+    out.append(css[pos:])
+    # odd items are strings
+    for i in range(0, len(out), 2):
+        text = _CSS_SPACE.sub(' ', out[i])
+        text = _CSS_PUNCTUATION.sub(r'\1', text).replace(': ', ':')
+        out[i] = text.replace(';}', '}')
+    return ''.join(out).strip()
+
+
+def fingerprint(name, data):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _source_path(app, folder, path):
+    if folder == 'static':
+        return os.path.join(app.static_folder, path)
+    return os.path.join(app.blueprints[folder].static_folder, path)
+
+
+def _sources_key(app):
+    """Changes whenever a bundled file is edited"""
+    key = hashlib.sha1(str(BUILD_VERSION).encode())
+    for name, sources in sorted(BUNDLES.items()):
+        for folder, path in sources:
+            stat = os.stat(_source_path(app, folder, path))
+            key.update(f'{name}|{folder}|{path}|{stat.st_mtime_ns}|{stat.st_size}'.encode())
+    return key.hexdigest()
+
+
+def _write(directory, name, data):
+    # Whole files only: a concurrent build or request never sees a partial one
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + name)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+def _compressed(data):
+    """The precompressed variants of ``data`` worth sending instead"""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: compressed for encoding, compressed in variants.items()
+            if len(compressed) < len(data) * 0.9}
+
+
+def _inline_urls(css, source_dir, emit):
+    """Point the relative ``url()``s of ``css`` at fingerprinted copies"""
+    def replace(match):
+        url = match.group(2)
+        if re.match(r'^(?:[a-z]+:|/|#)', url):
+            return match.group(0)
+        path, *query = re.split(r'(?=[?#])', url, maxsplit=1)
+        filename = os.path.normpath(os.path.join(source_dir, path))
+        if not os.path.isfile(filename):
+            return match.group(0)
+        with open(filename, 'rb') as f:
+            name = emit(os.path.basename(filename), f.read())
+        return f'url({name}{"".join(query)})'
+    return _CSS_URL.sub(replace, css)
+
+
+def build(app, directory=None):
+    """Write every bundle, the files they reference and their compressed
+    variants into ``directory``, then the manifest. Returns Assets."""
+    directory = directory or assets_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+
+    def emit(name, data):
+        hashed = fingerprint(name, data)
+        if hashed not in files:
+            variants = _compressed(data)
+            _write(directory, hashed, data)
+            for encoding, compressed in variants.items():
+                _write(directory, hashed + ENCODINGS[encoding], compressed)
+            files[hashed] = [e for e in ENCODINGS if e in variants]
+        return hashed
+
+    bundles = {}
+    for name, sources in BUNDLES.items():
+        parts = []
+        for folder, path in sources:
+            filename = _source_path(app, folder, path)
+            with open(filename, encoding='utf-8') as f:
+                text = _SOURCE_MAP.sub('', f.read())
+            if name.endswith('.css'):
+                text = minify_css(_inline_urls(text, os.path.dirname(filename), emit))
+            parts.append(text.strip())
+        # the scripts are already minified; ';' keeps each one's last
+        # statement from running into the next one's first
+        joined = '\n'.join(parts) if name.endswith('.css') else ';\n'.join(parts)
+        bundles[name] = emit(name, joined.encode('utf-8'))
+
+    manifest = {'sources': _sources_key(app), 'bundles': bundles, 'files': files}
+    _write(directory, MANIFEST, json.dumps(manifest, indent=2).encode('utf-8'))
+    return Assets(directory, manifest)
+
+
+def load(app):
+    """The current build, building first if there is none or the sources
+    changed since"""
+    directory = assets_dir(app)
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return build(app, directory)
+    if manifest.get('sources') != _sources_key(app):
+        return build(app, directory)
+    return Assets(directory, manifest)
+
+
+def asset_url(name):
+    """URL of the current build of bundle ``name``"""
+    return url_for('assets', filename=current_app.extensions['assets'].bundles[name])
+
+
+def serve_asset(filename):
+    assets = current_app.extensions['assets']
+    encodings = assets.files.get(filename)
+    if encodings is None:
+        abort(404)
+    served, encoding = filename, None
+    for candidate in encodings:
+        if request.accept_encodings[candidate]:
+            served, encoding = filename + ENCODINGS[candidate], candidate
+            break
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    etag = f'{filename}.{encoding}' if encoding else filename
+
+    accel = current_app.config['RAGTIME_ASSETS_ACCEL_REDIRECT']
+    if accel:
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"{accel.rstrip('/')}/{served}"
+        response.set_etag(etag)
+    else:
+        response = send_file(os.path.join(assets.directory, served),
+                             mimetype=mimetype, etag=etag, max_age=ONE_YEAR)
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response.make_conditional(request) if accel else response
+
+
+def init_app(app):
+    # Needs the blueprints of the static folders in BUNDLES registered
+    app.extensions['assets'] = load(app)
+    app.add_url_rule(app.config['RAGTIME_ASSETS_URL_PATH'] + '/<path:filename>',
+                     'assets', serve_asset)
+    app.add_template_global(asset_url)
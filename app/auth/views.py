@@ -3,14 +3,16 @@ from . import auth
 from .forms import RegistrationForm, LoginForm, ChangeEmailForm, ChangePasswordForm
 from .. import db
 from ..models import User
+from ..decorators import rate_limit
 from ..email import send_email   # <- import the email sending function
+from ..avatars import precompute_later
 from sqlalchemy.exc import IntegrityError
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash
 from datetime import datetime
 
 
 @auth.route("/register", methods=["GET", "POST"])
+@rate_limit('5/hour', methods=['POST'])
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -24,6 +26,7 @@ def register():
         db.session.add(user)
         try:
             db.session.commit()
+            precompute_later(user.avatar_hash)
 
             # 🔹 Generar token
             token = user.generate_confirmation_token()
@@ -57,14 +60,16 @@ def register():
     return render_template("auth/register.html", form=form)
 
 @auth.route('/login', methods=['GET', 'POST'])
+@rate_limit('10/minute', methods=['POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         email_entered = form.email.data
         password_entered = form.password.data
         user = User.query.filter_by(email=email_entered).first()
-        if user and check_password_hash(user.password_hash, password_entered):
+        if user and user.verify_password(password_entered):
             login_user(user, remember=form.remember_me.data)
+            db.session.commit()  # keeps a rehashed password, if any
             next_page = request.args.get('next')
             if next_page is None or not next_page.startswith('/'):
                 next_page = url_for('main.home')
@@ -96,7 +101,9 @@ def change_email_request():
     form = ChangeEmailForm()
     if form.validate_on_submit():
         current_user.email = form.new_email.data
+        current_user.avatar_hash = current_user.email_hash()
         db.session.commit()
+        precompute_later(current_user.avatar_hash)
         flash('Your email has been updated!', 'success')
         return redirect(url_for('main.user', username=current_user.username))
     return render_template('auth/change_email.html', form=form)
@@ -131,12 +138,14 @@ def confirm(token):
 
 @auth.before_app_request
 def before_request():
+    # Files don't need the user, and loading it would mark them Vary: Cookie
+    if request.endpoint in ('static', 'assets', 'avatar'):
+        return
     if current_user.is_authenticated:
         current_user.ping()
         if not current_user.confirmed \
                 and request.endpoint \
-                and request.blueprint != 'auth' \
-                and request.endpoint != 'static':
+                and request.blueprint != 'auth':
             return redirect(url_for('auth.unconfirmed'))
 
 
@@ -148,6 +157,7 @@ def unconfirmed():
 
 @auth.route('/resend-confirmation')
 @login_required
+@rate_limit('3/hour', key='user')
 def resend_confirmation():
     if current_user.confirmed:
         flash("Your account is already confirmed.", "info")
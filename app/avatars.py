@@ -0,0 +1,223 @@
+# app/avatars.py
+"""Avatars served by the app from a disk cache.
+
+Pages link ``/avatar/<avatar_hash>/<size>`` (``User.avatar_url``) instead
+of a unicornify.pictures URL, so a feed page no longer has the browser
+fetch every artist's picture from another site at every size. The first
+request for a hash and size fetches it once, or draws an identicon
+locally, and writes it under ``RAGTIME_AVATAR_DIR``; later ones are served
+from there. Only a hash some user has is rendered, so made-up hashes
+can't have the app fetch pictures or fill the disk.
+
+``RAGTIME_AVATAR_SOURCE`` is ``'unicornify'`` to proxy the unicorns, or
+``'identicon'`` to never leave the machine. An identicon is a symmetric
+5x5 pattern in one colour, both taken from the hash, so the same hash
+always gets the same PNG. A unicorn that can't be fetched is replaced by
+the identicon for ``FALLBACK_MAX_AGE`` seconds, and isn't written to the
+cache: the next request tries the fetch again.
+
+Served files are memory-mapped and kept mapped (the most recently used
+``RAGTIME_AVATAR_MMAP_CACHE`` of them), so a hot avatar is copied from the
+page cache, which worker processes share, without opening or reading the
+file again. Evicted maps aren't closed, as a request may still be copying
+out of one; each closes when its last reference goes. The ETag is a hash
+of the content. Registering or changing email precomputes
+``RAGTIME_AVATAR_SIZES`` on a background thread.
+"""
+import colorsys
+import hashlib
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from threading import Thread
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from flask import abort, current_app, request
+
+from . import db
+from .metrics import record_cache
+from .models import User
+
+UNICORNIFY_URL = 'https://unicornify.pictures/avatar'
+
+_HASH = re.compile(r'^[0-9a-f]{32}$')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# The grid's cells plus half a cell of margin on each side
+GRID = 5
+BACKGROUND = (240, 240, 240)
+
+# How long browsers keep an identicon served for a unicorn that couldn't
+# be fetched
+FALLBACK_MAX_AGE = 60
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + \
+        struct.pack('>I', zlib.crc32(kind + data))
+
+
+def identicon(avatar_hash, size):
+    """A ``size`` x ``size`` PNG drawn from the first 15 and last 7 hex
+    digits of ``avatar_hash``"""
+    # Cell (row, col) of the left three columns is filled if its digit is
+    # even; the right two mirror them
+    cells = [[int(avatar_hash[row * 3 + min(col, GRID - 1 - col)], 16) % 2 == 0
+              for col in range(GRID)] for row in range(GRID)]
+    hue = int(avatar_hash[-7:], 16) % 360 / 360
+    colour = tuple(round(c * 255) for c in colorsys.hls_to_rgb(hue, 0.5, 0.55))
+
+    def cell(pixel):
+        # in half cells, less the margin; -1 and GRID are the margin
+        return (pixel * (GRID + 1) * 2 // size - 1) // 2
+
+    # the right half mirrors the left, pixel for pixel
+    half = [cell(x) for x in range((size + 1) // 2)]
+    columns = half + [GRID - 1 - col for col in reversed(half[:size // 2])]
+    rows = []
+    for y in range(size):
+        row = cell(y)
+        filled = cells[row] if 0 <= row < GRID else [False] * GRID
+        # filter type 0, then a palette index per pixel
+        rows.append(b'\x00' + bytes(
+            1 if 0 <= col < GRID and filled[col] else 0 for col in columns))
+    return b''.join([
+        PNG_SIGNATURE,
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 3, 0, 0, 0)),
+        _png_chunk(b'PLTE', bytes(BACKGROUND + colour)),
+        _png_chunk(b'IDAT', zlib.compress(b''.join(rows), 9)),
+        _png_chunk(b'IEND', b''),
+    ])
+
+
+def fetch_unicorn(avatar_hash, size):
+    with urlopen(f'{UNICORNIFY_URL}/{avatar_hash}?s={size}',
+                 timeout=current_app.config['RAGTIME_AVATAR_FETCH_TIMEOUT']) as response:
+        data = response.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError('not a PNG')
+    return data
+
+
+def render(avatar_hash, size):
+    """The PNG to cache for ``avatar_hash``, or None if the unicorn can't
+    be fetched"""
+    if current_app.config['RAGTIME_AVATAR_SOURCE'] == 'unicornify':
+        try:
+            return fetch_unicorn(avatar_hash, size)
+        except (OSError, URLError, ValueError) as e:
+            current_app.logger.warning('Avatar %s fetch failed: %s', avatar_hash, e)
+            return None
+    return identicon(avatar_hash, size)
+
+
+def avatar_dir(app):
+    return app.config['RAGTIME_AVATAR_DIR'] or \
+        os.path.join(app.instance_path, 'avatars')
+
+
+def avatar_path(avatar_hash, size):
+    # Sharded by the first two digits to keep directories small
+    return os.path.join(avatar_dir(current_app), avatar_hash[:2],
+                        f'{avatar_hash}-{size}.png')
+
+
+def ensure(avatar_hash, size):
+    """The path of the cached avatar, rendering it first if it isn't there;
+    None if it couldn't be rendered"""
+    path = avatar_path(avatar_hash, size)
+    if not os.path.exists(path):
+        data = render(avatar_hash, size)
+        if data is None:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Whole files only: a concurrent request never maps a partial one
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return path
+
+
+def precompute(app, avatar_hash):
+    """Render the common sizes of ``avatar_hash`` into the cache"""
+    with app.app_context():
+        for size in app.config['RAGTIME_AVATAR_SIZES']:
+            ensure(avatar_hash, size)
+
+
+def precompute_later(avatar_hash):
+    # Like emails, on a thread of its own: a fetch can take seconds
+    app = current_app._get_current_object()
+    Thread(target=precompute, args=[app, avatar_hash], daemon=True).start()
+
+
+class MappedFiles:
+    """The most recently served files, kept memory-mapped with their ETags"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            entry = self._maps.get(path)
+            record_cache('avatars', entry is not None)
+            if entry is not None:
+                self._maps.move_to_end(path)
+                return entry
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        entry = (mapped, hashlib.sha1(mapped).hexdigest())
+        with self._lock:
+            # Another request may have mapped it meanwhile; ours is dropped
+            entry = self._maps.setdefault(path, entry)
+            self._maps.move_to_end(path)
+            while len(self._maps) > self.capacity:
+                # not closed: a request may be copying out of it
+                self._maps.popitem(last=False)
+        return entry
+
+
+def _png_response(data, etag, max_age):
+    response = current_app.response_class(mimetype='image/png')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if etag in request.if_none_match:
+        response.status_code = 304
+        return response
+    # Copied straight out of a mapping: no open() or read() per request
+    response.set_data(data[:])
+    return response
+
+
+def serve_avatar(avatar_hash, size):
+    if not _HASH.match(avatar_hash) or \
+            size not in current_app.config['RAGTIME_AVATAR_SIZES']:
+        abort(404)
+    path = avatar_path(avatar_hash, size)
+    # Only a user's hash is rendered; one already on disk was
+    if not os.path.exists(path):
+        if not db.session.query(
+                User.query.filter_by(avatar_hash=avatar_hash).exists()).scalar():
+            abort(404)
+        path = ensure(avatar_hash, size)
+        if path is None:
+            data = identicon(avatar_hash, size)
+            return _png_response(data, hashlib.sha1(data).hexdigest(), FALLBACK_MAX_AGE)
+    mapped, etag = current_app.extensions['avatars'].get(path)
+    return _png_response(mapped, etag, current_app.config['RAGTIME_AVATAR_MAX_AGE'])
+
+
+def init_app(app):
+    app.extensions['avatars'] = MappedFiles(app.config['RAGTIME_AVATAR_MMAP_CACHE'])
+    app.add_url_rule('/avatar/<avatar_hash>/<int:size>', 'avatar', serve_avatar)
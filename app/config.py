@@ -1,4 +1,5 @@
 import os
+from .engine import TimedQueuePool
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -21,25 +22,147 @@ class Config:
 
     RAGTIME_FOLLOWERS_PER_PAGE = 5
 
+    # Items written per transaction by the batch API endpoints
+    RAGTIME_BATCH_CHUNK_SIZE = 500
+
+    # Artists with at least this many followers are pulled on read instead
+    # of being pushed into every follower's feed inbox
+    RAGTIME_FEED_FANOUT_THRESHOLD = 10000
+
+    # PRAGMAs run on every new SQLite connection (see app/engine.py)
+    RAGTIME_SQLITE_PRAGMAS = {}
+
+    # --- Read replicas (see app/routing.py) ---
+    # Database URLs that read-only requests may be sent to
+    RAGTIME_REPLICA_URLS = []
+    RAGTIME_REPLICA_BLUEPRINTS = ('main', 'api')
+    # How long a client's reads stay on the primary after it writes
+    RAGTIME_READ_YOUR_WRITES_SECONDS = 5
+
+    # --- Streamed pages (see app/streaming.py) ---
+    RAGTIME_STREAM_TEMPLATES = True
+    # Bytes of rendered HTML held back before sending between flush points
+    RAGTIME_STREAM_BUFFER = 16384
+
+    # --- Request profiling (see app/profiling.py) ---
+    RAGTIME_PROFILER = True
+    RAGTIME_PROFILER_FOOTER = False
+    RAGTIME_SLOW_QUERY_MS = 100
+    RAGTIME_SLOW_QUERY_LOG_SIZE = 200
+
+    # Encode JSON responses with orjson when it's installed (see app/serializers.py)
+    RAGTIME_FAST_JSON = True
+
+    # Prometheus text exposition at /metrics (see app/metrics.py)
+    RAGTIME_METRICS = True
+
+    # --- Password hashing (see app/passwords.py) ---
+    # A werkzeug method string; stored hashes made any other way are
+    # upgraded on the next successful login
+    RAGTIME_PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Hashes run at once (default: one per CPU) and how many more may wait
+    RAGTIME_PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
+    RAGTIME_PASSWORD_HASH_QUEUE = 64
+
+    # Per-client limits declared with @rate_limit (see app/ratelimit.py);
+    # memory:// counts per process, redis://host:6379/0 shares across workers
+    RAGTIME_RATELIMIT = True
+    RAGTIME_RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
+
+    # Compiled template bytecode kept on disk (see app/templating.py);
+    # defaults to <instance folder>/jinja-cache
+    RAGTIME_TEMPLATE_CACHE = True
+    RAGTIME_TEMPLATE_CACHE_DIR = os.environ.get('RAGTIME_TEMPLATE_CACHE_DIR')
+
+    # --- Fingerprinted CSS/JS bundles (see app/assets.py) ---
+    # Built into <instance folder>/assets unless set
+    RAGTIME_ASSETS_DIR = os.environ.get('RAGTIME_ASSETS_DIR')
+    RAGTIME_ASSETS_URL_PATH = '/assets'
+    # An internal nginx location aliasing RAGTIME_ASSETS_DIR, e.g.
+    # '/_assets'; nginx then sends the files instead of the app
+    RAGTIME_ASSETS_ACCEL_REDIRECT = os.environ.get('RAGTIME_ASSETS_ACCEL_REDIRECT')
+
+    # --- Avatars (see app/avatars.py) ---
+    # 'unicornify' proxies unicornify.pictures; 'identicon' draws them locally
+    RAGTIME_AVATAR_SOURCE = os.environ.get('RAGTIME_AVATAR_SOURCE', 'unicornify')
+    # Cached in <instance folder>/avatars unless set
+    RAGTIME_AVATAR_DIR = os.environ.get('RAGTIME_AVATAR_DIR')
+    # The sizes the templates use; the only ones served and precomputed
+    RAGTIME_AVATAR_SIZES = (32, 64, 128)
+    RAGTIME_AVATAR_FETCH_TIMEOUT = 5
+    RAGTIME_AVATAR_MAX_AGE = 86400
+    # Files kept memory-mapped per process
+    RAGTIME_AVATAR_MMAP_CACHE = 1024
+
     @staticmethod
     def init_app(app):
         pass
 
+# --- Engine profiles ---
+# SQLite serving several workers: WAL lets readers run alongside the writer,
+# NORMAL sync is durable enough under WAL, and busy_timeout makes writers
+# queue for the lock instead of failing with "database is locked"
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+
+SQLITE_ENGINE_OPTIONS = {
+    'poolclass': TimedQueuePool,
+    'pool_size': 5,
+    'max_overflow': 10,
+}
+
+# Client/server databases (PostgreSQL, MySQL)
+SERVER_DB_ENGINE_OPTIONS = {
+    'poolclass': TimedQueuePool,
+    'pool_size': int(os.environ.get('DATABASE_POOL_SIZE', 10)),
+    'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW', 20)),
+    'pool_timeout': 30,
+    'pool_pre_ping': True,
+    'pool_recycle': 1800,
+}
+
+
 class DevelopmentConfig(Config):
     DEBUG = True
+    RAGTIME_PROFILER_FOOTER = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_DEV_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        RAGTIME_SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'busy_timeout': 5000}
 
 
 class TestingConfig(Config):
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_TEST_URL') or \
-        'sqlite:///{os.path.join(basedir, "data-test.sqlite")}'
+    SECRET_KEY = 'testing'
+    WTF_CSRF_ENABLED = False
+    RAGTIME_RATELIMIT = False
+    # No network in the tests
+    RAGTIME_AVATAR_SOURCE = 'identicon'
+    # Cheap hashes; the tests make a lot of users
+    RAGTIME_PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    # tests/conftest.py swaps in a shared in-memory database per session
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_TEST_URL') or 'sqlite://'
 
 
 class ProductionConfig(Config):
+    # 64 MiB per hash: RAGTIME_PASSWORD_HASH_WORKERS bounds how many run at once
+    RAGTIME_PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:65536:8:1')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         f'sqlite:///{os.path.join(basedir, "data.sqlite")}'
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = SQLITE_ENGINE_OPTIONS
+        RAGTIME_SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    else:
+        SQLALCHEMY_ENGINE_OPTIONS = SERVER_DB_ENGINE_OPTIONS
+
+    # Comma-separated, e.g. DATABASE_REPLICA_URLS=postgresql://r1/db,postgresql://r2/db
+    RAGTIME_REPLICA_URLS = [url.strip() for url in
+                            os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+                            if url.strip()]
 
 config = {
     'development': DevelopmentConfig,
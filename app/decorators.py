@@ -2,6 +2,7 @@ from functools import wraps
 from flask import abort
 from flask_login import current_user
 from .models import Permission
+from .ratelimit import Limit
 
 def permission_required(permission):
     def decorator(f):
@@ -15,3 +16,25 @@ def permission_required(permission):
 
 def admin_required(f):
     return permission_required(Permission.ADMIN)(f)
+
+def rate_limit(limit, key='ip', methods=None, scope=None):
+    """Limit how often one client may call the view, e.g. ``'10/minute'``.
+
+    ``key`` picks the client: ``'ip'``, ``'user'`` (the logged-in user, else
+    the IP), ``'token'`` (the API credentials) or a callable returning a
+    string. Only ``methods`` count, if given. Views may stack several
+    limits; they're checked before any blueprint hook (see app/ratelimit.py).
+    Goes below ``@route`` and may go above or below ``@login_required``.
+    """
+    def decorator(f):
+        f.rate_limits = getattr(f, 'rate_limits', ()) + (
+            Limit.parse(limit, key=key, methods=methods, scope=scope),)
+        return f
+    return decorator
+
+def use_primary(f):
+    """Run the view against the primary database even on GET, for views
+    that read what they are about to write (see app/routing.py).
+    Goes below ``@route``, like ``@rate_limit``."""
+    f.use_primary = True
+    return f
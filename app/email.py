@@ -1,14 +1,36 @@
 from flask import current_app, render_template
-from flask_mail import Message
-from threading import Thread
-from . import mail
+from threading import Lock, Thread
+
+# Emails handed to a background thread and not yet sent
+_queued = 0
+_queued_lock = Lock()
+
+def queue_depth():
+    return _queued
+
+def _track(delta):
+    global _queued
+    with _queued_lock:
+        _queued += delta
+
+def get_mail(app):
+    """Set up Flask-Mail on first use; it isn't needed to serve pages"""
+    if 'mail' not in app.extensions:
+        from flask_mail import Mail
+        Mail(app)
+    return app.extensions['mail']
 
 def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+    try:
+        with app.app_context():
+            get_mail(app).send(msg)
+    finally:
+        _track(-1)
 
 def send_email(to, subject, template, **kwargs):
+    from flask_mail import Message
     app = current_app._get_current_object()
+    get_mail(app)
     msg = Message(
         subject=current_app.config['RAGTIME_MAIL_SUBJECT_PREFIX'] + subject,
         recipients=[to],
@@ -16,6 +38,7 @@ def send_email(to, subject, template, **kwargs):
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
 
+    _track(1)
     thread = Thread(target=send_async_email, args=[app, msg])
     thread.start()
 
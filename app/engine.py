@@ -0,0 +1,89 @@
+# app/engine.py
+"""Engine tuning: SQLite PRAGMAs on connect and connection pool statistics."""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from . import db
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that records how long checkouts wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.checkout_wait_total += waited
+                if waited > self.checkout_wait_max:
+                    self.checkout_wait_max = waited
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep the counters running
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.checkout_wait_total = self.checkout_wait_total
+        pool.checkout_wait_max = self.checkout_wait_max
+        return pool
+
+
+def sqlite_pragma_hook(pragmas):
+    """Return a ``connect`` listener that applies ``pragmas`` to every new
+    SQLite connection."""
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas.items()]
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    return set_sqlite_pragmas
+
+
+def init_engine(app, engine):
+    pragmas = app.config.get('RAGTIME_SQLITE_PRAGMAS')
+    if pragmas and engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', sqlite_pragma_hook(pragmas))
+    return engine
+
+
+def init_app(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            init_engine(app, engine)
+
+
+def pool_stats():
+    """Occupancy and checkout wait time of each engine's connection pool"""
+    stats = {}
+    engines = dict(db.engines)
+    engines.update(current_app.extensions.get('replicas', {}))
+    for bind_key, engine in engines.items():
+        pool = engine.pool
+        entry = {'pool': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(),
+                         checked_in=pool.checkedin(),
+                         checked_out=pool.checkedout(),
+                         overflow=pool.overflow())
+        if isinstance(pool, TimedQueuePool):
+            entry.update(checkouts=pool.checkouts,
+                         checkout_wait_seconds_total=pool.checkout_wait_total,
+                         checkout_wait_seconds_max=pool.checkout_wait_max)
+        stats[bind_key or 'default'] = entry
+    return stats
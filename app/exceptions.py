@@ -1,3 +1,7 @@
 # app/exceptions.py
 class ValidationError(ValueError):
     pass
+
+
+class HasherBusy(RuntimeError):
+    """The password hasher's queue is full; try again shortly"""
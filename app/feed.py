@@ -0,0 +1,258 @@
+# app/feed.py
+"""Followed-compositions feed.
+
+Compositions by ordinary artists are pushed into their followers' inboxes
+(``feed_items``) when they are published. Artists with at least
+``RAGTIME_FEED_FANOUT_THRESHOLD`` followers are never fanned out; their
+compositions are pulled on read instead. A feed is the lazy k-way merge of
+the inbox, the user's own compositions (users don't follow themselves) and
+one stream per followed high-follower artist.
+"""
+import heapq
+from itertools import islice
+
+from flask import abort, current_app
+from sqlalchemy import func, not_, select
+from sqlalchemy.orm import object_session
+
+from . import db
+from .models import Composition, FeedItem, Follow
+from .pagination import Cursor, NumberedPage, older_than
+from .routing import RoutingSession
+
+DEFAULT_FANOUT_THRESHOLD = 10000
+
+follows = Follow.__table__
+feed_items = FeedItem.__table__
+compositions = Composition.__table__
+
+# session.info key of the compositions inserted by the running flush
+PENDING_FAN_OUT = 'feed_fan_out'
+
+
+def fanout_threshold():
+    return current_app.config.get('RAGTIME_FEED_FANOUT_THRESHOLD',
+                                  DEFAULT_FANOUT_THRESHOLD)
+
+
+# A self-follow from before 5c1e8f3a9d27 isn't a follow: the user's own
+# compositions are read from their own stream (see FollowedFeed.streams)
+others = follows.c.follower_id != follows.c.following_id
+
+
+def follower_count(connection, artist_id):
+    return connection.execute(
+        select(func.count()).select_from(follows)
+        .where(follows.c.following_id == artist_id, others)
+    ).scalar()
+
+
+def backfill(connection, artist_id, follower_id=None):
+    """Copy the artist's compositions into their followers' inboxes.
+
+    Rows that are already there are left alone, so this is safe to repeat.
+    """
+    query = select(
+        follows.c.follower_id,
+        compositions.c.id,
+        compositions.c.artist_id,
+        compositions.c.timestamp
+    ).join(
+        compositions, compositions.c.artist_id == follows.c.following_id
+    ).where(
+        follows.c.following_id == artist_id,
+        others,
+        ~select(feed_items.c.owner_id).where(
+            feed_items.c.owner_id == follows.c.follower_id,
+            feed_items.c.composition_id == compositions.c.id
+        ).exists()
+    )
+    if follower_id is not None:
+        query = query.where(follows.c.follower_id == follower_id)
+    connection.execute(feed_items.insert().from_select(
+        ['owner_id', 'composition_id', 'artist_id', 'timestamp'], query))
+
+
+def rebuild(connection=None, threshold=None):
+    """Rebuild every inbox from scratch, e.g. after changing the threshold."""
+    if connection is None:
+        connection = db.session.connection()
+    if threshold is None:
+        threshold = fanout_threshold()
+    connection.execute(feed_items.delete())
+    ordinary = select(follows.c.following_id).where(others).group_by(
+        follows.c.following_id).having(func.count() < threshold)
+    for artist_id in connection.execute(ordinary).scalars().all():
+        backfill(connection, artist_id)
+
+
+# --- Write path: mapper events keep the inboxes up to date ---
+
+def fan_out(connection, composition_ids):
+    """Push new compositions into their followers' inboxes, skipping
+    artists with at least the threshold of followers."""
+    batch = select(compositions.c.artist_id).where(compositions.c.id.in_(composition_ids))
+    pulled = select(follows.c.following_id).where(
+        follows.c.following_id.in_(batch), others
+    ).group_by(follows.c.following_id).having(func.count() >= fanout_threshold())
+    connection.execute(feed_items.insert().from_select(
+        ['owner_id', 'composition_id', 'artist_id', 'timestamp'],
+        select(
+            follows.c.follower_id,
+            compositions.c.id,
+            compositions.c.artist_id,
+            compositions.c.timestamp
+        ).join(
+            follows, follows.c.following_id == compositions.c.artist_id
+        ).where(
+            compositions.c.id.in_(composition_ids),
+            compositions.c.artist_id.not_in(pulled),
+            others,
+            # a follow made in the same flush may have backfilled them already
+            ~select(feed_items.c.owner_id).where(
+                feed_items.c.owner_id == follows.c.follower_id,
+                feed_items.c.composition_id == compositions.c.id
+            ).exists()
+        )
+    ))
+
+
+def on_composition_inserted(mapper, connection, composition):
+    # Fanned out once per flush (see fan_out_flushed), so a batch of new
+    # compositions costs one statement rather than two per row
+    if composition.artist_id is not None:
+        object_session(composition).info.setdefault(
+            PENDING_FAN_OUT, []).append(composition.id)
+
+
+def fan_out_flushed(session, flush_context):
+    composition_ids = session.info.pop(PENDING_FAN_OUT, None)
+    if composition_ids:
+        fan_out(session.connection(), composition_ids)
+
+
+def discard_fan_out(session, previous_transaction):
+    session.info.pop(PENDING_FAN_OUT, None)
+
+
+def on_follow_inserted(mapper, connection, follow):
+    if follower_count(connection, follow.following_id) >= fanout_threshold():
+        return
+    backfill(connection, follow.following_id, follower_id=follow.follower_id)
+
+
+def on_follow_deleted(mapper, connection, follow):
+    connection.execute(feed_items.delete().where(
+        feed_items.c.owner_id == follow.follower_id,
+        feed_items.c.artist_id == follow.following_id
+    ))
+    # The artist just dropped below the threshold: their old compositions
+    # were never pushed, so the remaining followers need them now.
+    if follower_count(connection, follow.following_id) == fanout_threshold() - 1:
+        backfill(connection, follow.following_id)
+
+
+db.event.listen(Composition, 'after_insert', on_composition_inserted)
+db.event.listen(RoutingSession, 'after_flush', fan_out_flushed)
+db.event.listen(RoutingSession, 'after_soft_rollback', discard_fan_out)
+db.event.listen(Follow, 'after_insert', on_follow_inserted)
+db.event.listen(Follow, 'after_delete', on_follow_deleted)
+
+
+# --- Read path ---
+
+def _newest_first(query, timestamp, id_, chunk_size):
+    """Yield the rows of ``query`` newest first, ``chunk_size`` at a time.
+
+    Each chunk continues from the last row seen (keyset pagination), so a
+    stream only costs queries for the rows the merge actually consumes.
+    """
+    query = query.order_by(timestamp.desc(), id_.desc())
+    last = None
+    while True:
+        chunk = query
+        if last is not None:
+            chunk = chunk.filter(older_than(timestamp, id_, Cursor.of(last)))
+        rows = chunk.limit(chunk_size).all()
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+
+
+def _sort_key(composition):
+    return composition.timestamp, composition.id
+
+
+class FollowedFeed:
+    """The compositions by ``user`` and the artists they follow, newest first"""
+
+    def __init__(self, user, threshold=None):
+        self.user = user
+        self.threshold = fanout_threshold() if threshold is None else threshold
+        self._pulled = None
+
+    @property
+    def pulled_artist_ids(self):
+        """Followed artists with too many followers to fan out"""
+        if self._pulled is None:
+            followed = select(Follow.following_id).where(
+                Follow.follower_id == self.user.id, others)
+            self._pulled = db.session.execute(
+                select(Follow.following_id)
+                .where(Follow.following_id.in_(followed), others)
+                .group_by(Follow.following_id)
+                .having(func.count() >= self.threshold)
+            ).scalars().all()
+        return self._pulled
+
+    def _inbox_query(self):
+        query = Composition.query.join(
+            FeedItem, FeedItem.composition_id == Composition.id
+        ).filter(FeedItem.owner_id == self.user.id,
+                 # pushed through a self-follow; the own stream has them
+                 FeedItem.artist_id != self.user.id)
+        if self.pulled_artist_ids:
+            # Anything pushed before the artist crossed the threshold is
+            # served by their pull stream instead.
+            query = query.filter(not_(
+                FeedItem.artist_id.in_(self.pulled_artist_ids)))
+        return query
+
+    def streams(self, chunk_size):
+        yield _newest_first(self._inbox_query(),
+                            FeedItem.timestamp, FeedItem.composition_id,
+                            chunk_size)
+        for artist_id in [self.user.id, *self.pulled_artist_ids]:
+            yield _newest_first(Composition.query.filter_by(artist_id=artist_id),
+                                Composition.timestamp, Composition.id,
+                                chunk_size)
+
+    def iter(self, chunk_size=50):
+        return heapq.merge(*self.streams(chunk_size), key=_sort_key,
+                           reverse=True)
+
+    def __iter__(self):
+        return self.iter()
+
+    def slice(self, offset, limit):
+        return list(islice(self.iter(chunk_size=offset + limit),
+                           offset, offset + limit))
+
+    def count(self):
+        return self._inbox_query().count() + Composition.query.filter(
+            Composition.artist_id.in_([self.user.id, *self.pulled_artist_ids])
+        ).count()
+
+    def paginate(self, page=None, per_page=None, max_per_page=100,
+                 error_out=True, count=True):
+        """Like ``Query.paginate``, with the page read off the merged streams"""
+        page = max(page or 1, 1)
+        per_page = max(per_page or 20, 1)
+        if max_per_page is not None:
+            per_page = min(per_page, max_per_page)
+        items = self.slice((page - 1) * per_page, per_page)
+        if not items and page != 1 and error_out:
+            abort(404)
+        return NumberedPage(items, page, per_page,
+                            total=self.count() if count else None)
@@ -1,5 +1,6 @@
 from flask import render_template, jsonify, request
 from . import main
+from ..exceptions import HasherBusy
 
 @main.app_errorhandler(403)
 def forbidden(e):
@@ -31,3 +32,23 @@ def internal_server_error(e):
                            error_msg="Sorry, we seem to be experiencing technical difficulties"), 500
 
 
+
+
+@main.app_errorhandler(429)
+def too_many_requests(e):
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': 'too many requests'})
+        response.status_code = 429
+        return response
+    return render_template('error.html', error_title="Too Many Requests",
+                           error_msg="Slow down and try again in a little while"), 429
+
+
+@main.app_errorhandler(HasherBusy)
+def hasher_busy(e):
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': 'service unavailable'})
+    else:
+        response = render_template('error.html', error_title="Service Unavailable",
+                                   error_msg="We're very busy right now, please try again")
+    return response, 503, {'Retry-After': '1'}
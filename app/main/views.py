@@ -1,10 +1,14 @@
-from flask import abort, make_response, session, render_template, redirect, url_for, flash, request, current_app
+from flask import abort, make_response, session, render_template, redirect, url_for, flash, request, current_app, jsonify
 from . import main
 from .forms import NameForm, ZodiacForm, EditProfileForm, AdminLevelEditProfileForm, CompositionForm
 from .. import db
-from ..models import Role, User, Permission, Composition
+from ..models import Role, User, Permission, Composition, Follow
+from ..feed import FollowedFeed
+from ..pagination import Cursor, KeysetPage
+from ..streaming import deferred, stream_page
+from ..engine import pool_stats
 from flask_login import login_required, login_user, current_user
-from ..decorators import admin_required, permission_required
+from ..decorators import admin_required, permission_required, use_primary
 
 def admin_required(f):
     """Decorator that ensures only the admin can access."""
@@ -42,21 +46,23 @@ def home():
     if current_user.is_authenticated:
         show_followed = bool(request.cookies.get('show_followed', ''))
 
-    if show_followed:
-        query = current_user.followed_compositions
-    else:
-        query = Composition.query
+    # Read while the page streams, once the layout is on its way
+    def paginate():
+        if show_followed:
+            query = FollowedFeed(current_user._get_current_object())
+        else:
+            query = Composition.query.order_by(Composition.timestamp.desc())
+        return query.paginate(
+            page=page,
+            per_page=current_app.config.get('RAGTIME_COMPS_PER_PAGE'),
+            error_out=False
+        )
 
-    pagination = Composition.query.order_by(Composition.timestamp.desc()).paginate(
-        page=page,
-        per_page=current_app.config.get('RAGTIME_COMPS_PER_PAGE'),
-        error_out=False
-    )
-    compositions = pagination.items
+    pagination = deferred(paginate)
+    compositions = deferred(lambda: pagination.items)
 
-    return render_template(
+    return stream_page(
         'index.html',
-        form=form,
         compositions=compositions,
         pagination=pagination,
         show_followed=show_followed
@@ -72,19 +78,28 @@ def top_secret():
 @main.route('/user/<username>')
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
-    compositions = Composition.query.filter_by(artist=user).order_by(
-        Composition.timestamp.desc()
-    ).all()
-    return render_template('user.html', user=user, compositions=compositions)
+    # One page at a time, read while the template streams, so a long
+    # catalog costs neither a big response nor a big list in memory
+    before = request.args.get('before', type=Cursor.parse)
+    compositions = deferred(lambda: KeysetPage(
+        Composition.query.filter_by(artist=user),
+        Composition.timestamp, Composition.id,
+        per_page=current_app.config['RAGTIME_COMPS_PER_PAGE'],
+        before=before))
+    return stream_page('user.html', user=user, compositions=compositions)
 
 @main.route('/follow/<username>')
 @login_required
 @permission_required(Permission.FOLLOW)
+@use_primary
 def follow(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
         flash("That is not a valid user.")
         return redirect(url_for('.home'))
+    if user.id == current_user.id:
+        flash("You can't follow yourself.")
+        return redirect(url_for('.user', username=username))
     if current_user.is_following(user):
         flash("Looks like you are already following that user.")
         return redirect(url_for('.user', username=username))
@@ -100,14 +115,14 @@ def followers(username):
         flash("That is not a valid user.")
         return redirect(url_for('.home'))
     page = request.args.get('page', 1, type=int)
-    pagination = user.followers.paginate(
+    pagination = deferred(lambda: user.other_followers().order_by(Follow.timestamp.desc()).paginate(
         page=page,
         per_page=current_app.config['RAGTIME_FOLLOWERS_PER_PAGE'],
-        error_out=False)
+        error_out=False))
     # convert to only follower and timestamp
-    follows = [{'user': item.follower, 'timestamp': item.timestamp}
-               for item in pagination.items]
-    return render_template('followers.html',
+    follows = deferred(lambda: [{'user': item.follower, 'timestamp': item.timestamp}
+                                for item in pagination.items])
+    return stream_page('followers.html',
                            user=user,
                            title="Followers of",
                            endpoint='.followers',
@@ -122,17 +137,17 @@ def following(username):
         return redirect(url_for('.home'))
     
     page = request.args.get('page', 1, type=int)
-    pagination = user.following.paginate(
+    pagination = deferred(lambda: user.other_following().order_by(Follow.timestamp.desc()).paginate(
         page=page,
         per_page=current_app.config.get('RAGTIME_FOLLOWERS_PER_PAGE'),
         error_out=False
-    )
+    ))
     
     # Extrae los usuarios que sigue
-    follows = [{'user': item.following, 'timestamp': item.timestamp}
-               for item in pagination.items]
+    follows = deferred(lambda: [{'user': item.following, 'timestamp': item.timestamp}
+                                for item in pagination.items])
     
-    return render_template('following.html',
+    return stream_page('following.html',
                            user=user,
                            title="Following",
                            endpoint='.following',
@@ -142,6 +157,7 @@ def following(username):
 @main.route('/unfollow/<username>')
 @login_required
 @permission_required(Permission.FOLLOW)
+@use_primary
 def unfollow(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
@@ -335,6 +351,17 @@ def zodiac():
 def for_admins_only():
     return "Welcome, administrator!"
 
+@main.route('/admin/profiler')
+@login_required
+@admin_required
+def profiler_stats():
+    profiler = current_app.extensions.get('profiler')
+    if profiler is None:
+        abort(404)
+    stats = profiler.snapshot()
+    stats['pools'] = pool_stats()
+    return jsonify(stats)
+
 @main.route('/moderate')
 @login_required
 @permission_required(Permission.MODERATE)
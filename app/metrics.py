@@ -0,0 +1,275 @@
+# app/metrics.py
+"""Prometheus-style metrics served at ``/metrics``.
+
+Request counters and latency histograms are written to a per-thread shard,
+so recording a request takes no locks; a scrape merges the shards. When a
+thread exits its shard is folded into a base shard, so servers that start
+a thread per request don't pile up shards. Gauges
+(connection pools, email queue, cache hit ratios) are read at scrape time
+by collector functions.
+"""
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+# Upper bounds (seconds) of the request latency buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class _ShardOwner:
+    """Held only by its thread's local storage, so it's collected when the
+    thread exits, and its finalizer retires the shard"""
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class Metric:
+    def __init__(self, registry, name, kind, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+
+class Counter(Metric):
+    def inc(self, labels=(), amount=1):
+        counters = self.registry._shard().counters
+        key = (self.name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    def __init__(self, *args, buckets=LATENCY_BUCKETS):
+        super().__init__(*args)
+        self.buckets = buckets
+
+    def observe(self, value, labels=()):
+        histograms = self.registry._shard().histograms
+        key = (self.name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            # one slot per bucket, one for +Inf, then the running sum
+            counts = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        # The live threads' shards, and what the finished ones recorded
+        self._shards = set()
+        self._base = _Shard()
+        self._local = threading.local()
+        # Reentrant: a finalizer may run while this thread holds it
+        self._lock = threading.RLock()
+
+    def _shard(self):
+        try:
+            return self._local.owner.shard
+        except AttributeError:
+            shard = _Shard()
+            owner = self._local.owner = _ShardOwner(shard)
+            with self._lock:
+                self._shards.add(shard)
+            weakref.finalize(owner, self._retire, shard)
+            return shard
+
+    def _retire(self, shard):
+        # The thread is gone, so nothing writes to the shard any more
+        with self._lock:
+            self._shards.discard(shard)
+            _merge(self._base, shard)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.metrics.setdefault(
+            name, Counter(self, name, 'counter', documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(
+            name, Histogram(self, name, 'histogram', documentation, labelnames,
+                            buckets=buckets))
+
+    def collector(self, f):
+        """Register ``f``, which returns ``(name, kind, help, samples)``
+        tuples where samples are ``(labels_dict, value)`` pairs."""
+        self.collectors.append(f)
+        return f
+
+    def merged(self):
+        total = _Shard()
+        with self._lock:
+            shards = list(self._shards)
+            _merge(total, self._base)
+        for shard in shards:
+            _merge(total, shard)
+        return total.counters, total.histograms
+
+    def value(self, name, labels=()):
+        counters, _ = self.merged()
+        return counters.get((name, labels), 0)
+
+    def exposition(self):
+        counters, histograms = self.merged()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            if metric.kind == 'counter':
+                for (name, labels), value in sorted(counters.items()):
+                    if name == metric.name:
+                        lines.append(f'{name}{_labels(metric.labelnames, labels)} {value}')
+                continue
+            for (name, labels), counts in sorted(histograms.items()):
+                if name != metric.name:
+                    continue
+                cumulative = 0
+                bounds = [repr(float(b)) for b in metric.buckets] + ['+Inf']
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket'
+                                 f'{_labels(metric.labelnames + ("le",), labels + (bound,))}'
+                                 f' {cumulative}')
+                lines.append(f'{name}_sum{_labels(metric.labelnames, labels)} {counts[-1]}')
+                lines.append(f'{name}_count{_labels(metric.labelnames, labels)} {cumulative}')
+        for collect in self.collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(tuple(labels), tuple(labels.values()))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(into, shard):
+    """Add the counts of ``shard`` to ``into``"""
+    for key, value in list(shard.counters.items()):
+        into.counters[key] = into.counters.get(key, 0) + value
+    for key, counts in list(shard.histograms.items()):
+        total = into.histograms.setdefault(key, [0] * len(counts))
+        for i, value in enumerate(list(counts)):
+            total[i] += value
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+registry = Registry()
+
+requests_total = registry.counter(
+    'ragtime_http_requests_total',
+    'HTTP requests handled, by endpoint and status.',
+    ('blueprint', 'endpoint', 'method', 'status'))
+request_duration = registry.histogram(
+    'ragtime_http_request_duration_seconds',
+    'Time spent handling HTTP requests.',
+    ('blueprint', 'endpoint'))
+cache_requests = registry.counter(
+    'ragtime_cache_requests_total',
+    'Cache lookups, by cache and result (hit or miss).',
+    ('cache', 'result'))
+
+
+def record_cache(cache, hit):
+    """Count a lookup in one of the app's caches"""
+    cache_requests.inc((cache, 'hit' if hit else 'miss'))
+
+
+@registry.collector
+def cache_hit_ratios():
+    counters, _ = registry.merged()
+    lookups = {}
+    for (name, labels), value in counters.items():
+        if name == cache_requests.name:
+            cache, result = labels
+            hits, total = lookups.get(cache, (0, 0))
+            lookups[cache] = (hits + (value if result == 'hit' else 0), total + value)
+    yield ('ragtime_cache_hit_ratio', 'gauge', 'Share of cache lookups that hit.',
+           [({'cache': cache}, hits / total) for cache, (hits, total)
+            in sorted(lookups.items()) if total])
+
+
+@registry.collector
+def pool_metrics():
+    from .engine import pool_stats
+    stats = pool_stats()
+    for field, kind, documentation in (
+            ('size', 'gauge', 'Configured connection pool size.'),
+            ('checked_out', 'gauge', 'Connections currently checked out.'),
+            ('overflow', 'gauge', 'Connections open beyond the pool size.'),
+            ('checkouts', 'counter', 'Connection checkouts.'),
+            ('checkout_wait_seconds_total', 'counter',
+             'Time spent waiting to check out a connection.'),
+            ('checkout_wait_seconds_max', 'gauge',
+             'Longest wait to check out a connection.')):
+        name = f'ragtime_db_pool_{field}'
+        yield (name, kind, documentation,
+               [({'bind': bind}, entry[field]) for bind, entry in stats.items()
+                if field in entry])
+
+
+@registry.collector
+def email_metrics():
+    from .email import queue_depth
+    yield ('ragtime_email_queue_depth', 'gauge',
+           'Emails waiting to be sent by background threads.',
+           [({}, queue_depth())])
+
+
+@registry.collector
+def password_hash_metrics():
+    from .passwords import queue_depth
+    yield ('ragtime_password_hash_queue_depth', 'gauge',
+           'Password hashes running or waiting for a hasher thread.',
+           [({}, queue_depth())])
+
+
+def start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def record_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    blueprint = request.blueprint or ''
+    requests_total.inc((blueprint, endpoint, request.method, str(response.status_code)))
+    request_duration.observe(time.perf_counter() - start, (blueprint, endpoint))
+    return response
+
+
+def metrics_view():
+    return Response(registry.exposition(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    if not app.config.get('RAGTIME_METRICS'):
+        return
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
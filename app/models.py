@@ -1,15 +1,15 @@
 from . import db  # import the db object from __init__.py
 from itsdangerous import URLSafeTimedSerializer as WebSerializer
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin, AnonymousUserMixin
-from . import login_manager
+from . import login_manager, passwords
 from flask import current_app, url_for
 from .exceptions import ValidationError
-import jwt
+from .metrics import record_cache
 import hashlib
 from datetime import datetime, timedelta
-import bleach
 import re
+import threading
+import weakref
 
 class Permission:
     FOLLOW = 1
@@ -18,6 +18,12 @@ class Permission:
     MODERATE = 8
     ADMIN = 16
     
+# Id of the default role, per engine; filled by Role.default_id()
+_default_role_ids = weakref.WeakKeyDictionary()
+
+# Per-thread bleach Cleaner and Linker, see Composition.sanitize()
+_sanitizers = threading.local()
+
 class Role(db.Model):
     __tablename__ = 'roles'
     id = db.Column(db.Integer, primary_key=True)
@@ -63,6 +69,19 @@ class Role(db.Model):
             role.default = (role.name == default_role)
             db.session.add(role)
         db.session.commit()
+        _default_role_ids.pop(db.engine, None)
+
+    @staticmethod
+    def default_id():
+        """Id of the default role, looked up once per database"""
+        role_id = _default_role_ids.get(db.engine)
+        record_cache('default_role', role_id is not None)
+        if role_id is None:
+            role_id = db.session.scalar(
+                db.select(Role.id).filter_by(default=True).limit(1))
+            if role_id is not None:
+                _default_role_ids[db.engine] = role_id
+        return role_id
 
 class Follow(db.Model):
     __tablename__ = 'follows'
@@ -74,6 +93,14 @@ class Follow(db.Model):
                              primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Followers and following pages, newest first (the primary key finds a
+    # user's follows, but not in that order); the first also serves the
+    # follower counts of the feed
+    __table_args__ = (
+        db.Index('ix_follows_following_id_timestamp', 'following_id', 'timestamp'),
+        db.Index('ix_follows_follower_id_timestamp', 'follower_id', 'timestamp'),
+    )
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -81,8 +108,8 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(65), unique=True, nullable=False, index=True)
     role_id = db.Column(db.Integer, db.ForeignKey('roles.id'))
 
-    # New column to store the hashed password
-    password_hash = db.Column(db.String(128))
+    # New column to store the hashed password; scrypt hashes are ~160 chars
+    password_hash = db.Column(db.String(256))
 
     # NEW column, true if user confirmed, false otherwise
     confirmed = db.Column(db.Boolean, default=False)
@@ -93,7 +120,7 @@ class User(UserMixin, db.Model):
     bio = db.Column(db.Text())
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
 
-    avatar_hash = db.Column(db.String(32))
+    avatar_hash = db.Column(db.String(32), index=True)
 
     compositions = db.relationship(
         'Composition',
@@ -116,8 +143,17 @@ class User(UserMixin, db.Model):
         cascade='all, delete-orphan'
     )
 
+    # Follows of and by other users. A self-follow from before
+    # 5c1e8f3a9d27 may still be there; it isn't counted or listed.
+    def other_followers(self):
+        return self.followers.filter(Follow.follower_id != Follow.following_id)
+
+    def other_following(self):
+        return self.following.filter(Follow.follower_id != Follow.following_id)
+
     def follow(self, user):
-        if not self.is_following(user):
+        # by id: the same user may be loaded as a different instance
+        if user.id != self.id and not self.is_following(user):
             f = Follow(follower=self, following=user)
             db.session.add(f)
 
@@ -139,14 +175,19 @@ class User(UserMixin, db.Model):
             follower_id=user.id).first() is not None
 
     def email_hash(self):
-        return hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
+        return User.hash_email(self.email)
+
+    @staticmethod
+    def hash_email(email):
+        return hashlib.md5(email.lower().encode('utf-8')).hexdigest()
     
-    def unicornify(self, size=128):
-        url = 'https://unicornify.pictures/avatar'
-        hash_to_use = self.avatar_hash or self.email_hash()
-        return f'{url}/{hash_to_use}?s={size}'
+    def avatar_url(self, size=128):
+        # Served from the app's own cache (see app/avatars.py)
+        return url_for('avatar', avatar_hash=self.avatar_hash or self.email_hash(),
+                       size=size)
 
     def generate_confirmation_token(self, expiration_sec=3600):
+        import jwt
         # For jwt.encode(), expiration is provided as a time in UTC
         # It is set through the "exp" key in the data to be tokenized
         expiration_time = datetime.utcnow() + timedelta(seconds=expiration_sec)
@@ -156,6 +197,7 @@ class User(UserMixin, db.Model):
         return token
 
     def confirm(self, token):
+        import jwt
         try:
             data = jwt.decode(token, current_app.secret_key, algorithms=["HS512"])
         except jwt.ExpiredSignatureError:
@@ -170,31 +212,40 @@ class User(UserMixin, db.Model):
         db.session.add(self)
         return True
     
-    @staticmethod
-    def insert_default_role():
-        user_role = Role.query.filter_by(name='User').first()
-        if not user_role:
-            user_role = Role(name='User')
-            db.session.add(user_role)
-            db.session.commit()
-        return user_role
-    
-    @staticmethod
-    def add_self_follows():
-        for user in User.query.all():
-            if not user.is_following(user):
-                user.follow(user)
-                db.session.add(user)
-        db.session.commit()
-
     def __init__(self, **kwargs):
+        # Runs no SQL once the default role id is cached: the role is set
+        # by id (``role`` loads after the flush)
         super().__init__(**kwargs)
-        if self.role is None:
-            self.role = self.insert_default_role()
+        if self.role is None and self.role_id is None:
+            self.role_id = Role.default_id()
         if self.email is not None and self.avatar_hash is None:
             self.avatar_hash = self.email_hash()
-        if not self.is_following(self):
-            self.follow(self)
+
+    @staticmethod
+    def create_many(rows):
+        """Insert users given as dicts of column values, plus an optional
+        ``password``, and return their ids (in no particular order).
+
+        Defaults are those of ``User()``, but it's one INSERT, sent in
+        batches of up to a thousand rows, however many users there are, and
+        no mapper events run. The caller commits.
+        """
+        role_id = Role.default_id()
+        values = []
+        for row in rows:
+            row = dict(row)
+            password = row.pop('password', None)
+            if password is not None:
+                row['password_hash'] = passwords.hash_password(password)
+            row.setdefault('role_id', role_id)
+            if row.get('email') is not None:
+                row.setdefault('avatar_hash', User.hash_email(row['email']))
+            values.append(row)
+        if not values:
+            return []
+        return db.session.scalars(
+            db.insert(User).returning(User.id),
+            values).all()
 
     # Prevent direct reading of password
     @property
@@ -202,13 +253,21 @@ class User(UserMixin, db.Model):
         raise AttributeError('password is not a readable attribute')
 
     # When assigning password, store its hash instead of plain text
+    # (on this thread, at most RAGTIME_PASSWORD_HASH_WORKERS at once; see
+    # app/passwords.py)
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
 
-    # Method to verify the password against the stored hash
+    # Method to verify the password against the stored hash. A hash made
+    # with an outdated method is replaced; the caller commits it.
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if self.password_hash is None or \
+                not passwords.check_password(self.password_hash, password):
+            return False
+        if passwords.needs_rehash(self.password_hash):
+            self.password = password
+        return True
     
     def can(self, perm):
         return self.role is not None and self.role.has_permission(perm)
@@ -221,11 +280,21 @@ class User(UserMixin, db.Model):
         db.session.add(self)
         db.session.commit()
 
+    @staticmethod
+    def timeline_artist_ids(user_id):
+        """Ids of the artists whose compositions make up a user's timeline:
+        the user and everyone they follow"""
+        return db.union_all(
+            db.select(db.literal(user_id)),
+            db.select(Follow.following_id).where(Follow.follower_id == user_id))
+
     @property
     def followed_compositions(self):
-        return Composition.query.join(
-            Follow, Follow.following_id == Composition.artist_id
-        ).filter(Follow.follower_id == self.id)
+        # The user's own compositions are no longer reached through a
+        # self-follow; one IN over the union keeps it a single lookup by
+        # artist_id rather than an OR across a join
+        return Composition.query.filter(
+            Composition.artist_id.in_(User.timeline_artist_ids(self.id)))
     
     def generate_auth_token(self, expiration_sec=3600):
         s = WebSerializer(current_app.config['SECRET_KEY'])
@@ -259,6 +328,12 @@ class ReleaseType:
     EXTENDED_PLAY = 2
     ALBUM = 3
 
+RELEASE_TYPE_LABELS = {
+    ReleaseType.SINGLE: "Single",
+    ReleaseType.EXTENDED_PLAY: "EP",
+    ReleaseType.ALBUM: "Album"
+}
+
 class Composition(db.Model):
     __tablename__ = 'compositions'
     id = db.Column(db.Integer, primary_key=True)
@@ -274,31 +349,47 @@ class Composition(db.Model):
     )
     artist_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
+    # An artist's compositions newest first: profiles and the own-work
+    # stream of the followed feed
+    __table_args__ = (
+        db.Index('ix_compositions_artist_id_timestamp', 'artist_id', 'timestamp'),
+    )
+
     @property
     def release_type_label(self):
-        mapping = {
-            1: "Single",
-            2: "EP",
-            3: "Album"
-        }
-        return mapping.get(self.release_type, "Unknown")
+        return RELEASE_TYPE_LABELS.get(self.release_type, "Unknown")
 
 
     def __repr__(self):
         return f"<Composition {self.title}>"
     
-    def generate_slug(self):
-        self.slug = f"{self.id}-" + re.sub(r'[^\w]+', '-', self.title.lower())
+    @staticmethod
+    def make_slug(id, title):
+        return f"{id}-" + re.sub(r'[^\w]+', '-', title.lower())
+
+    def generate_slug(self, commit=True):
+        self.slug = Composition.make_slug(self.id, self.title)
         db.session.add(self)
-        db.session.commit()
-    
+        if commit:
+            db.session.commit()
+
+    @staticmethod
+    def sanitize(value):
+        """Render a description to the HTML stored in description_html"""
+        # Building a Cleaner/Linker parses its settings every time, so each
+        # thread keeps one of each (they aren't safe to share across threads)
+        sanitizers = getattr(_sanitizers, 'pair', None)
+        if sanitizers is None:
+            from bleach.linkifier import Linker
+            from bleach.sanitizer import Cleaner
+            sanitizers = _sanitizers.pair = (
+                Cleaner(tags=['a'], strip=True), Linker())
+        cleaner, linker = sanitizers
+        return linker.linkify(cleaner.clean(value))
+
     @staticmethod
     def on_changed_description(target, value, oldvalue, initiator):
-        allowed_tags = ['a']
-        html = bleach.linkify(bleach.clean(value,
-                                           tags=allowed_tags,
-                                           strip=True))
-        target.description_html = html
+        target.description_html = Composition.sanitize(value)
 
     def to_json(self):
         json_composition = {
@@ -324,6 +415,8 @@ class Composition(db.Model):
             raise ValidationError("Composition must have a title")
         if description is None:
             raise ValidationError("Composition must have a description")
+        if not isinstance(title, str) or not isinstance(description, str):
+            raise ValidationError("Composition title and description must be strings")
         
         return Composition(
             release_type=release_type,
@@ -332,6 +425,23 @@ class Composition(db.Model):
         )
 
 
+class FeedItem(db.Model):
+    """A composition pushed into a follower's inbox when it was published"""
+    __tablename__ = 'feed_items'
+    owner_id = db.Column(db.Integer,
+                         db.ForeignKey('users.id'),
+                         primary_key=True)
+    composition_id = db.Column(db.Integer,
+                               db.ForeignKey('compositions.id'),
+                               primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_feed_items_owner_id_timestamp', 'owner_id', 'timestamp'),
+    )
+
+
 db.event.listen(Composition.description,
                 'set',
                 Composition.on_changed_description)
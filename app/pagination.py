@@ -0,0 +1,124 @@
+# app/pagination.py
+"""Keyset pagination, newest first.
+
+A page starts after the ``(timestamp, id)`` of the last row of the one
+before it, instead of at an OFFSET, so every page is the same short range
+scan of a ``(..., timestamp)`` index however deep it is, and rows published
+meanwhile don't shift the pages being read.
+"""
+import math
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import and_, or_
+
+
+def older_than(timestamp, id_, cursor):
+    """Filter for the rows after ``cursor`` in newest-first order"""
+    return or_(timestamp < cursor.timestamp,
+               and_(timestamp == cursor.timestamp, id_ < cursor.id))
+
+
+class Cursor(NamedTuple):
+    timestamp: datetime
+    id: int
+
+    @classmethod
+    def of(cls, row):
+        return cls(row.timestamp, row.id)
+
+    @classmethod
+    def parse(cls, value):
+        """A Cursor from its ``str()``; ValueError if it isn't one, so it
+        can be the ``type`` of ``request.args.get``"""
+        timestamp, _, id_ = value.rpartition('_')
+        return cls(datetime.fromisoformat(timestamp), int(id_))
+
+    def __str__(self):
+        return f'{self.timestamp.isoformat()}_{self.id}'
+
+
+class KeysetPage:
+    """Up to ``per_page`` rows of ``query`` after ``before``, newest first.
+
+    Rows are fetched when the page is iterated (a streamed template can send
+    what precedes the list first); one extra row is read to tell whether
+    there is another page, whose cursor is then ``next_cursor``.
+    """
+
+    def __init__(self, query, timestamp, id_, per_page, before=None):
+        self.query = query
+        self.timestamp = timestamp
+        self.id = id_
+        self.per_page = per_page
+        self.before = before
+        self.next_cursor = None
+
+    def __iter__(self):
+        query = self.query.order_by(self.timestamp.desc(), self.id.desc())
+        if self.before is not None:
+            query = query.filter(older_than(self.timestamp, self.id, self.before))
+        last = None
+        for count, row in enumerate(query.limit(self.per_page + 1)):
+            if count == self.per_page:
+                self.next_cursor = Cursor.of(last)
+                return
+            last = row
+            yield row
+
+
+class NumberedPage:
+    """Page ``page`` (from 1) of items that don't come from a query, with
+    the attributes of Flask-SQLAlchemy's Pagination that the templates and
+    ``pagination_widget`` use. ``items`` is the page, already sliced;
+    ``total`` may be None when not counted."""
+
+    def __init__(self, items, page, per_page, total=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def pages(self):
+        if not self.total:
+            return 0
+        return math.ceil(self.total / self.per_page)
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def iter_pages(self, *, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        """Page numbers for a widget, with None for each run skipped"""
+        end = self.pages + 1
+        left_end = min(1 + left_edge, end)
+        yield from range(1, left_end)
+        if left_end == end:
+            return
+        mid_start = max(left_end, self.page - left_current)
+        mid_end = min(self.page + right_current + 1, end)
+        if mid_start > left_end:
+            yield None
+        yield from range(mid_start, mid_end)
+        if mid_end == end:
+            return
+        right_start = max(mid_end, end - right_edge)
+        if right_start > mid_end:
+            yield None
+        yield from range(right_start, end)
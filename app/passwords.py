@@ -0,0 +1,159 @@
+# app/passwords.py
+"""Password hashing with tunable cost and a bound on how many run at once.
+
+``RAGTIME_PASSWORD_HASH_METHOD`` is a werkzeug method string, e.g.
+``'scrypt:32768:8:1'`` or ``'pbkdf2:sha256:600000'``. Hashes made with any
+other method still verify, and ``User.verify_password`` replaces them with
+one made the current way once the password is known to be right.
+
+At most ``RAGTIME_PASSWORD_HASH_WORKERS`` hashes run at once and
+``RAGTIME_PASSWORD_HASH_QUEUE`` more may wait; beyond that ``HasherBusy``
+is raised (a 503) rather than letting a login storm queue without bound.
+
+The Flask views hash on their own request thread: handing the hash to
+another thread and blocking until it's done would free nothing. hashlib's
+scrypt and PBKDF2 release the GIL, so a threaded server's other requests
+keep running meanwhile. Only the ASGI app (app/asgi.py), whose event loop
+mustn't block, uses ``submit_check``, which runs the check on one of the
+pool's threads and returns a Future to await.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .exceptions import HasherBusy
+from .metrics import registry
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+hashes_total = registry.counter(
+    'ragtime_password_hashes_total',
+    'Password hashes computed or checked, by operation.',
+    ('operation',))
+hashes_rejected = registry.counter(
+    'ragtime_password_hash_rejected_total',
+    'Password hashes refused because the hasher queue was full.')
+
+
+class HasherPool:
+    """Admits up to ``workers + queue`` hashes and runs ``workers`` of them
+    at a time, whichever thread they run on"""
+
+    def __init__(self, workers, queue):
+        self.workers = workers
+        self.limit = workers + queue
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._running = threading.BoundedSemaphore(workers)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def _track(self, delta):
+        with self._lock:
+            self.pending += delta
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            hashes_rejected.inc()
+            raise HasherBusy('Too many password checks in progress')
+        self._track(1)
+
+    def _done(self, future=None):
+        self._track(-1)
+        self._slots.release()
+
+    def _limited(self, fn, *args):
+        with self._running:
+            return fn(*args)
+
+    def run(self, fn, *args):
+        """``fn(*args)`` on the calling thread, once one of the ``workers``
+        places is free"""
+        self._admit()
+        try:
+            return self._limited(fn, *args)
+        finally:
+            self._done()
+
+    def submit(self, fn, *args):
+        """Start ``fn(*args)`` on a pool thread; a Future for its result"""
+        self._admit()
+        try:
+            with self._lock:
+                if self._executor is None:
+                    # only the ASGI app needs threads of its own
+                    self._executor = ThreadPoolExecutor(
+                        self.workers, thread_name_prefix='hasher')
+            future = self._executor.submit(self._limited, fn, *args)
+        except BaseException:
+            self._done()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def shutdown(self, wait=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def pool():
+    """This process's HasherPool; a forked worker starts its own"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = HasherPool(
+                    _setting('RAGTIME_PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1,
+                    _setting('RAGTIME_PASSWORD_HASH_QUEUE', 64))
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def queue_depth():
+    return _pool.pending if _pool is not None and _pool_pid == os.getpid() else 0
+
+
+def hash_method():
+    return _setting('RAGTIME_PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+
+
+@lru_cache(maxsize=16)
+def _method_prefix(method):
+    # werkzeug spells out defaults ('scrypt' is stored as 'scrypt:32768:8:1')
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def hash_password(password):
+    hashes_total.inc(('hash',))
+    return pool().run(generate_password_hash, password, hash_method())
+
+
+def check_password(pwhash, password):
+    hashes_total.inc(('check',))
+    return pool().run(check_password_hash, pwhash, password)
+
+
+def submit_check(pwhash, password):
+    """``check_password`` on a pool thread, for callers that can't block:
+    a Future for the result"""
+    hashes_total.inc(('check',))
+    return pool().submit(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """Whether ``pwhash`` was made with other than the configured method"""
+    return pwhash.split('$', 1)[0] != _method_prefix(hash_method())
+
@@ -0,0 +1,194 @@
+# app/profiling.py
+"""Per-request profiling: SQL count and time, template render time and
+total handler time.
+
+Timings go out in a ``Server-Timing`` header (and, with
+``RAGTIME_PROFILER_FOOTER``, a footer on HTML pages). Statements slower than
+``RAGTIME_SLOW_QUERY_MS`` go to a rolling slow-query log, and every request
+is added to a per-endpoint latency histogram. Both are served to admins by
+``main.profiler_stats``.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+
+from flask import current_app, g, has_request_context, request
+from flask import before_render_template, template_rendered
+from markupsafe import Markup
+from sqlalchemy import event
+
+from . import db
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is +Inf
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|:\w+")
+_in_lists = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_spaces = re.compile(r'\s+')
+
+
+def normalize(statement):
+    """Strip literals, parameter names and IN-list lengths from a statement
+    so that repeats of the same query group together."""
+    statement = _literals.sub('?', statement)
+    statement = _in_lists.sub('(?, ...)', statement)
+    return _spaces.sub(' ', statement).strip()
+
+
+class Profiler:
+    def __init__(self, slow_query_ms=100, slow_log_size=200):
+        self.slow_query_ms = slow_query_ms
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record_query(self, statement, duration_ms, endpoint):
+        if duration_ms < self.slow_query_ms:
+            return
+        self.slow_queries.append({
+            'statement': normalize(statement),
+            'duration_ms': round(duration_ms, 3),
+            'endpoint': endpoint,
+            'timestamp': datetime.utcnow().isoformat(),
+        })
+
+    def record_request(self, endpoint, profile):
+        bucket = bisect_left(LATENCY_BUCKETS_MS, profile['total_ms'])
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'sql_count': 0, 'sql_ms': 0.0, 'template_ms': 0.0,
+                    'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            stats['requests'] += 1
+            stats['total_ms'] += profile['total_ms']
+            stats['max_ms'] = max(stats['max_ms'], profile['total_ms'])
+            stats['sql_count'] += profile['sql_count']
+            stats['sql_ms'] += profile['sql_ms']
+            stats['template_ms'] += profile['template_ms']
+            stats['buckets'][bucket] += 1
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {name: dict(stats, buckets=list(stats['buckets']))
+                         for name, stats in self.endpoints.items()}
+        for stats in endpoints.values():
+            stats['histogram'] = dict(zip(
+                [f'le_{b}ms' for b in LATENCY_BUCKETS_MS] + ['le_inf'],
+                stats.pop('buckets')))
+            stats['avg_ms'] = stats['total_ms'] / stats['requests']
+            stats['avg_sql_count'] = stats['sql_count'] / stats['requests']
+        return {'endpoints': endpoints,
+                'slow_queries': list(reversed(self.slow_queries))}
+
+
+def _profile():
+    if has_request_context():
+        return g.get('profile')
+    return None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration_ms = (time.perf_counter() - conn.info['query_start_time'].pop()) * 1000
+    profile = _profile()
+    if profile is None:
+        return
+    profile['sql_count'] += 1
+    profile['sql_ms'] += duration_ms
+    current_app.extensions['profiler'].record_query(
+        statement, duration_ms, request.endpoint)
+
+
+def _template_started(app, template, context, **extra):
+    profile = _profile()
+    if profile is not None:
+        profile['template_started'].append(time.perf_counter())
+
+
+def _template_finished(app, template, context, **extra):
+    profile = _profile()
+    if profile is not None and profile['template_started']:
+        started = profile['template_started'].pop()
+        profile['template_ms'] += (time.perf_counter() - started) * 1000
+
+
+def new_profile():
+    return {'start': time.perf_counter(), 'sql_count': 0, 'sql_ms': 0.0,
+            'template_ms': 0.0, 'template_started': []}
+
+
+def server_timing(profile):
+    """The ``Server-Timing`` header for ``profile``"""
+    return ', '.join([
+        f'db;dur={profile["sql_ms"]:.1f};desc="{profile["sql_count"]} queries"',
+        f'tpl;dur={profile["template_ms"]:.1f}',
+        f'app;dur={profile["total_ms"]:.1f}',
+    ])
+
+
+def start_profile():
+    g.profile = new_profile()
+
+
+def finish_profile(response):
+    profile = g.get('profile')
+    if profile is None:
+        return response
+    profile['total_ms'] = (time.perf_counter() - profile['start']) * 1000
+    profiler = current_app.extensions['profiler']
+    endpoint = request.endpoint or 'unmatched'
+    if response.is_streamed:
+        # The body, and the queries it runs, come after the headers: the
+        # header covers what ran before it, the stats the whole request
+        def record():
+            profile['total_ms'] = (time.perf_counter() - profile['start']) * 1000
+            profiler.record_request(endpoint, profile)
+        response.call_on_close(record)
+    else:
+        profiler.record_request(endpoint, profile)
+
+    response.headers['Server-Timing'] = server_timing(profile)
+    if current_app.config['RAGTIME_PROFILER_FOOTER'] and \
+            response.mimetype == 'text/html' and not response.is_streamed:
+        footer = Markup(
+            '<div class="profiler-footer" style="font:12px monospace;padding:4px;">'
+            '{} queries in {:.1f} ms &middot; templates {:.1f} ms &middot; '
+            'total {:.1f} ms</div>'
+        ).format(profile['sql_count'], profile['sql_ms'],
+                 profile['template_ms'], profile['total_ms'])
+        html = response.get_data(as_text=True)
+        response.set_data(html.replace('</body>', str(footer) + '</body>', 1))
+    return response
+
+
+def instrument_engine(engine):
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def init_app(app):
+    if not app.config.get('RAGTIME_PROFILER'):
+        return
+    app.extensions['profiler'] = Profiler(
+        slow_query_ms=app.config['RAGTIME_SLOW_QUERY_MS'],
+        slow_log_size=app.config['RAGTIME_SLOW_QUERY_LOG_SIZE'])
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    engines.extend(app.extensions.get('replicas', {}).values())
+    for engine in engines:
+        instrument_engine(engine)
+
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
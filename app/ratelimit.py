@@ -0,0 +1,289 @@
+# app/ratelimit.py
+"""Per-client rate limiting.
+
+Views declare limits with ``@rate_limit`` (see app/decorators.py); they are
+checked in an app-level ``before_request``, so a limited request is turned
+away before the blueprint's hooks run (the API's password check included).
+
+Limits use GCRA, the token bucket kept as a single timestamp per key: the
+"theoretical arrival time" (TAT) at which the client's bucket would be
+full again. Each hit pushes it forward by ``period / count``; a hit that
+would push it more than ``period`` past now is refused.
+
+The default backend keeps TATs in memory, in lock-sharded dicts, so a check
+is one dict lookup under a lock few other threads contend for. Memory is
+per process: with several workers (``flask serve --workers``) each one
+counts on its own, so point ``RAGTIME_RATELIMIT_STORAGE_URL`` at Redis to
+share the counts (``pip install -r requirements/redis.txt``).
+
+Backends also keep expiring marks (``mark``/``marked``), which
+app/routing.py uses to keep API clients on the primary after they write.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from flask import abort, current_app, g, request
+from flask_login import current_user
+
+from .metrics import registry
+
+try:
+    import redis
+except ImportError:  # optional, see requirements/redis.txt
+    redis = None
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$')
+
+rate_limited = registry.counter(
+    'ragtime_rate_limited_total',
+    'Requests refused by a rate limit, by endpoint.',
+    ('endpoint',))
+
+
+def client_ip():
+    # behind a proxy, wrap the app in werkzeug's ProxyFix so this is the client
+    return request.remote_addr or 'unknown'
+
+
+def user_key():
+    """The logged-in user's id, or the client IP for anonymous requests"""
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    return f'ip:{client_ip()}'
+
+
+def token_key():
+    """The credentials sent to the API (email or token), hashed"""
+    auth = request.authorization
+    credential = auth and (auth.username or auth.token)
+    if not credential:
+        return f'ip:{client_ip()}'
+    return 'token:' + hashlib.sha1(credential.encode('utf-8')).hexdigest()
+
+
+KEY_FUNCTIONS = {
+    'ip': lambda: f'ip:{client_ip()}',
+    'user': user_key,
+    'token': token_key,
+}
+
+
+class Limit:
+    """``count`` requests per ``period`` seconds, for one client key"""
+
+    __slots__ = ('count', 'period', 'interval', 'key', 'methods', 'scope')
+
+    def __init__(self, count, period, key='ip', methods=None, scope=None):
+        if count < 1 or period <= 0:
+            raise ValueError('A rate limit needs a positive count and period')
+        self.count = count
+        self.period = period
+        self.interval = period / count
+        self.key = KEY_FUNCTIONS[key] if isinstance(key, str) else key
+        self.methods = frozenset(m.upper() for m in methods) if methods else None
+        self.scope = scope
+
+    @classmethod
+    def parse(cls, value, **kwargs):
+        """A Limit from ``'10/minute'``, ``'100 per hour'`` or ``'5/10 seconds'``"""
+        match = _LIMIT_RE.match(value)
+        if match is None:
+            raise ValueError(f'Invalid rate limit: {value!r}')
+        count, multiple, unit = match.groups()
+        return cls(int(count), int(multiple or 1) * PERIODS[unit], **kwargs)
+
+    def applies(self):
+        return self.methods is None or request.method in self.methods
+
+    def __repr__(self):
+        return f'<Limit {self.count}/{self.period}s>'
+
+
+class RateLimitResult:
+    __slots__ = ('limit', 'allowed', 'remaining', 'reset', 'retry_after')
+
+    def __init__(self, limit, allowed, tat, now):
+        self.limit = limit
+        self.allowed = allowed
+        # seconds until the bucket is full again
+        self.reset = max(0.0, tat - now)
+        if allowed:
+            self.remaining = int((limit.period - self.reset) // limit.interval)
+            self.retry_after = 0.0
+        else:
+            self.remaining = 0
+            self.retry_after = tat + limit.interval - limit.period - now
+
+    def headers(self):
+        headers = {
+            'RateLimit-Limit': str(self.limit.count),
+            'RateLimit-Remaining': str(self.remaining),
+            'RateLimit-Reset': str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(math.ceil(self.retry_after))
+        return headers
+
+
+class MemoryBackend:
+    """TATs in per-process dicts, sharded by key to keep locks uncontended.
+
+    Keys whose TAT has passed hold no more than a missing key would, so a
+    shard drops them whenever it has doubled in size since its last sweep.
+    """
+
+    def __init__(self, shards=64, clock=time.monotonic):
+        self.clock = clock
+        self._shards = [({}, threading.Lock(), [1024]) for _ in range(shards)]
+
+    def hit(self, key, interval, period):
+        """Spend one request from ``key``'s bucket: ``(allowed, tat, now)``"""
+        tats, lock, sweep_at = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            now = self.clock()
+            tat = max(tats.get(key, now), now)
+            new_tat = tat + interval
+            if new_tat - period > now:
+                return False, tat, now
+            tats[key] = new_tat
+            if len(tats) > sweep_at[0]:
+                for stale in [k for k, t in tats.items() if t <= now]:
+                    del tats[stale]
+                sweep_at[0] = max(1024, 2 * len(tats))
+            return True, new_tat, now
+
+    def mark(self, key, seconds):
+        """Set ``key`` for the next ``seconds``"""
+        # kept as the time it runs out, which the sweep treats as a TAT
+        tats, lock, _ = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            until = self.clock() + seconds
+            tats[key] = max(tats.get(key, until), until)
+
+    def marked(self, key):
+        tats, lock, _ = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            return tats.get(key, 0) > self.clock()
+
+    def __len__(self):
+        return sum(len(tats) for tats, _, _ in self._shards)
+
+    def clear(self):
+        for tats, lock, _ in self._shards:
+            with lock:
+                tats.clear()
+
+
+class RedisBackend:
+    """TATs in Redis, shared by every worker; one round trip per check.
+
+    The script reads the clock from Redis so that workers on different
+    hosts agree on it. Times are in microseconds.
+    """
+
+    SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+local interval, period = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local new_tat = tat + interval
+if new_tat - period > now then
+  return {0, tat, now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil((new_tat - now) / 1000))
+return {1, new_tat, now}
+"""
+
+    def __init__(self, client, prefix='ragtime:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    @classmethod
+    def from_url(cls, url):
+        if redis is None:
+            raise RuntimeError('The redis package is needed for a redis:// '
+                               'RAGTIME_RATELIMIT_STORAGE_URL')
+        return cls(redis.Redis.from_url(url))
+
+    def hit(self, key, interval, period):
+        allowed, tat, now = self._script(
+            keys=[self.prefix + key],
+            args=[int(interval * 1e6), int(period * 1e6)])
+        return bool(allowed), tat / 1e6, now / 1e6
+
+    def mark(self, key, seconds):
+        self.client.set(self.prefix + key, 1, px=math.ceil(seconds * 1000))
+
+    def marked(self, key):
+        return bool(self.client.exists(self.prefix + key))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+BACKENDS = {
+    'memory': lambda url: MemoryBackend(),
+    'redis': RedisBackend.from_url,
+    'rediss': RedisBackend.from_url,
+}
+
+
+def backend_from_url(url):
+    scheme = urlsplit(url).scheme
+    try:
+        return BACKENDS[scheme](url)
+    except KeyError:
+        raise ValueError(f'Unknown rate limit storage: {url!r}') from None
+
+
+class Limiter:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def hit(self, limit, key):
+        allowed, tat, now = self.backend.hit(key, limit.interval, limit.period)
+        return RateLimitResult(limit, allowed, tat, now)
+
+
+def check_limits():
+    view = current_app.view_functions.get(request.endpoint)
+    limits = getattr(view, 'rate_limits', None)
+    if not limits:
+        return
+    limiter = current_app.extensions['ratelimit']
+    tightest = None
+    for limit in limits:
+        if not limit.applies():
+            continue
+        result = limiter.hit(limit, f'{limit.scope or request.endpoint}:{limit.key()}')
+        if not result.allowed:
+            g.rate_limit = result
+            rate_limited.inc((request.endpoint,))
+            abort(429)
+        if tightest is None or result.remaining < tightest.remaining:
+            tightest = result
+    g.rate_limit = tightest
+
+
+def add_headers(response):
+    result = g.get('rate_limit')
+    if result is not None:
+        response.headers.update(result.headers())
+    return response
+
+
+def init_app(app):
+    if not app.config.get('RAGTIME_RATELIMIT'):
+        return
+    app.extensions['ratelimit'] = Limiter(
+        backend_from_url(app.config['RAGTIME_RATELIMIT_STORAGE_URL']))
+    app.before_request(check_limits)
+    app.after_request(add_headers)
@@ -0,0 +1,115 @@
+# app/routing.py
+"""Read-replica routing for ``db.session``.
+
+Safe (GET/HEAD) requests to the blueprints in ``RAGTIME_REPLICA_BLUEPRINTS``
+read from one of the ``RAGTIME_REPLICA_URLS``; everything else, views marked
+``@use_primary`` (GETs that check state before writing it, like follow),
+and every flush, use the primary. Once a request writes, the rest of it stays on the
+primary, and so do the client's requests for the next
+``RAGTIME_READ_YOUR_WRITES_SECONDS`` so they see their own changes.
+
+A browser is recognised by its session cookie. API clients send no
+cookies back, so requests with credentials (Basic or token auth) are
+recognised by a hash of them instead, kept in the rate limiter's storage
+(``RAGTIME_RATELIMIT_STORAGE_URL``; Redis shares it between workers).
+"""
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, inspect
+
+from .ratelimit import backend_from_url, token_key
+
+STICKY_KEY = '_primary_until'
+
+# Columns touched by per-request bookkeeping (User.ping) rather than by the
+# user; writing them doesn't pin the client to the primary
+BOOKKEEPING_COLUMNS = {'last_seen'}
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica when the request allows it"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and \
+                has_request_context() and g.get('db_replica'):
+            return current_app.extensions['replicas'][g.db_replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_bookkeeping(obj):
+    state = inspect(obj)
+    changed = {attr.key for attr in state.attrs if attr.history.has_changes()}
+    return changed <= BOOKKEEPING_COLUMNS
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _pin_to_primary(db_session, flush_context, instances):
+    if not has_request_context():
+        return
+    if db_session.new or db_session.deleted or \
+            not all(_is_bookkeeping(obj) for obj in db_session.dirty):
+        g.db_replica = None
+        g.db_wrote = True
+
+
+def credentials_key():
+    """The storage key of the request's API credentials, if it has any"""
+    auth = request.authorization
+    if auth and (auth.username or auth.token):
+        return 'primary:' + token_key()
+    return None
+
+
+def choose_replica():
+    """The replica for this request, or None for the primary"""
+    replicas = current_app.extensions.get('replicas')
+    if not replicas:
+        return None
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if request.blueprint not in current_app.config['RAGTIME_REPLICA_BLUEPRINTS']:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'use_primary', False):
+        return None
+    if session.get(STICKY_KEY, 0) > time.time():
+        return None
+    key = credentials_key()
+    if key and current_app.extensions['read_your_writes'].marked(key):
+        return None
+    return random.choice(list(replicas))
+
+
+def stick_to_primary(response):
+    if g.get('db_wrote') and response.status_code < 400:
+        seconds = current_app.config['RAGTIME_READ_YOUR_WRITES_SECONDS']
+        key = credentials_key()
+        if key:
+            current_app.extensions['read_your_writes'].mark(key, seconds)
+        else:
+            session[STICKY_KEY] = time.time() + seconds
+    return response
+
+
+def init_app(app):
+    urls = app.config.get('RAGTIME_REPLICA_URLS')
+    if not urls:
+        return
+
+    from . import engine
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    app.extensions['replicas'] = replicas = {}
+    app.extensions['read_your_writes'] = backend_from_url(
+        app.config['RAGTIME_RATELIMIT_STORAGE_URL'])
+    for i, url in enumerate(urls):
+        replicas[f'replica{i}'] = engine.init_engine(
+            app, create_engine(url, **options))
+
+    @app.before_request
+    def route_reads():
+        g.db_replica = choose_replica()
+
+    app.after_request(stick_to_primary)
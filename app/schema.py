@@ -0,0 +1,48 @@
+# app/schema.py
+"""Bringing a database's schema up to date (``flask deploy``).
+
+Before the migrations ran on deploy, ``create_app()`` built the tables
+with ``db.create_all()`` and nothing stamped them, so an existing install
+has the app's tables and no ``alembic_version``. Its schema is the one
+revision ``BASELINE_REVISION`` describes: it is stamped with that and
+upgraded like any other, so the data migrations after it run too. Only
+an empty database is built from the models and stamped as up to date.
+
+A later ``create_all()`` may have made ``feed_items`` already, empty, and
+3d7a9e2b6c14 then has nothing to create or backfill; ``fill_feeds``
+rebuilds the inboxes of such a database.
+"""
+from flask_migrate import stamp, upgrade
+
+from . import db, feed
+from .models import Composition, FeedItem
+
+# The schema create_all() made before this series
+BASELINE_REVISION = 'b01334907d82'
+
+
+def upgrade_schema():
+    """Create or migrate the schema; returns what was done, for the log"""
+    inspector = db.inspect(db.engine)
+    if inspector.has_table('alembic_version'):
+        upgrade()
+        return 'upgraded'
+    if inspector.has_table('users'):
+        stamp(revision=BASELINE_REVISION)
+        upgrade()
+        return f'upgraded from {BASELINE_REVISION}'
+    # empty database: build it from the models and mark it up to date
+    db.create_all()
+    stamp()
+    return 'created'
+
+
+def fill_feeds():
+    """Rebuild the inboxes if there are none but there are compositions;
+    True if it did"""
+    if db.session.query(FeedItem.query.exists()).scalar() or \
+            not db.session.query(Composition.query.exists()).scalar():
+        return False
+    feed.rebuild()
+    db.session.commit()
+    return True
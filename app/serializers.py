@@ -0,0 +1,211 @@
+# app/serializers.py
+"""Fast JSON serialization for the API.
+
+Serializers build the same dicts as ``Composition.to_json`` and
+``User.to_json``, but from plain column rows rather than ORM objects, and
+without calling ``url_for`` per item: each URL is built once per
+host/endpoint as a template with the id left out, and ids are formatted
+into it. ``OrjsonProvider`` swaps Flask's JSON encoder for orjson when it's
+installed and ``RAGTIME_FAST_JSON`` is on.
+"""
+from flask import current_app, has_request_context, request, url_for
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import func, select
+
+from . import db
+from .exceptions import ValidationError
+from .metrics import record_cache
+from .models import RELEASE_TYPE_LABELS, Composition, User
+
+try:
+    import orjson
+except ImportError:  # optional, see requirements/prod.txt
+    orjson = None
+
+# Stands in for the id while building a URL template; never a real id
+_ID_SENTINEL = 918273645546372819
+
+# Hosts seen before the template cache is cleared; the Host header comes
+# from the client, so the cache must not grow without bound
+URL_TEMPLATE_CACHE_SIZE = 256
+
+compositions = Composition.__table__
+users = User.__table__
+
+
+class UrlTemplate:
+    """``url_for(endpoint, id=...)`` split around the id"""
+
+    __slots__ = ('prefix', 'suffix')
+
+    def __init__(self, endpoint, external=False):
+        url = url_for(endpoint, id=_ID_SENTINEL, _external=external)
+        self.prefix, _, self.suffix = url.partition(str(_ID_SENTINEL))
+
+    def __call__(self, id):
+        return f'{self.prefix}{id}{self.suffix}'
+
+
+def url_template(endpoint, external=False):
+    """The cached UrlTemplate for ``endpoint`` on the current host"""
+    if has_request_context():
+        key = (endpoint, external, request.host, request.scheme, request.root_path)
+    else:
+        key = (endpoint, external)
+    cache = current_app.extensions.setdefault('url_templates', {})
+    template = cache.get(key)
+    record_cache('url_templates', template is not None)
+    if template is None:
+        if len(cache) >= URL_TEMPLATE_CACHE_SIZE:
+            cache.clear()
+        template = cache[key] = UrlTemplate(endpoint, external)
+    return template
+
+
+class CompositionSerializer:
+    """Serializes composition rows as ``Composition.to_json`` does.
+
+    ``fields`` limits the output (and the selected columns) to some of
+    ``FIELDS``; ``include=('artist',)`` embeds a summary of each artist,
+    loaded for the whole list in one query.
+    """
+
+    # Output field -> the columns it's built from
+    FIELDS = {
+        'url': ('id',),
+        'release_type': ('release_type',),
+        'title': ('title',),
+        'description': ('description',),
+        'description_html': ('description_html',),
+        'timestamp': ('timestamp',),
+        'artist_url': ('artist_id',),
+    }
+    INCLUDES = ('artist',)
+
+    def __init__(self, fields=None, include=()):
+        self.fields = tuple(fields or self.FIELDS)
+        self.include = tuple(include)
+        names = []
+        for field in self.fields:
+            names.extend(self.FIELDS[field])
+        if 'artist' in self.include:
+            names.append('artist_id')
+        self.names = tuple(dict.fromkeys(names))
+        self.url = url_template('api.get_composition', external=True)
+        self.artist_url = url_template('api.get_user', external=True)
+
+    @classmethod
+    def from_request(cls):
+        """A serializer for the ``fields`` and ``include`` query arguments"""
+        fields = _split(request.args.get('fields'))
+        unknown = [field for field in fields if field not in cls.FIELDS]
+        if unknown:
+            raise ValidationError(f"Unknown fields: {', '.join(unknown)}")
+        include = _split(request.args.get('include'))
+        unknown = [name for name in include if name not in cls.INCLUDES]
+        if unknown:
+            raise ValidationError(f"Cannot include: {', '.join(unknown)}")
+        return cls(fields, include)
+
+    def select(self):
+        return select(*(compositions.c[name] for name in self.names))
+
+    def _builders(self):
+        index = {name: i for i, name in enumerate(self.names)}
+        url, artist_url = self.url, self.artist_url
+        builders = {
+            'url': lambda row, i=index.get('id'): url(row[i]),
+            'release_type': lambda row, i=index.get('release_type'):
+                RELEASE_TYPE_LABELS.get(row[i], 'Unknown'),
+            'title': lambda row, i=index.get('title'): row[i],
+            'description': lambda row, i=index.get('description'): row[i],
+            'description_html': lambda row, i=index.get('description_html'): row[i],
+            'timestamp': lambda row, i=index.get('timestamp'): row[i].isoformat(),
+            'artist_url': lambda row, i=index.get('artist_id'): artist_url(row[i]),
+        }
+        return [(field, builders[field]) for field in self.fields]
+
+    def __call__(self, row):
+        return self.many([row])[0]
+
+    def many(self, rows):
+        builders = self._builders()
+        items = []
+        if 'artist' not in self.include:
+            for row in rows:
+                items.append({field: build(row) for field, build in builders})
+            return items
+
+        rows = list(rows)
+        artist_id = self.names.index('artist_id')
+        artists = artist_summaries({row[artist_id] for row in rows})
+        for row in rows:
+            item = {field: build(row) for field, build in builders}
+            item['artist'] = artists.get(row[artist_id])
+            items.append(item)
+        return items
+
+
+def _split(value):
+    return [part.strip() for part in value.split(',') if part.strip()] if value else []
+
+
+def artist_summaries(ids):
+    """Summaries of the users with ``ids``, keyed by id, in one query"""
+    if not ids:
+        return {}
+    url = url_template('api.get_user', external=True)
+    rows = db.session.execute(
+        select(users.c.id, users.c.username, users.c.name).where(users.c.id.in_(ids)))
+    return {id: {'url': url(id), 'username': username, 'name': name}
+            for id, username, name in rows}
+
+
+class UserSerializer:
+    """Serializes user rows as ``User.to_json`` does"""
+
+    def __init__(self):
+        self.url = url_template('api.get_user')
+        self.compositions_url = url_template('api.get_user_compositions', external=True)
+        self.timeline_url = url_template('api.get_user_timeline', external=True)
+
+    def select(self):
+        composition_count = select(func.count()).select_from(compositions).where(
+            compositions.c.artist_id == users.c.id).scalar_subquery()
+        return select(users.c.id, users.c.username, users.c.last_seen, composition_count)
+
+    def __call__(self, row):
+        id, username, last_seen, composition_count = row
+        return {
+            'url': self.url(id),
+            'username': username,
+            'last_seen': last_seen.isoformat(),
+            'compositions_url': self.compositions_url(id),
+            'followed_compositions_url': self.timeline_url(id),
+            'composition_count': composition_count,
+        }
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Anything orjson can't encode natively, and dates (which Flask sends as
+    HTTP dates), still go through ``DefaultJSONProvider.default``.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get('default', self.default),
+                            option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def init_app(app):
+    if app.config.get('RAGTIME_FAST_JSON') and orjson is not None:
+        app.json = OrjsonProvider(app)
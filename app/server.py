@@ -0,0 +1,201 @@
+# app/server.py
+"""Preforking WSGI server behind ``flask serve``.
+
+The master process warms the app up (templates compiled, mappers
+configured, URL map built, role cache filled), drops its database
+connections and freezes the GC, then forks the workers. They share the
+warm heap copy-on-write instead of each paying the cold start again.
+
+Each worker is werkzeug's threaded server, a thread per request, so a slow
+request (a streamed page, a password hash) doesn't hold up the others; with
+``threaded=False`` a worker serves one request at a time. A worker that
+dies is replaced at once the first time, then after a delay that doubles
+with each crash in the last ``RESPAWN_WINDOW`` seconds, so a worker that
+crashes on start doesn't fork in a tight loop.
+"""
+import gc
+import os
+import resource
+import signal
+import time
+from collections import deque
+
+import click
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import configure_mappers
+from werkzeug.serving import make_server
+
+from . import db
+from .templating import compile_templates
+
+
+# Crash backoff: the second crash within the window waits RESPAWN_DELAY,
+# each one after that twice as long, up to RESPAWN_DELAY_MAX
+RESPAWN_WINDOW = 60
+RESPAWN_DELAY = 0.5
+RESPAWN_DELAY_MAX = 30
+
+
+def respawn_delay(recent_crashes):
+    """Seconds to wait before replacing a worker, given how many have
+    exited within RESPAWN_WINDOW, this one included"""
+    if recent_crashes <= 1:
+        return 0
+    return min(RESPAWN_DELAY * 2 ** (recent_crashes - 2), RESPAWN_DELAY_MAX)
+
+
+def _engines(app):
+    with app.app_context():
+        engines = list(db.engines.values())
+    engines.extend(app.extensions.get('replicas', {}).values())
+    return engines
+
+
+def warm_up(app):
+    """Do the work a worker would otherwise do on its first requests.
+    Returns the time each step took, in ms."""
+    timings = {}
+
+    start = time.perf_counter()
+    compile_templates(app)
+    timings['templates'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    configure_mappers()
+    timings['mappers'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    app.url_map.update()
+    timings['url_map'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    from .models import Role
+    with app.app_context():
+        try:
+            Role.default_id()
+        except SQLAlchemyError as e:
+            app.logger.warning('Role cache not warmed (run `flask deploy`?): %s', e)
+        db.session.remove()
+    timings['role_cache'] = (time.perf_counter() - start) * 1000
+
+    # Nothing opened here may be shared with the workers
+    for engine in _engines(app):
+        engine.dispose()
+    return timings
+
+
+def memory_usage():
+    """Resident and private (not shared with the master) memory of this
+    process, in KiB. Private is None where /proc/self/smaps_rollup is
+    missing."""
+    rss = private = None
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        rss = int(fields['Rss'].split()[0])
+        private = sum(int(fields[k].split()[0])
+                      for k in ('Private_Clean', 'Private_Dirty'))
+    except (OSError, KeyError, ValueError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'rss_kb': rss, 'private_kb': private}
+
+
+class _FirstRequestReporter:
+    """WSGI middleware that reports how long a worker's first request took
+    and its memory use afterwards, then steps out of the way."""
+
+    def __init__(self, server):
+        self.server = server
+        self.app = server.app
+
+    def __call__(self, environ, start_response):
+        self.server.app = self.app
+        start = time.perf_counter()
+        response = self.app(environ, start_response)
+        elapsed = (time.perf_counter() - start) * 1000
+        memory = memory_usage()
+        click.echo(f'[worker {os.getpid()}] first request {elapsed:.1f} ms, '
+                   f'rss {memory["rss_kb"]} KiB, private {memory["private_kb"]} KiB')
+        return response
+
+
+def _run_worker(app, server, started):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Forget any pool state inherited from the master without closing the
+    # master's sockets (there should be none after warm_up, but be sure)
+    for engine in _engines(app):
+        engine.dispose(close=False)
+    server.app = _FirstRequestReporter(server)
+    memory = memory_usage()
+    click.echo(f'[worker {os.getpid()}] ready {(time.monotonic() - started) * 1000:.1f} ms '
+               f'after start, rss {memory["rss_kb"]} KiB, private {memory["private_kb"]} KiB')
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def serve(app, host='127.0.0.1', port=5000, workers=2, threaded=True):
+    started = time.monotonic()
+    timings = warm_up(app)
+    click.echo('Warm-up: ' + ', '.join(f'{step} {ms:.1f} ms'
+                                        for step, ms in timings.items()))
+
+    server = make_server(host, port, app, threaded=threaded)
+    click.echo(f'Listening on http://{host}:{server.server_port} '
+               f'with {workers} {"threaded " if threaded else ""}workers '
+               f'(master {os.getpid()})')
+
+    # Objects that exist now live for the whole process; keep the collector
+    # from touching (and so copying) their pages in the workers
+    gc.collect()
+    gc.freeze()
+
+    children = set()
+    crashes = deque()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, server, started)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if stopping:
+            continue
+        now = time.monotonic()
+        crashes.append(now)
+        while crashes[0] < now - RESPAWN_WINDOW:
+            crashes.popleft()
+        delay = respawn_delay(len(crashes))
+        click.echo(f'Worker {pid} exited with status {status}, '
+                   f'respawning in {delay:.1f} s')
+        # in slices, so a SIGTERM meanwhile isn't kept waiting
+        while not stopping and time.monotonic() < now + delay:
+            time.sleep(0.1)
+        if not stopping:
+            spawn()
+    server.server_close()
@@ -0,0 +1,116 @@
+# app/streaming.py
+"""Streamed page renders, so the browser gets the <head> and navbar (and
+starts fetching CSS and scripts) while the view's queries still run.
+
+A view returns ``stream_page(template, **context)`` instead of
+``render_template``, and wraps anything slow in ``deferred()`` so it runs
+when the template first uses it rather than before rendering starts.
+Output is sent at the ``stream_flush()`` points in base.html and whenever
+``RAGTIME_STREAM_BUFFER`` bytes are waiting, not once per Jinja fragment.
+
+Flask tears the request's app context down (and Flask-SQLAlchemy removes
+its session) when the view returns, then pushes the contexts again for the
+body. The body's queries run on a new session: ``current_user`` and the
+models passed to the template are added to it, and queries must be built
+inside ``deferred()`` rather than in the view.
+
+The status line, headers and session cookie are sent before the body, so
+whatever writes to the session happens first: flashed messages are popped
+and any form's CSRF token generated before streaming starts. An error
+raised while streaming can't become a 500 any more: it is logged and
+counted in ``ragtime_stream_errors_total``, and the connection is dropped
+so the client sees a broken response rather than a short page.
+With ``RAGTIME_STREAM_TEMPLATES`` off, and whenever
+``RAGTIME_PROFILER_FOOTER`` is on (the footer covers the whole render),
+pages render in one piece as before.
+"""
+from functools import cache
+
+from flask import (current_app, get_flashed_messages, render_template, request,
+                   stream_template, stream_with_context)
+from flask_login import current_user
+from flask_wtf import FlaskForm
+from markupsafe import Markup
+from werkzeug.local import LocalProxy
+
+from . import db
+from .metrics import registry
+
+# Marks a flush point in the output; never reaches the client
+FLUSH = '\x00flush\x00'
+
+stream_errors = registry.counter(
+    'ragtime_stream_errors_total',
+    'Errors raised after a streamed page\'s headers were sent, by endpoint.',
+    ('endpoint',))
+
+
+def deferred(fn):
+    """A proxy for ``fn()``, called the first time the template uses it"""
+    return LocalProxy(cache(fn))
+
+
+def stream_flush():
+    # stream_page() passes one that returns FLUSH
+    return ''
+
+
+def _buffered(chunks, size):
+    buffer, pending = [], 0
+    for chunk in chunks:
+        *flushed, chunk = chunk.split(FLUSH)
+        for part in flushed:
+            buffer.append(part)
+            if pending + len(part):
+                yield ''.join(buffer)
+            buffer, pending = [], 0
+        buffer.append(chunk)
+        pending += len(chunk)
+        if pending >= size:
+            yield ''.join(buffer)
+            buffer, pending = [], 0
+    if pending:
+        yield ''.join(buffer)
+
+
+def streaming():
+    """Whether pages are streamed"""
+    config = current_app.config
+    return config['RAGTIME_STREAM_TEMPLATES'] and not config['RAGTIME_PROFILER_FOOTER']
+
+
+def stream_page(template_name, **context):
+    if not streaming():
+        return render_template(template_name, **context)
+    # Whatever touches the session must do so before the headers go out
+    get_flashed_messages(with_categories=True)
+    # type(), not isinstance(), which would evaluate the deferred values
+    forms = [v for v in context.values() if issubclass(type(v), FlaskForm)]
+    if forms:
+        from flask_wtf.csrf import generate_csrf
+        generate_csrf()
+    # The body runs on a new session (see above)
+    instances = [v for v in context.values() if issubclass(type(v), db.Model)]
+    if current_user.is_authenticated:
+        instances.append(current_user._get_current_object())
+    context['stream_flush'] = lambda: Markup(FLUSH)
+
+    @stream_with_context
+    def generate():
+        for instance in instances:
+            db.session.add(instance)
+        try:
+            yield from stream_template(template_name, **context)
+        except Exception:
+            # too late for an error page; don't let it pass for a whole one
+            current_app.logger.exception('Error streaming %s', request.path)
+            stream_errors.inc((request.endpoint,))
+            raise
+
+    return current_app.response_class(
+        _buffered(generate(), current_app.config['RAGTIME_STREAM_BUFFER']),
+        mimetype='text/html')
+
+
+def init_app(app):
+    app.add_template_global(stream_flush)
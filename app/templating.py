@@ -0,0 +1,57 @@
+# app/templating.py
+"""On-disk Jinja bytecode cache, so a new worker or test app loads compiled
+templates instead of parsing and compiling their source again.
+
+``flask compile-templates`` fills the cache at deploy time.
+"""
+import hashlib
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+from .metrics import record_cache
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """Bytecode cache whose entries are keyed on the template's path and
+    modification time; Jinja still compares the source hash on load, so an
+    edit that keeps the mtime can't serve stale bytecode."""
+
+    def get_cache_key(self, name, filename=None):
+        key = f'{name}|{filename}'
+        if filename is not None:
+            try:
+                key += f'|{os.stat(filename).st_mtime_ns}'
+            except OSError:
+                pass
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        # the bucket is reset if the source changed since it was written
+        record_cache('template_bytecode', bucket.code is not None)
+
+
+def cache_dir(app):
+    return app.config['RAGTIME_TEMPLATE_CACHE_DIR'] or \
+        os.path.join(app.instance_path, 'jinja-cache')
+
+
+def compile_templates(app):
+    """Load every template of ``app`` once, writing any that are missing
+    from the bytecode cache. Returns the template names."""
+    env = app.jinja_env
+    names = env.list_templates(extensions=['html', 'txt'])
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+def init_app(app):
+    # Must run before app.jinja_env is first used, which creates the env
+    if not app.config.get('RAGTIME_TEMPLATE_CACHE'):
+        return
+    directory = cache_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_options = dict(app.jinja_options,
+                             bytecode_cache=TemplateBytecodeCache(directory))
@@ -0,0 +1,232 @@
+# app/transfer.py
+"""Streaming export and import of the main tables (``flask export`` and
+``flask import``).
+
+Each table goes to its own NDJSON or CSV file, optionally gzipped. Export
+reads through a server-side cursor (``yield_per``) and import inserts in
+executemany batches, so memory use doesn't grow with the table. Import
+loads tables parents-first and records its progress in a checkpoint file
+after every committed batch; running it again with the same checkpoint
+picks up where it stopped.
+
+Roles are matched by name: the target's ``flask deploy`` has inserted its
+own, maybe under other ids, so a role already there is kept, a new one
+gets an id from the target, and ``users.role_id`` is rewritten to match.
+"""
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import Boolean, DateTime, Integer, select, text
+
+from . import db
+from .models import Composition, Follow, Role, User
+
+# Parents before children, so foreign keys resolve on import
+TABLES = {
+    'roles': Role.__table__,
+    'users': User.__table__,
+    'follows': Follow.__table__,
+    'compositions': Composition.__table__,
+}
+FORMATS = ('ndjson', 'csv')
+
+# How CSV files spell NULL, as in PostgreSQL's COPY. A text value that
+# starts with a backslash gets another one in front, so one that reads
+# \N survives the trip.
+CSV_NULL = r'\N'
+
+
+def _csv_value(value):
+    if value is None:
+        return CSV_NULL
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str) and value.startswith('\\'):
+        return '\\' + value
+    return value
+
+
+def filename(table, fmt, compress=False):
+    return f'{table}.{fmt}' + ('.gz' if compress else '')
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def export_table(connection, name, path, fmt, batch_size=1000):
+    """Stream one table into ``path``; returns the number of rows"""
+    table = TABLES[name]
+    names = [column.name for column in table.columns]
+    result = connection.execution_options(yield_per=batch_size).execute(
+        select(table).order_by(*table.primary_key.columns))
+    rows = 0
+    with _open(path, 'w') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(names)
+            for row in result:
+                writer.writerow([_csv_value(value) for value in row])
+                rows += 1
+        else:
+            for row in result:
+                f.write(json.dumps(dict(zip(names, row)), default=_json_default))
+                f.write('\n')
+                rows += 1
+    return rows
+
+
+def export_tables(directory, tables=tuple(TABLES), fmt='ndjson', compress=False,
+                  batch_size=1000):
+    """Export ``tables`` into ``directory``. Yields ``(table, rows,
+    seconds)`` as each table finishes."""
+    os.makedirs(directory, exist_ok=True)
+    with db.engine.connect() as connection:
+        for name in TABLES:
+            if name not in tables:
+                continue
+            start = time.perf_counter()
+            path = os.path.join(directory, filename(name, fmt, compress))
+            rows = export_table(connection, name, path, fmt, batch_size)
+            yield name, rows, time.perf_counter() - start
+
+
+def _converters(table):
+    """Per-column functions turning CSV text back into Python values"""
+    converters = {}
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            converters[column.name] = datetime.fromisoformat
+        elif isinstance(column.type, Boolean):
+            converters[column.name] = lambda value: value in ('1', 'true', 'True')
+        elif isinstance(column.type, Integer):
+            converters[column.name] = int
+    return converters
+
+
+def read_rows(table, path):
+    """Yield the rows of an exported file as column dicts"""
+    converters = _converters(table)
+    with _open(path, 'r') as f:
+        if '.csv' in os.path.basename(path):
+            reader = csv.reader(f)
+            names = next(reader)
+            for values in reader:
+                row = {}
+                for name, value in zip(names, values):
+                    if value == CSV_NULL:
+                        row[name] = None
+                    elif value.startswith('\\'):
+                        row[name] = value[1:]
+                    elif name in converters:
+                        row[name] = converters[name](value)
+                    else:
+                        row[name] = value
+                yield row
+        else:
+            dates = [column.name for column in table.columns
+                     if isinstance(column.type, DateTime)]
+            for line in f:
+                row = json.loads(line)
+                for name in dates:
+                    if row.get(name) is not None:
+                        row[name] = datetime.fromisoformat(row[name])
+                yield row
+
+
+def find_file(directory, name):
+    for fmt in FORMATS:
+        for compress in (False, True):
+            path = os.path.join(directory, filename(name, fmt, compress))
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_checkpoint(path, checkpoint):
+    if not path:
+        return
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+
+def reset_sequence(connection, table):
+    # Rows were inserted with explicit ids; move PostgreSQL's sequence past them
+    if connection.dialect.name != 'postgresql' or 'id' not in table.columns:
+        return
+    connection.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+        f"coalesce(max(id), 1)) FROM {table.name}"))
+
+
+def _role_ids(connection, path):
+    """Exported role id -> id of the role with the same name in the target"""
+    roles = TABLES['roles']
+    here = dict(connection.execute(select(roles.c.name, roles.c.id)).all())
+    return {row['id']: here.get(row['name']) for row in read_rows(roles, path)}
+
+
+def import_tables(directory, tables=tuple(TABLES), batch_size=5000, checkpoint_path=None):
+    """Load the exported files in ``directory``. Yields ``(table, rows,
+    seconds)`` as each table finishes; rows counts only this run's
+    inserts."""
+    checkpoint = load_checkpoint(checkpoint_path)
+    for name in TABLES:
+        if name not in tables:
+            continue
+        done = checkpoint.get(name, 0)
+        if done == 'complete':
+            continue
+        path = find_file(directory, name)
+        if path is None:
+            continue
+        table = TABLES[name]
+        start = time.perf_counter()
+        rows = islice(read_rows(table, path), done, None)
+        if name == 'roles':
+            # keep the roles already there; the rest get ids from the target.
+            # Skipped rows aren't counted, so always read from the start.
+            with db.engine.connect() as connection:
+                existing = set(connection.execute(select(table.c.name)).scalars())
+            rows = ({column: value for column, value in row.items() if column != 'id'}
+                    for row in read_rows(table, path) if row['name'] not in existing)
+        elif name == 'users' and (roles_path := find_file(directory, 'roles')):
+            with db.engine.connect() as connection:
+                role_ids = _role_ids(connection, roles_path)
+            rows = (dict(row, role_id=role_ids.get(row['role_id'])) for row in rows)
+        inserted = 0
+        while batch := list(islice(rows, batch_size)):
+            with db.engine.begin() as connection:
+                connection.execute(table.insert(), batch)
+            inserted += len(batch)
+            checkpoint[name] = done + inserted
+            save_checkpoint(checkpoint_path, checkpoint)
+        with db.engine.begin() as connection:
+            reset_sequence(connection, table)
+        checkpoint[name] = 'complete'
+        save_checkpoint(checkpoint_path, checkpoint)
+        yield name, inserted, time.perf_counter() - start
+
@@ -0,0 +1,60 @@
+"""add feed_items, the followers' inboxes
+
+Revision ID: 3d7a9e2b6c14
+Revises: 8b2f4c6d1a93
+Create Date: 2026-10-20 09:12:31.640217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d7a9e2b6c14'
+down_revision = '8b2f4c6d1a93'
+branch_labels = None
+depends_on = None
+
+# Artists with at least this many followers are pulled on read rather than
+# pushed; RAGTIME_FEED_FANOUT_THRESHOLD's default (see app/feed.py)
+FANOUT_THRESHOLD = 10000
+
+
+def upgrade():
+    # Databases built with create_all() and stamped already have it
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'feed_items' in tables:
+        return
+    op.create_table(
+        'feed_items',
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('composition_id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['artist_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['composition_id'], ['compositions.id']),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('owner_id', 'composition_id'),
+    )
+    op.create_index('ix_feed_items_artist_id', 'feed_items', ['artist_id'])
+    op.create_index('ix_feed_items_owner_id_timestamp', 'feed_items',
+                    ['owner_id', 'timestamp'])
+    if {'follows', 'compositions'} <= tables:
+        # Fill the inboxes with what their followers published so far, as
+        # app.feed.rebuild() would with the default threshold
+        op.execute(sa.text(
+            'INSERT INTO feed_items (owner_id, composition_id, artist_id, timestamp) '
+            'SELECT follows.follower_id, compositions.id, compositions.artist_id, '
+            'compositions.timestamp FROM follows JOIN compositions '
+            'ON compositions.artist_id = follows.following_id '
+            'WHERE follows.follower_id != follows.following_id '
+            'AND follows.following_id IN (SELECT following_id FROM follows '
+            'GROUP BY following_id HAVING count(*) < :threshold)'
+        ).bindparams(threshold=FANOUT_THRESHOLD))
+
+
+def downgrade():
+    op.drop_index('ix_feed_items_owner_id_timestamp', table_name='feed_items',
+                  if_exists=True)
+    op.drop_index('ix_feed_items_artist_id', table_name='feed_items', if_exists=True)
+    op.drop_table('feed_items', if_exists=True)
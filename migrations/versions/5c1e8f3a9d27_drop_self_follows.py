@@ -0,0 +1,54 @@
+"""drop self-follows, index compositions by artist
+
+Revision ID: 5c1e8f3a9d27
+Revises: b01334907d82
+Create Date: 2026-10-19 17:40:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e8f3a9d27'
+down_revision = 'b01334907d82'
+branch_labels = None
+depends_on = None
+
+
+def _tables():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade():
+    # Timelines include the user's own compositions without a follow now
+    # (see User.followed_compositions and app/feed.py). Databases built
+    # with create_all() and stamped may have tables this chain never made.
+    tables = _tables()
+    if 'follows' in tables:
+        op.execute('DELETE FROM follows WHERE follower_id = following_id')
+    if 'feed_items' in tables:
+        op.execute('DELETE FROM feed_items WHERE owner_id = artist_id')
+    # the own-compositions half of the union is a range scan of this
+    if 'compositions' in tables and 'ix_compositions_artist_id_timestamp' not in {
+            index['name'] for index in sa.inspect(op.get_bind()).get_indexes('compositions')}:
+        op.create_index('ix_compositions_artist_id_timestamp', 'compositions',
+                        ['artist_id', 'timestamp'])
+
+
+def downgrade():
+    tables = _tables()
+    if 'compositions' in tables:
+        op.drop_index('ix_compositions_artist_id_timestamp', table_name='compositions',
+                      if_exists=True)
+    if 'follows' in tables:
+        op.execute(
+            'INSERT INTO follows (follower_id, following_id, timestamp) '
+            'SELECT id, id, CURRENT_TIMESTAMP FROM users WHERE NOT EXISTS '
+            '(SELECT 1 FROM follows WHERE follower_id = users.id AND following_id = users.id)')
+    if 'feed_items' in tables:
+        op.execute(
+            'INSERT INTO feed_items (owner_id, composition_id, artist_id, timestamp) '
+            'SELECT artist_id, id, artist_id, timestamp FROM compositions WHERE NOT EXISTS '
+            '(SELECT 1 FROM feed_items WHERE owner_id = compositions.artist_id '
+            'AND composition_id = compositions.id)')
@@ -0,0 +1,45 @@
+"""widen users.password_hash for scrypt hashes
+
+Revision ID: 6e4b1c8f2a57
+Revises: 3d7a9e2b6c14
+Create Date: 2026-10-21 10:05:44.182093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e4b1c8f2a57'
+down_revision = '3d7a9e2b6c14'
+branch_labels = None
+depends_on = None
+
+
+def _password_hash_length():
+    inspector = sa.inspect(op.get_bind())
+    if 'users' not in inspector.get_table_names():
+        return None
+    for column in inspector.get_columns('users'):
+        if column['name'] == 'password_hash':
+            return getattr(column['type'], 'length', None)
+    return None
+
+
+def upgrade():
+    # werkzeug's scrypt hashes are ~160 characters. Databases built with
+    # create_all() and stamped already have the wide column.
+    length = _password_hash_length()
+    if length is not None and length < 256:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.alter_column('password_hash', type_=sa.String(256),
+                                  existing_type=sa.String(length))
+
+
+def downgrade():
+    # Hashes longer than 128 characters won't fit again; they must be reset
+    length = _password_hash_length()
+    if length is not None and length > 128:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.alter_column('password_hash', type_=sa.String(128),
+                                  existing_type=sa.String(length))
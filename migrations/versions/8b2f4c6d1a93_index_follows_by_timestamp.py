@@ -0,0 +1,40 @@
+"""index follows by timestamp
+
+Revision ID: 8b2f4c6d1a93
+Revises: 5c1e8f3a9d27
+Create Date: 2026-10-19 18:05:47.203611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2f4c6d1a93'
+down_revision = '5c1e8f3a9d27'
+branch_labels = None
+depends_on = None
+
+# name -> (table, columns); see the __table_args__ in app/models.py
+INDEXES = {
+    'ix_follows_following_id_timestamp': ('follows', ['following_id', 'timestamp']),
+    'ix_follows_follower_id_timestamp': ('follows', ['follower_id', 'timestamp']),
+}
+
+
+def _existing(inspector, table):
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # Databases built with create_all() and stamped already have them
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    for name, (table, columns) in INDEXES.items():
+        if table in tables and name not in _existing(inspector, table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, (table, columns) in INDEXES.items():
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -1,8 +1,13 @@
+import click
+from dotenv import load_dotenv
 from flask_migrate import Migrate
 from app import create_app, db
 from app.models import Role, User, Permission
 import os
 
+# Load environment variables from .env before the config is read
+load_dotenv()
+
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
 migrate = Migrate(app, db, render_as_batch=True)
 
@@ -15,3 +20,79 @@ def make_shell_context():
         Permission=Permission
     )
 
+@app.cli.command()
+def deploy():
+    """Create or migrate the database schema and insert the roles."""
+    from app.schema import fill_feeds, upgrade_schema
+    click.echo(f'Schema {upgrade_schema()}')
+    if fill_feeds():
+        click.echo('Filled the empty feed inboxes')
+    Role.insert_roles()
+    click.get_current_context().invoke(precompile_templates)
+    click.get_current_context().invoke(build_assets)
+
+@app.cli.command('compile-templates')
+def precompile_templates():
+    """Precompile all templates into the Jinja bytecode cache."""
+    from app.templating import cache_dir, compile_templates
+    if not app.config['RAGTIME_TEMPLATE_CACHE']:
+        click.echo('RAGTIME_TEMPLATE_CACHE is off, nothing to do.')
+        return
+    names = compile_templates(app)
+    click.echo(f'Compiled {len(names)} templates into {cache_dir(app)}')
+
+@app.cli.command('build-assets')
+def build_assets():
+    """Bundle, fingerprint and precompress the CSS and JS."""
+    from app.assets import build
+    assets = build(app)
+    app.extensions['assets'] = assets
+    for name, hashed in assets.bundles.items():
+        encodings = ', '.join(assets.files[hashed]) or 'uncompressed'
+        click.echo(f'{name} -> {hashed} ({encodings})')
+    click.echo(f'Wrote {len(assets.files)} files into {assets.directory}')
+
+@app.cli.command()
+@click.option('--host', default='127.0.0.1', help='Interface to bind to.')
+@click.option('--port', default=5000, help='Port to listen on (0 picks a free one).')
+@click.option('--workers', default=os.cpu_count() or 1,
+              help='Number of worker processes to fork.')
+@click.option('--threads/--no-threads', default=True,
+              help='Serve a worker\'s requests on a thread each, or one at a time.')
+def serve(host, port, workers, threads):
+    """Warm the app up once, then serve it from forked worker processes."""
+    from app.server import serve
+    serve(app, host=host, port=port, workers=workers, threaded=threads)
+
+def _report(action, stats):
+    for table, rows, seconds in stats:
+        rate = rows / seconds if seconds else 0
+        click.echo(f'{action} {rows} {table} in {seconds:.2f} s ({rate:.0f} rows/s)')
+
+@app.cli.command('export')
+@click.argument('directory')
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the files.')
+@click.option('--table', 'tables', multiple=True, help='Only these tables.')
+@click.option('--batch-size', default=1000, help='Rows fetched per round trip.')
+def export_data(directory, fmt, compress, tables, batch_size):
+    """Export users, follows and compositions into DIRECTORY."""
+    from app.transfer import TABLES, export_tables
+    _report('Exported', export_tables(directory, tables or tuple(TABLES), fmt,
+                                      compress, batch_size))
+
+@app.cli.command('import')
+@click.argument('directory')
+@click.option('--table', 'tables', multiple=True, help='Only these tables.')
+@click.option('--batch-size', default=5000, help='Rows per INSERT batch and commit.')
+@click.option('--checkpoint', default=None,
+              help='Progress file; rerun with the same one to resume.')
+def import_data(directory, tables, batch_size, checkpoint):
+    """Import files written by `flask export` from DIRECTORY."""
+    from app import feed
+    from app.transfer import TABLES, import_tables
+    _report('Imported', import_tables(directory, tables or tuple(TABLES),
+                                      batch_size, checkpoint))
+    # Core inserts skip the feed listeners; fill the inboxes in one go
+    feed.rebuild()
+    db.session.commit()
@@ -0,0 +1,152 @@
+# tests/benchmarks/bench_asgi.py
+"""Many concurrent slow clients against the API timeline: preforked sync
+workers (``flask serve``) versus the ASGI app under uvicorn.
+
+Each client trickles its request headers in over ``--slow-ms`` before the
+server can answer, the way a client on a bad mobile link does, so a sync
+worker is tied up per client for that long.
+
+    python -m tests.benchmarks.bench_asgi --clients 1000 --workers 8
+"""
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYNC_SERVER = '''
+from app import create_app
+from app.server import serve
+serve(create_app('testing'), port={port}, workers={workers})
+'''
+
+
+def seed(users, compositions):
+    from app import create_app, db
+    from app.models import Composition, Follow, Role, User
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        db.session.execute(User.__table__.insert(), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+             'confirmed': True, 'role_id': Role.default_id()}
+            for i in range(1, users + 1)])
+        db.session.execute(Follow.__table__.insert(), [
+            {'follower_id': 1, 'following_id': i} for i in range(1, users + 1)])
+        db.session.execute(Composition.__table__.insert(), [
+            {'title': f'Rag {i}', 'release_type': 1, 'description': 'A rag',
+             'description_html': 'A rag', 'artist_id': i % users + 1}
+            for i in range(compositions)])
+        db.session.commit()
+        token = db.session.get(User, 1).generate_auth_token()
+        db.engine.dispose()
+    return token
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+async def slow_client(port, request, slow_s, chunks):
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        step = len(request) // chunks + 1
+        for i in range(0, len(request), step):
+            writer.write(request[i:i + step])
+            await writer.drain()
+            await asyncio.sleep(slow_s / chunks)
+        response = await reader.read()
+        writer.close()
+        status = int(response.split(b' ', 2)[1])
+    except (OSError, ValueError, IndexError):
+        status = None
+    return status, time.perf_counter() - start
+
+
+async def drive(port, path, token, clients, slow_ms, chunks):
+    auth = base64.b64encode(f'{token}:'.encode()).decode()
+    request = (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+               f'Authorization: Basic {auth}\r\nConnection: close\r\n\r\n').encode()
+    return await asyncio.gather(*[
+        slow_client(port, request, slow_ms / 1000, chunks) for _ in range(clients)])
+
+
+def run(label, command, env, port, args, token):
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        path = '/api/v1/users/1/timeline/'
+        start = time.perf_counter()
+        results = asyncio.run(drive(port, path, token, args.clients, args.slow_ms, args.chunks))
+        wall = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    ok = sorted(latency * 1000 for status, latency in results if status == 200)
+    failed = len(results) - len(ok)
+    if not ok:
+        print(f'{label:>6}: every request failed')
+        return
+    pct = lambda p: ok[min(len(ok) - 1, int(p / 100 * len(ok)))]
+    print(f'{label:>6}: {len(ok) / wall:8.1f} req/s, wall {wall:6.2f} s, '
+          f'p50 {statistics.median(ok):8.1f} ms, p95 {pct(95):8.1f} ms, '
+          f'p99 {pct(99):8.1f} ms, failed {failed}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--slow-ms', type=int, default=200,
+                        help='time each client takes to send its request')
+    parser.add_argument('--chunks', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='sync worker processes')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--compositions', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, FLASK_CONFIG='testing',
+                   SECRET_KEY=os.environ.get('SECRET_KEY', 'bench'),
+                   DATABASE_TEST_URL=f'sqlite:///{directory}/bench.sqlite',
+                   RAGTIME_TEMPLATE_CACHE_DIR=directory)
+        os.environ.update(env)
+        token = seed(args.users, args.compositions)
+        print(f'{args.clients} clients, {args.slow_ms} ms to send each request')
+
+        port = free_port()
+        run('sync', [sys.executable, '-c',
+                     SYNC_SERVER.format(port=port, workers=args.workers)],
+            env, port, args, token)
+        port = free_port()
+        run('async', [sys.executable, '-m', 'uvicorn', '--factory',
+                      'app.asgi:create_asgi_app', '--port', str(port),
+                      '--log-level', 'warning', '--backlog', '2048'],
+            env, port, args, token)
+
+
+if __name__ == '__main__':
+    main()
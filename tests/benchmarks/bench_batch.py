@@ -0,0 +1,69 @@
+# tests/benchmarks/bench_batch.py
+"""Catalog import through the API: one POST per composition versus
+``/compositions/batch`` (JSON array and NDJSON).
+
+    python -m tests.benchmarks.bench_batch --items 5000
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+os.environ.setdefault('DATABASE_TEST_URL', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from app import create_app, db  # noqa: E402
+from app.models import Composition, Role, User  # noqa: E402
+
+
+def catalog(n, offset=0):
+    return [{'title': f'Rag {offset + i}', 'release_type': 1 + i % 3,
+             'description': f'Track {i}, see www.example.com/{i}'} for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--single', type=int, default=500,
+                        help='items to send one POST at a time (extrapolated)')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        user = User(username='label', email='label@example.com', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        token = user.generate_auth_token()
+        headers = {'Authorization': 'Basic ' + base64.b64encode(f'{token}:'.encode()).decode()}
+        client = app.test_client()
+
+        start = time.perf_counter()
+        for item in catalog(args.single):
+            assert client.post('/api/v1/compositions/', json=item,
+                               headers=headers).status_code == 201
+        single = (time.perf_counter() - start) / args.single
+        print(f'{"single":>8}: {1 / single:9.0f} items/s '
+              f'({single * args.items:.1f} s for {args.items})')
+
+        start = time.perf_counter()
+        response = client.post('/api/v1/compositions/batch',
+                               json=catalog(args.items, 10 ** 6), headers=headers)
+        assert response.get_json()['errors'] == 0
+        elapsed = time.perf_counter() - start
+        print(f'{"array":>8}: {args.items / elapsed:9.0f} items/s ({elapsed:.1f} s)')
+
+        body = '\n'.join(json.dumps(item) for item in catalog(args.items, 2 * 10 ** 6))
+        start = time.perf_counter()
+        response = client.post('/api/v1/compositions/batch', data=body,
+                               content_type='application/x-ndjson', headers=headers)
+        assert response.get_json()['errors'] == 0
+        elapsed = time.perf_counter() - start
+        print(f'{"ndjson":>8}: {args.items / elapsed:9.0f} items/s ({elapsed:.1f} s)')
+        print(f'{Composition.query.count()} compositions in the database')
+
+
+if __name__ == '__main__':
+    main()
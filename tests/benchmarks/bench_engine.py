@@ -0,0 +1,135 @@
+# tests/benchmarks/bench_engine.py
+"""Concurrent read/write load under each engine profile.
+
+Worker threads mimic request traffic: mostly feed reads, plus a
+``User.ping``-style ``last_seen`` write on a share of requests (--write-ratio).
+
+    python -m tests.benchmarks.bench_engine --threads 16 --seconds 5
+    python -m tests.benchmarks.bench_engine --url postgresql://localhost/ragtime_bench
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from app.config import (config, TestingConfig, SQLITE_ENGINE_OPTIONS,
+                        SQLITE_PRODUCTION_PRAGMAS, SERVER_DB_ENGINE_OPTIONS)
+from app.engine import pool_stats
+from app.models import Composition, User
+
+
+def profiles(args):
+    if args.url:
+        return {'server-db': {'SQLALCHEMY_DATABASE_URI': args.url,
+                              'SQLALCHEMY_ENGINE_OPTIONS': SERVER_DB_ENGINE_OPTIONS}}
+    return {
+        'sqlite-default': {},
+        'sqlite-production': {
+            'SQLALCHEMY_ENGINE_OPTIONS': SQLITE_ENGINE_OPTIONS,
+            'RAGTIME_SQLITE_PRAGMAS': SQLITE_PRODUCTION_PRAGMAS,
+        },
+    }
+
+
+def seed(users, compositions):
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@bench.test'}
+        for i in range(1, users + 1)])
+    db.session.execute(Composition.__table__.insert(), [
+        {'title': f'Rag {i}', 'release_type': 1, 'description': '',
+         'artist_id': i % users + 1, 'timestamp': datetime.utcnow()}
+        for i in range(compositions)])
+    db.session.commit()
+
+
+def worker(app, args, index, stop, latencies, errors):
+    user_id = index % args.users + 1
+    write_every = int(1 / args.write_ratio) if args.write_ratio else 0
+    requests = 0
+    with app.app_context():
+        while not stop.is_set():
+            requests += 1
+            start = time.perf_counter()
+            try:
+                db.session.execute(
+                    db.select(Composition)
+                    .order_by(Composition.timestamp.desc()).limit(10)
+                ).all()
+                if write_every and requests % write_every == 0:
+                    db.session.execute(
+                        db.update(User).where(User.id == user_id)
+                        .values(last_seen=datetime.utcnow()))
+                    db.session.commit()
+                else:
+                    db.session.rollback()
+            except OperationalError:
+                db.session.rollback()
+                errors.append(1)
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+        db.session.remove()
+
+
+def run(name, overrides, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = {'SQLALCHEMY_DATABASE_URI':
+                    f'sqlite:///{os.path.join(tmp, "bench.sqlite")}'}
+        settings.update(overrides)
+        config[name] = type(f'{name}-config', (TestingConfig,), settings)
+        app = create_app(name)
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed(args.users, args.compositions)
+
+        stop = threading.Event()
+        latencies, errors = [], []
+        threads = [threading.Thread(target=worker,
+                                    args=(app, args, i, stop, latencies, errors))
+                   for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        with app.app_context():
+            stats = pool_stats()['default']
+            db.engine.dispose()
+        del config[name]
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else float('nan')
+    waits = stats.get('checkouts') and \
+        stats['checkout_wait_seconds_total'] / stats['checkouts'] * 1000
+    print(f'{name:>18} {len(latencies) / args.seconds:>10.0f} '
+          f'{statistics.median(latencies) if latencies else 0:>9.2f} {p95:>9.2f} '
+          f'{len(errors):>7} {stats["pool"]:>15} '
+          f'{waits if waits else 0:>9.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--compositions', type=int, default=5000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--url', help='benchmark a server database instead of SQLite')
+    args = parser.parse_args()
+
+    print(f'{"profile":>18} {"ops/s":>10} {"p50 ms":>9} {"p95 ms":>9} '
+          f'{"errors":>7} {"pool":>15} {"wait ms":>9}')
+    for name, overrides in profiles(args).items():
+        run(name, overrides, args)
+
+
+if __name__ == '__main__':
+    main()
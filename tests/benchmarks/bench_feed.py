@@ -0,0 +1,121 @@
+# tests/benchmarks/bench_feed.py
+"""Followed-feed benchmark across follower distributions.
+
+Compares pure fan-out (push), pure fan-in (pull) and the hybrid engine on
+publish latency, inbox size and first-page read latency.
+
+    python -m tests.benchmarks.bench_feed --users 2000 --compositions 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_TEST_URL', 'sqlite://')
+
+from app import create_app, db  # noqa: E402
+from app.models import Composition, FeedItem, Follow, User  # noqa: E402
+from app import feed  # noqa: E402
+from app.feed import FollowedFeed  # noqa: E402
+
+
+def seed(users, follows_per_user, compositions, distribution, rng):
+    now = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@bench.test'}
+        for i in range(1, users + 1)])
+
+    ids = list(range(1, users + 1))
+    if distribution == 'powerlaw':
+        weights = [1.0 / rank for rank in ids]
+    else:
+        weights = None
+    rows = []
+    for follower in ids:
+        followed = set(rng.choices(ids, weights=weights, k=follows_per_user))
+        followed.discard(follower)
+        rows.extend({'follower_id': follower, 'following_id': f,
+                     'timestamp': now} for f in followed)
+    db.session.execute(Follow.__table__.insert(), rows)
+
+    db.session.execute(Composition.__table__.insert(), [
+        {'title': f'Rag {i}', 'release_type': 1, 'description': '',
+         'artist_id': rng.choices(ids, weights=weights)[0],
+         'timestamp': now - timedelta(minutes=i)}
+        for i in range(compositions)])
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def run(app, strategy, threshold, args, rng):
+    app.config['RAGTIME_FEED_FANOUT_THRESHOLD'] = threshold
+    feed.rebuild(threshold=threshold)
+    db.session.commit()
+    inbox = FeedItem.query.count()
+
+    top_artist = db.session.get(User, 1)
+
+    def publish():
+        db.session.add(Composition(release_type=1, title='New Rag',
+                                   description='', artist=top_artist))
+        db.session.commit()
+
+    readers = rng.sample(range(1, args.users + 1), args.readers)
+
+    def read():
+        for user_id in readers:
+            FollowedFeed(db.session.get(User, user_id)).paginate(
+                page=1, per_page=app.config['RAGTIME_COMPS_PER_PAGE'],
+                error_out=False, count=False)
+
+    publish_med, publish_max = timed(publish, args.repeat)
+    read_med, read_max = timed(read, args.repeat)
+    print(f'{strategy:>8} {threshold:>10} {inbox:>10} '
+          f'{publish_med:>10.2f} {publish_max:>10.2f} '
+          f'{read_med / len(readers):>10.3f} {read_max / len(readers):>10.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--follows', type=int, default=30)
+    parser.add_argument('--compositions', type=int, default=20000)
+    parser.add_argument('--readers', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threshold', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for distribution in ('uniform', 'powerlaw'):
+        rng = random.Random(args.seed)
+        app = create_app('testing')
+        with app.app_context():
+            db.create_all()
+            seed(args.users, args.follows, args.compositions, distribution, rng)
+            top = db.session.execute(
+                db.select(db.func.count()).where(Follow.following_id == 1)
+            ).scalar()
+            print(f'\n{distribution}: {args.users} users, '
+                  f'{Follow.query.count()} follows, top artist has {top} followers')
+            print(f'{"strategy":>8} {"threshold":>10} {"inbox rows":>10} '
+                  f'{"pub ms":>10} {"pub max":>10} {"read ms":>10} {"read max":>10}')
+            for strategy, threshold in (('push', args.users + 1),
+                                        ('pull', 0),
+                                        ('hybrid', args.threshold)):
+                run(app, strategy, threshold, args, rng)
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
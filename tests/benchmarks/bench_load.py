@@ -0,0 +1,379 @@
+# tests/benchmarks/bench_load.py
+"""Load benchmark for the feeds, profiles and API.
+
+Seeds a reproducible dataset (power-law follows and compositions), then
+drives each scenario through the Flask test client and through a real
+threaded WSGI server. Reports throughput, p50/p95/p99 latency, time to the
+first byte of the body and SQL queries per request (read from the
+Server-Timing header, so for streamed pages only those run before the body
+starts). Results can be
+saved as JSON and compared with an earlier run; a scenario that got slower
+or issues more queries than ``--tolerance`` allows makes the script exit 1.
+
+    python -m tests.benchmarks.bench_load --users 2000 --save baseline.json
+    python -m tests.benchmarks.bench_load --users 2000 --baseline baseline.json
+"""
+import argparse
+import base64
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+from app import create_app, db, feed
+from app.config import config, TestingConfig
+from app.models import Composition, Follow, Role, User
+
+SCENARIOS = ('main.home', 'main.user', 'main.followers',
+             'api.get_compositions', 'api.get_user_timeline')
+
+_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+# --- Dataset ---
+
+def make_app(path):
+    config['bench-load'] = type('LoadConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'RAGTIME_PROFILER': True,
+        'RAGTIME_STREAM_TEMPLATES': True,
+    })
+    try:
+        return create_app('bench-load')
+    finally:
+        del config['bench-load']
+
+
+def powerlaw_weights(n, alpha):
+    return [1.0 / rank ** alpha for rank in range(1, n + 1)]
+
+
+def seed(args):
+    """Users 1..n with power-law popularity: user 1 is followed and
+    publishes the most. The same arguments always give the same rows."""
+    rng = random.Random(args.seed)
+    now = datetime(2024, 1, 1)
+    ids = list(range(1, args.users + 1))
+    weights = powerlaw_weights(args.users, args.alpha)
+    password_hash = generate_password_hash('cat', 'pbkdf2:sha256:1000')
+    role_id = Role.default_id()
+
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+         'password_hash': password_hash, 'confirmed': True, 'role_id': role_id,
+         'name': f'User {i}', 'last_seen': now} for i in ids])
+
+    rows = []
+    for follower in ids:
+        followed = set(rng.choices(ids, weights=weights, k=args.follows))
+        followed.discard(follower)
+        rows.extend({'follower_id': follower, 'following_id': f, 'timestamp': now}
+                    for f in followed)
+    db.session.execute(Follow.__table__.insert(), rows)
+    follows = len(rows)
+
+    artists = rng.choices(ids, weights=weights, k=args.compositions)
+    for start in range(0, args.compositions, 10000):
+        db.session.execute(Composition.__table__.insert(), [
+            {'id': i + 1, 'title': f'Rag {i}', 'slug': Composition.make_slug(i + 1, f'Rag {i}'),
+             'release_type': 1 + i % 3, 'description': 'A rag in C',
+             'description_html': 'A rag in C', 'artist_id': artists[i],
+             'timestamp': now - timedelta(minutes=i)}
+            for i in range(start, min(args.compositions, start + 10000))])
+    feed.rebuild()
+    db.session.commit()
+    return {'users': args.users, 'follows': follows, 'compositions': args.compositions,
+            'alpha': args.alpha, 'seed': args.seed}
+
+
+# --- Requests ---
+
+def login(app, user_id):
+    """The session cookie of a logged-in user; valid for the real server too"""
+    client = app.test_client()
+    client.post('/auth/login', data={'email': f'user{user_id}@example.com',
+                                     'password': 'cat'})
+    return client.get_cookie('session').value
+
+
+def plan(app, args):
+    """``{scenario: [(path, headers), ...]}``, the same for every driver"""
+    rng = random.Random(args.seed + 1)
+    ids = list(range(1, args.users + 1))
+    weights = powerlaw_weights(args.users, args.alpha)
+    readers = rng.sample(ids, min(args.readers, args.users))
+    cookies = {user_id: login(app, user_id) for user_id in readers}
+    with app.app_context():
+        tokens = {user_id: db.session.get(User, user_id).generate_auth_token()
+                  for user_id in readers}
+    per_page = app.config['RAGTIME_COMPS_PER_PAGE']
+    pages = max(1, min(args.compositions // per_page, 20))
+
+    def web(user_id):
+        return {'Cookie': f'session={cookies[user_id]}; show_followed=1'}
+
+    def api(user_id):
+        credentials = base64.b64encode(f'{tokens[user_id]}:'.encode()).decode()
+        return {'Authorization': f'Basic {credentials}'}
+
+    total = args.requests + args.warmup
+    requests = {}
+    for scenario in SCENARIOS:
+        items = []
+        for _ in range(total):
+            reader = rng.choice(readers)
+            # profiles are visited in proportion to their popularity
+            popular = rng.choices(ids, weights=weights)[0]
+            if scenario == 'main.home':
+                items.append(('/', web(reader)))
+            elif scenario == 'main.user':
+                items.append((f'/user/user{popular}', web(reader)))
+            elif scenario == 'main.followers':
+                items.append((f'/followers/user{popular}', web(reader)))
+            elif scenario == 'api.get_compositions':
+                items.append((f'/api/v1/compositions/?page={rng.randint(1, pages)}',
+                              api(reader)))
+            else:
+                items.append((f'/api/v1/users/{reader}/timeline/', api(reader)))
+        requests[scenario] = items
+    return requests
+
+
+def queries(header):
+    match = _QUERIES_RE.search(header or '')
+    return int(match.group(1)) if match else None
+
+
+# --- Drivers: each returns [(seconds, status, queries, ttfb)], and the wall time ---
+
+def drive_client(app, items):
+    # the plan carries the cookies; a client jar would replace them
+    client = app.test_client(use_cookies=False)
+    samples = []
+    start = time.perf_counter()
+    for path, headers in items:
+        t0 = time.perf_counter()
+        response = client.get(path, headers=headers)
+        chunks = response.iter_encoded()
+        next(chunks, None)
+        ttfb = time.perf_counter() - t0
+        for _ in chunks:
+            pass
+        response.close()
+        samples.append((time.perf_counter() - t0, response.status_code,
+                        queries(response.headers.get('Server-Timing')), ttfb))
+    return samples, time.perf_counter() - start
+
+
+class Server:
+    """The app on a threaded werkzeug server on a free local port"""
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join()
+
+
+def drive_server(port, items, concurrency):
+    samples = []
+    lock = threading.Lock()
+    pending = iter(items)
+
+    def worker():
+        mine = []
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                break
+            path, headers = item
+            t0 = time.perf_counter()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read(1)
+            ttfb = time.perf_counter() - t0
+            response.read()
+            connection.close()
+            mine.append((time.perf_counter() - t0, response.status,
+                         queries(response.getheader('Server-Timing')), ttfb))
+        with lock:
+            samples.extend(mine)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - start
+
+
+# --- Results ---
+
+def summarize(samples, wall):
+    latencies = sorted(seconds * 1000 for seconds, _, _, _ in samples)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    ttfb = statistics.quantiles([t * 1000 for _, _, _, t in samples], n=100,
+                                method='inclusive')
+    counts = [q for _, _, q, _ in samples if q is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status, _, _ in samples if status >= 400),
+        'throughput_rps': round(len(samples) / wall, 1),
+        'p50_ms': round(cuts[49], 2),
+        'p95_ms': round(cuts[94], 2),
+        'p99_ms': round(cuts[98], 2),
+        'ttfb_p50_ms': round(ttfb[49], 2),
+        'ttfb_p95_ms': round(ttfb[94], 2),
+        'queries_per_request': round(statistics.mean(counts), 2) if counts else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, tolerance):
+    """Regressions of ``current`` against ``baseline``, as printable lines"""
+    regressions = []
+    if baseline['meta'].get('dataset') != current['meta'].get('dataset'):
+        print('warning: the baseline was run on a different dataset', file=sys.stderr)
+    for driver, scenarios in current['results'].items():
+        for scenario, now in scenarios.items():
+            before = baseline['results'].get(driver, {}).get(scenario)
+            if before is None:
+                continue
+            label = f'{driver} {scenario}'
+            if now['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+                regressions.append(f'{label}: throughput {before["throughput_rps"]} -> '
+                                   f'{now["throughput_rps"]} req/s')
+            if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{label}: p95 {before["p95_ms"]} -> {now["p95_ms"]} ms')
+            if 'ttfb_p95_ms' in before and \
+                    now['ttfb_p95_ms'] > before['ttfb_p95_ms'] * (1 + tolerance):
+                regressions.append(f'{label}: first byte p95 {before["ttfb_p95_ms"]} -> '
+                                   f'{now["ttfb_p95_ms"]} ms')
+            if (now['queries_per_request'] or 0) > (before['queries_per_request'] or 0) + 0.5:
+                regressions.append(f'{label}: queries/request {before["queries_per_request"]}'
+                                   f' -> {now["queries_per_request"]}')
+            if now['errors'] > before['errors']:
+                regressions.append(f'{label}: errors {before["errors"]} -> {now["errors"]}')
+    return regressions
+
+
+def report(results):
+    print(f'{"driver":>7} {"scenario":<24} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"p99 ms":>8} {"ttfb p50":>8} {"ttfb p95":>8} {"queries":>8} {"errors":>7}')
+    for driver, scenarios in results.items():
+        for scenario, r in scenarios.items():
+            print(f'{driver:>7} {scenario:<24} {r["throughput_rps"]:>8.1f} {r["p50_ms"]:>8.2f} '
+                  f'{r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f} '
+                  f'{r["ttfb_p50_ms"]:>8.2f} {r["ttfb_p95_ms"]:>8.2f} '
+                  f'{r["queries_per_request"] if r["queries_per_request"] is not None else "-":>8} '
+                  f'{r["errors"]:>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--follows', type=int, default=20, help='follows drawn per user')
+    parser.add_argument('--compositions', type=int, default=20000)
+    parser.add_argument('--alpha', type=float, default=1.0, help='power-law exponent')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--readers', type=int, default=50, help='distinct logged-in users')
+    parser.add_argument('--requests', type=int, default=300, help='per scenario and driver')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4, help='server client threads')
+    parser.add_argument('--drivers', nargs='+', default=['client', 'server'],
+                        choices=['client', 'server'])
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with results saved by --save')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='allowed slowdown before a change counts as a regression')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no access log
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'load.sqlite'))
+        with app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            started = time.perf_counter()
+            dataset = seed(args)
+            print(f'seeded {dataset["users"]} users, {dataset["follows"]} follows, '
+                  f'{dataset["compositions"]} compositions in '
+                  f'{time.perf_counter() - started:.1f} s', file=sys.stderr)
+        requests = plan(app, args)
+
+        results = {}
+        for driver in args.drivers:
+            results[driver] = {}
+            for scenario in args.scenarios:
+                warmup, measured = (requests[scenario][:args.warmup],
+                                    requests[scenario][args.warmup:])
+                if driver == 'client':
+                    drive_client(app, warmup)
+                    samples, wall = drive_client(app, measured)
+                else:
+                    with Server(app) as server:
+                        drive_server(server.port, warmup, args.concurrency)
+                        samples, wall = drive_server(server.port, measured, args.concurrency)
+                results[driver][scenario] = summarize(samples, wall)
+        with app.app_context():
+            db.engine.dispose()
+
+    current = {
+        'meta': {
+            'created': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'git': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dataset': dataset,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'results': results,
+    }
+    report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), current, args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# tests/benchmarks/bench_metrics.py
+"""Per-request overhead of the metrics subsystem.
+
+Times the before/after_request hooks on their own (budget: 20 µs per
+request), then the same page through the test client with metrics on and off.
+
+    python -m tests.benchmarks.bench_metrics
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('DATABASE_TEST_URL', 'sqlite://')
+
+from flask import Response  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.config import config, TestingConfig  # noqa: E402
+from app import metrics  # noqa: E402
+
+BUDGET_US = 20
+
+
+def hook_overhead(app, n):
+    response = Response('ok')
+    with app.test_request_context('/about'):
+        app.preprocess_request()
+        start = time.perf_counter()
+        for _ in range(n):
+            metrics.start_timer()
+            metrics.record_request(response)
+        return (time.perf_counter() - start) / n * 1e6
+
+
+def request_time(app, n):
+    client = app.test_client()
+    client.get('/about')
+    start = time.perf_counter()
+    for _ in range(n):
+        client.get('/about')
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hooks', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    config['bench-metrics-off'] = type('MetricsOff', (TestingConfig,),
+                                       {'RAGTIME_METRICS': False})
+    apps = {'on': create_app('testing'), 'off': create_app('bench-metrics-off')}
+    for app in apps.values():
+        with app.app_context():
+            db.create_all()
+
+    hooks = hook_overhead(apps['on'], args.hooks)
+    print(f'hooks:   {hooks:8.2f} µs/request (budget {BUDGET_US} µs)')
+    timings = {name: request_time(app, args.requests) for name, app in apps.items()}
+    print(f'request: {timings["on"]:8.1f} µs with metrics, '
+          f'{timings["off"]:8.1f} µs without '
+          f'({timings["on"] - timings["off"]:+.1f} µs)')
+    with apps['on'].test_request_context():
+        start = time.perf_counter()
+        metrics.registry.exposition()
+        print(f'scrape:  {(time.perf_counter() - start) * 1000:8.2f} ms')
+    sys.exit(0 if hooks < BUDGET_US else 1)
+
+
+if __name__ == '__main__':
+    main()
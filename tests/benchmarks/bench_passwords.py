@@ -0,0 +1,85 @@
+# tests/benchmarks/bench_passwords.py
+"""Password checks per second by hash method and hasher pool size, and how
+slow a cheap page gets while a login storm is being hashed.
+
+    python -m tests.benchmarks.bench_passwords --checks 64
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DATABASE_TEST_URL', 'sqlite://')
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.passwords import HasherPool  # noqa: E402
+
+METHODS = ('pbkdf2:sha256:1000', 'pbkdf2:sha256:600000', 'scrypt:32768:8:1',
+           'scrypt:65536:8:1')
+
+
+def throughput(method, workers, checks):
+    pwhash = generate_password_hash('cat', method)
+    pool = HasherPool(workers, queue=checks)
+    with ThreadPoolExecutor(checks) as clients:
+        start = time.perf_counter()
+        list(clients.map(lambda _: pool.run(check_password_hash, pwhash, 'cat'),
+                         range(checks)))
+        elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return checks / elapsed
+
+
+def page_latency_during_storm(workers, seconds):
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    pwhash = generate_password_hash('cat', 'scrypt:32768:8:1')
+    pool = HasherPool(workers, queue=1000)
+    stop = threading.Event()
+
+    def storm():
+        while not stop.is_set():
+            pool.run(check_password_hash, pwhash, 'cat')
+
+    stormers = [threading.Thread(target=storm) for _ in range(2 * (os.cpu_count() or 1))]
+    for t in stormers:
+        t.start()
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        client.get('/about')
+        samples.append((time.perf_counter() - start) * 1000)
+    stop.set()
+    for t in stormers:
+        t.join()
+    pool.shutdown()
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checks', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    sizes = sorted({1, max(1, cpus // 2), cpus})
+    print(f'{"method":>22}' + ''.join(f' {f"{n} workers":>11}' for n in sizes) + '  (checks/s)')
+    for method in METHODS:
+        print(f'{method:>22}' + ''.join(f' {throughput(method, n, args.checks):>11.1f}'
+                                        for n in sizes))
+    for workers in sizes:
+        median, worst = page_latency_during_storm(workers, args.seconds)
+        print(f'/about during a storm, {workers} hasher workers: '
+              f'median {median:.1f} ms, max {worst:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# tests/benchmarks/bench_ratelimit.py
+"""Overhead of the rate limiter.
+
+Times a bare limiter check against the memory backend (one key, many keys,
+several threads), then a limited view against the same view unlimited
+through the test client.
+
+    python -m tests.benchmarks.bench_ratelimit --checks 200000
+"""
+import argparse
+import os
+import threading
+import time
+
+os.environ.setdefault('DATABASE_TEST_URL', 'sqlite://')
+
+from app import create_app  # noqa: E402
+from app.config import config, TestingConfig  # noqa: E402
+from app.decorators import rate_limit  # noqa: E402
+from app.ratelimit import Limit, Limiter, MemoryBackend  # noqa: E402
+
+
+def check_time(n, keys, threads):
+    limiter = Limiter(MemoryBackend())
+    limit = Limit.parse('1000000000/second')
+    names = [f'ip:10.0.{i // 256}.{i % 256}' for i in range(keys)]
+    per_thread = n // threads
+
+    def work():
+        hit = limiter.hit
+        for i in range(per_thread):
+            hit(limit, names[i % keys])
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e6
+
+
+def request_time(app, path, n):
+    client = app.test_client()
+    client.get(path)
+    start = time.perf_counter()
+    for _ in range(n):
+        client.get(path)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checks', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f'{"keys":>8} {"threads":>8} {"µs/check":>9}')
+    for keys, threads in ((1, 1), (100000, 1), (100000, 8)):
+        print(f'{keys:>8} {threads:>8} {check_time(args.checks, keys, threads):>9.2f}')
+
+    config['bench-ratelimit'] = type('RateLimitOn', (TestingConfig,),
+                                     {'RAGTIME_RATELIMIT': True, 'RAGTIME_METRICS': False})
+    app = create_app('bench-ratelimit')
+    app.add_url_rule('/plain', 'plain', lambda: 'ok')
+    app.add_url_rule('/limited', 'limited',
+                     rate_limit('1000000000/second')(lambda: 'ok'))
+    plain = request_time(app, '/plain', args.requests)
+    limited = request_time(app, '/limited', args.requests)
+    print(f'request: {limited:8.1f} µs limited, {plain:8.1f} µs unlimited '
+          f'({limited - plain:+.1f} µs)')
+
+
+if __name__ == '__main__':
+    main()
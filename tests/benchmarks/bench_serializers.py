@@ -0,0 +1,74 @@
+# tests/benchmarks/bench_serializers.py
+"""Serializing compositions for the API: ORM objects and ``to_json``
+versus column rows and the serializers, with each JSON provider.
+
+    python -m tests.benchmarks.bench_serializers --items 10000
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_TEST_URL', 'sqlite://')
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import Composition, User  # noqa: E402
+from app.serializers import CompositionSerializer, OrjsonProvider, orjson  # noqa: E402
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        now = datetime.utcnow()
+        db.session.execute(User.__table__.insert(), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com'}
+            for i in range(1, 101)])
+        db.session.execute(Composition.__table__.insert(), [
+            {'title': f'Rag {i}', 'release_type': 1 + i % 3, 'artist_id': 1 + i % 100,
+             'description': 'A rag in C', 'description_html': 'A rag in C',
+             'timestamp': now - timedelta(minutes=i)} for i in range(args.items)])
+        db.session.commit()
+
+        providers = [('json', DefaultJSONProvider(app))]
+        if orjson is not None:
+            providers.append(('orjson', OrjsonProvider(app)))
+
+        def orm():
+            return [c.to_json() for c in Composition.query.all()]
+
+        def rows():
+            serializer = CompositionSerializer()
+            return serializer.many(db.session.execute(serializer.select()))
+
+        print(f'{args.items} compositions, median of {args.repeat} (ms)')
+        print(f'{"path":>10} {"build":>8}' + ''.join(f' {name + " dump":>12}'
+                                                    for name, _ in providers))
+        for label, build in (('to_json', orm), ('serializer', rows)):
+            built = build()
+            line = f'{label:>10} {timed(build, args.repeat):>8.1f}'
+            for _, provider in providers:
+                line += f' {timed(lambda: provider.dumps(built), args.repeat):>12.1f}'
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# tests/benchmarks/bench_startup.py
+"""Cold-start cost of importing the app package and running create_app.
+
+Every sample runs in a fresh interpreter so nothing is cached in
+sys.modules; it also reports which heavy optional modules got imported.
+
+    python -m tests.benchmarks.bench_startup --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DEFERRED = ('bleach', 'jwt', 'faker', 'flask_mail', 'flask_migrate', 'alembic', 'dotenv')
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app({config!r})
+created = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "loaded": [m for m in {deferred!r} if m in sys.modules],
+}}))
+'''
+
+
+def sample(config_name):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE.format(config=config_name, deferred=DEFERRED)],
+        cwd=root, check=True, capture_output=True, text=True,
+        env=dict(os.environ, DATABASE_TEST_URL='sqlite://'),
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--config', default='testing')
+    args = parser.parse_args()
+
+    samples = [sample(args.config) for _ in range(args.runs)]
+    for key in ('import_ms', 'create_app_ms'):
+        values = [s[key] for s in samples]
+        print(f'{key:>14}: median {statistics.median(values):7.1f} ms, '
+              f'min {min(values):7.1f} ms, max {max(values):7.1f} ms')
+    print(f'{"loaded":>14}: {", ".join(samples[-1]["loaded"]) or "none of " + ", ".join(DEFERRED)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# tests/benchmarks/bench_templates.py
+"""Cold-start render latency of ``main.home`` with and without the Jinja
+bytecode cache.
+
+Every sample is a fresh interpreter rendering the page for the first time;
+"cached" runs load bytecode written by ``flask compile-templates``.
+
+    python -m tests.benchmarks.bench_templates --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = '''
+import json, time
+from app import create_app, db
+from app.config import config, TestingConfig
+from app.models import Role
+from app.templating import compile_templates
+config['bench'] = type('BenchConfig', (TestingConfig,), {{
+    'RAGTIME_TEMPLATE_CACHE': {cached!r},
+    'RAGTIME_TEMPLATE_CACHE_DIR': {directory!r},
+}})
+app = create_app('bench')
+with app.app_context():
+    db.create_all()
+    Role.insert_roles()
+if {prime!r}:
+    compile_templates(app)
+else:
+    client = app.test_client()
+    start = time.perf_counter()
+    assert client.get('/').status_code == 200
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    client.get('/')
+    second = time.perf_counter() - start
+    print(json.dumps({{"first_ms": first * 1000, "warm_ms": second * 1000}}))
+'''
+
+
+def run(cached, directory, prime=False):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE.format(cached=cached, directory=directory, prime=prime)],
+        cwd=root, check=True, capture_output=True, text=True,
+        env=dict(os.environ, DATABASE_TEST_URL='sqlite://',
+                 SECRET_KEY=os.environ.get('SECRET_KEY', 'bench')),
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1]) if not prime else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        run(True, directory, prime=True)
+        for label, cached in (('uncached', False), ('cached', True)):
+            samples = [run(cached, directory) for _ in range(args.runs)]
+            first = [s['first_ms'] for s in samples]
+            warm = [s['warm_ms'] for s in samples]
+            print(f'{label:>9}: first render median {statistics.median(first):7.1f} ms '
+                  f'(min {min(first):.1f}), second {statistics.median(warm):6.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
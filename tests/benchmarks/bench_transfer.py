@@ -0,0 +1,81 @@
+# tests/benchmarks/bench_transfer.py
+"""Export/import throughput and peak memory at growing table sizes.
+
+Peak Python memory (tracemalloc) should stay flat as the row count grows.
+
+    python -m tests.benchmarks.bench_transfer --sizes 10000 100000
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+from app import create_app, db
+from app.config import config, TestingConfig
+from app.models import Composition, Role, User
+from app.transfer import export_tables, import_tables
+
+
+def make_app(path):
+    name = f'bench-{os.path.basename(path)}'
+    config[name] = type('BenchConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    app = create_app(name)
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+    return app
+
+
+def seed(rows):
+    now = datetime.utcnow()
+    users = max(1, rows // 10)
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+         'last_seen': now} for i in range(1, users + 1)])
+    for start in range(0, rows, 10000):
+        db.session.execute(Composition.__table__.insert(), [
+            {'title': f'Rag {i}', 'release_type': 1, 'description': 'A rag, "quoted"',
+             'description_html': 'A rag', 'artist_id': i % users + 1, 'timestamp': now}
+            for i in range(start, min(rows, start + 10000))])
+    db.session.commit()
+
+
+def measure(stats):
+    tracemalloc.start()
+    results = list(stats)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rows = sum(r for _, r, _ in results)
+    seconds = sum(s for _, _, s in results)
+    return rows, rows / seconds, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--format', default='ndjson', choices=['ndjson', 'csv'])
+    parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args()
+
+    print(f'{"rows":>8} {"export rows/s":>14} {"peak MiB":>9} {"import rows/s":>14} {"peak MiB":>9}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            source = make_app(os.path.join(directory, 'source.sqlite'))
+            with source.app_context():
+                seed(size)
+                _, export_rate, export_peak = measure(export_tables(
+                    os.path.join(directory, 'dump'), fmt=args.format, compress=args.gzip))
+                db.engine.dispose()
+            target = make_app(os.path.join(directory, 'target.sqlite'))
+            with target.app_context():
+                rows, import_rate, import_peak = measure(import_tables(
+                    os.path.join(directory, 'dump')))
+                db.engine.dispose()
+            print(f'{rows:>8} {export_rate:>14.0f} {export_peak:>9.1f} '
+                  f'{import_rate:>14.0f} {import_peak:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
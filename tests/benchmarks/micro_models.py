@@ -0,0 +1,129 @@
+# tests/benchmarks/micro_models.py
+"""Per-call costs of the model methods that show up in request profiles.
+
+A pytest-benchmark suite. It isn't collected with the unit tests (the file
+name doesn't start with ``test_``), so name it to run it; each benchmark
+runs in the usual rolled-back transaction (see tests/conftest.py) against
+a user who follows 500 artists and has published 200 compositions.
+
+Save every run, then compare with the last one and fail on a slowdown::
+
+    python -m pytest tests/benchmarks/micro_models.py --benchmark-autosave
+    python -m pytest tests/benchmarks/micro_models.py --benchmark-compare \\
+        --benchmark-compare-fail=median:10%
+
+Runs are kept per machine in .benchmarks/; ``pytest-benchmark compare``
+lists and charts them.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from app import db  # noqa: E402
+from app.models import Composition, Follow, Permission, User  # noqa: E402
+
+FOLLOWING = 500
+COMPOSITIONS = 200
+
+TITLE = 'Maple Leaf Rag — Ragtime in A♭ (1899 edition)'
+DESCRIPTION = '\n\n'.join([
+    'Published by John Stark & Son, see https://example.com/stark for the '
+    'original <b>sheet music</b> and www.example.org/rolls for piano rolls.',
+    '<script>alert("not allowed")</script> Tempo di marcia, not fast. ' * 8,
+    'Recordings: <a href="https://example.com/1916">1916 roll</a>, '
+    'https://example.com/1950s and <i>many</i> more. ' * 6,
+])
+
+
+@pytest.fixture
+def fan(app):
+    """A user following FOLLOWING artists and publishing COMPOSITIONS"""
+    now = datetime.utcnow()
+    fan = User(username='fan', email='fan@example.com', confirmed=True)
+    db.session.add(fan)
+    db.session.commit()
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'artist{i}', 'email': f'artist{i}@example.com', 'last_seen': now}
+        for i in range(FOLLOWING)])
+    artist_ids = db.session.scalars(
+        db.select(User.id).where(User.username.like('artist%'))).all()
+    db.session.execute(Follow.__table__.insert(), [
+        {'follower_id': fan.id, 'following_id': id, 'timestamp': now} for id in artist_ids])
+    db.session.execute(Composition.__table__.insert(), [
+        {'title': f'Rag {i}', 'release_type': 1, 'description': DESCRIPTION,
+         'description_html': Composition.sanitize(DESCRIPTION), 'artist_id': fan.id,
+         'timestamp': now - timedelta(minutes=i)} for i in range(COMPOSITIONS)])
+    db.session.commit()
+    fan.last_artist = db.session.get(User, artist_ids[-1])
+    return fan
+
+
+@pytest.fixture
+def composition(fan):
+    return Composition.query.filter_by(artist_id=fan.id).first()
+
+
+@pytest.mark.benchmark(group='user')
+def test_user_init(benchmark, app):
+    # a fresh session each round, as in a request
+    benchmark.pedantic(lambda: User(username='new', email='new@example.com'),
+                       setup=db.session.expunge_all, rounds=300)
+
+
+@pytest.mark.benchmark(group='user')
+def test_user_can(benchmark, fan):
+    benchmark(fan.can, Permission.PUBLISH)
+
+
+@pytest.mark.benchmark(group='user')
+def test_user_is_following(benchmark, fan):
+    assert benchmark(fan.is_following, fan.last_artist)
+
+
+@pytest.mark.benchmark(group='user')
+def test_user_to_json(benchmark, app, fan):
+    with app.test_request_context():
+        assert benchmark(fan.to_json)['composition_count'] == COMPOSITIONS
+
+
+@pytest.mark.benchmark(group='composition')
+def test_on_changed_description(benchmark, composition):
+    benchmark(Composition.on_changed_description, composition, DESCRIPTION, None, None)
+    assert 'rel="nofollow"' in composition.description_html
+
+
+@pytest.mark.benchmark(group='composition')
+def test_generate_slug(benchmark, composition):
+    composition.title = TITLE
+    benchmark(composition.generate_slug)
+    assert composition.slug.startswith(f'{composition.id}-maple-leaf-rag')
+
+
+@pytest.mark.benchmark(group='composition')
+def test_composition_to_json(benchmark, app, composition):
+    with app.test_request_context():
+        benchmark(composition.to_json)
+
+
+@pytest.mark.benchmark(group='tokens')
+def test_generate_auth_token(benchmark, fan):
+    benchmark(fan.generate_auth_token)
+
+
+@pytest.mark.benchmark(group='tokens')
+def test_verify_auth_token(benchmark, fan):
+    token = fan.generate_auth_token()
+    assert benchmark(User.verify_auth_token, token) == fan
+
+
+@pytest.mark.benchmark(group='tokens')
+def test_generate_confirmation_token(benchmark, fan):
+    benchmark(fan.generate_confirmation_token)
+
+
+@pytest.mark.benchmark(group='tokens')
+def test_confirm(benchmark, fan):
+    token = fan.generate_confirmation_token()
+    assert benchmark(fan.confirm, token)
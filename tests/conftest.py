@@ -1,37 +1,128 @@
+"""Shared fixtures.
+
+The app and its schema are built once per test session, on an in-memory
+SQLite database shared by the connections of this process (one database per
+pytest-xdist worker). Each test then runs inside a transaction that is
+rolled back when it ends: ``db.session`` is bound to that transaction and
+turns its commits into SAVEPOINTs, so tests can commit freely and never see
+each other's rows.
+
+Tests that need real commits (their rows read through another connection,
+or a checked-in connection pool) are marked ``no_transaction``; the tables
+they wrote to are emptied afterwards.
+"""
+import os
+import sqlite3
+
 import pytest
+
 from app import create_app, db
+from app.config import config, TestingConfig
+from app.engine import TimedQueuePool
 from app.models import Role, User
-from flask_login import LoginManager
+from app.routing import RoutingSession
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'no_transaction: run without the per-test rollback; '
+                   'the tables are emptied afterwards instead')
+
+
+def database_name():
+    return 'ragtime-test-' + os.environ.get('PYTEST_XDIST_WORKER', 'main')
 
-@pytest.fixture(scope="module")
+
+@pytest.fixture(scope='session')
 def app():
-    # Create the app in testing mode
-    app = create_app("testing")
+    name = database_name()
+    # the database lives as long as one connection to it is open
+    keeper = sqlite3.connect(f'file:/{name}?mode=memory&cache=shared', uri=True)
+    config['session'] = type('SessionConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///file:/{name}?mode=memory&cache=shared&uri=true',
+        # SQLAlchemy would pick a SingletonThreadPool for a memory database
+        'SQLALCHEMY_ENGINE_OPTIONS': {'poolclass': TimedQueuePool},
+    })
+    try:
+        app = create_app('session')
+    finally:
+        del config['session']
+
     ctx = app.app_context()
     ctx.push()
-     
-    from app import login_manager
-    login_manager.login_view = None
-
     db.create_all()
     Role.insert_roles()
+    db.session.remove()
     yield app
     db.session.remove()
-    db.drop_all()
+    db.engine.dispose()
     ctx.pop()
+    keeper.close()
+
+
+class TransactionSession(RoutingSession):
+    """Sends what would go to the test app's engine to the test's connection"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        resolved = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        return self.bind if resolved is self.info['engine'] else resolved
+
+
+def _empty_tables():
+    with db.engine.begin() as connection:
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name != 'roles':
+                connection.execute(table.delete())
+
+
+@pytest.fixture(autouse=True)
+def _no_login_view():
+    # unauthenticated requests get a 401 rather than a redirect; every
+    # create_app() sets the view again on the shared login_manager
+    from app import login_manager
+    login_manager.login_view = None
+
+
+@pytest.fixture(autouse=True)
+def _transaction(request, app):
+    if request.node.get_closest_marker('no_transaction'):
+        yield
+        db.session.remove()
+        _empty_tables()
+        return
+
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    # pysqlite leaves BEGIN to the first write, and a RELEASE of the first
+    # SAVEPOINT outside a transaction would commit
+    connection.exec_driver_sql('BEGIN')
+    session = db._make_scoped_session({
+        'class_': TransactionSession,
+        'bind': connection,
+        'join_transaction_mode': 'create_savepoint',
+        'info': {'engine': db.engine},
+    })
+    outer, db.session = db.session, session
+    try:
+        yield
+    finally:
+        session.remove()
+        db.session = outer
+        transaction.rollback()
+        connection.close()
+
 
 @pytest.fixture
 def client(app):
     # Provide a test client
     return app.test_client()
 
+
 @pytest.fixture
 def user(app):
-    # Create a user with a unique email for each test
+    # Rolled back after the test, so the email is free again for the next
     role = Role.query.filter_by(name="User").first()
-    u = User(username="testuser", email="unique@test.com", password="password", role=role)
+    u = User(username="testuser", email="unique@example.com", password="password", role=role)
     db.session.add(u)
     db.session.commit()
     return u
-
-
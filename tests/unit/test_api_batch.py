@@ -0,0 +1,92 @@
+import base64
+import json
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import Composition, User
+
+
+@pytest.fixture
+def artists(app):
+    joplin = User(username='joplin', email='joplin@example.com',
+                  password='cat', confirmed=True)
+    lamb = User(username='lamb', email='lamb@example.com',
+                password='dog', confirmed=True)
+    db.session.add_all([joplin, lamb])
+    db.session.commit()
+    return joplin, lamb
+
+
+def auth(email, password):
+    return {'Authorization': 'Basic ' + base64.b64encode(
+        f'{email}:{password}'.encode()).decode()}
+
+
+@pytest.fixture
+def commits(app):
+    commits = []
+    listener = lambda session: commits.append(1)
+    event.listen(db.session, 'after_commit', listener)
+    yield commits
+    event.remove(db.session, 'after_commit', listener)
+
+
+def test_batch_create_ndjson_in_chunks(app, client, artists, commits, monkeypatch):
+    monkeypatch.setitem(app.config, 'RAGTIME_BATCH_CHUNK_SIZE', 2)
+    items = [{'title': f'Rag {i}', 'release_type': 1, 'description': 'see example.com'}
+             for i in range(4)]
+    items.insert(2, {'title': 'No description', 'release_type': 1})
+    body = '\n'.join(json.dumps(item) for item in items) + '\n'
+
+    response = client.post('/api/v1/compositions/batch', data=body,
+                           content_type='application/x-ndjson',
+                           headers=auth('joplin@example.com', 'cat'))
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['count'] == 5 and data['errors'] == 1
+    assert [r['status'] for r in data['results']] == [201, 201, 400, 201, 201]
+    assert len(commits) == 3
+
+    composition = db.session.get(Composition, data['results'][0]['id'])
+    assert composition.slug == f'{composition.id}-rag-0'
+    assert composition.artist_id == artists[0].id
+    assert 'rel="nofollow"' in composition.description_html
+
+
+def test_batch_edit(client, artists):
+    response = client.post('/api/v1/compositions/batch',
+                           json=[{'title': 'Weeping Willow', 'release_type': 1,
+                                  'description': 'slow drag'}],
+                           headers=auth('joplin@example.com', 'cat'))
+    mine = response.get_json()['results'][0]['id']
+
+    response = client.put('/api/v1/compositions/batch',
+                          json=[{'id': mine, 'title': 'Weeping Willow Rag'},
+                                {'id': 99999, 'title': 'Missing'},
+                                {'title': 'No id'}],
+                          headers=auth('joplin@example.com', 'cat'))
+    assert [r['status'] for r in response.get_json()['results']] == [200, 404, 400]
+    assert db.session.get(Composition, mine).title == 'Weeping Willow Rag'
+
+    response = client.put('/api/v1/compositions/batch',
+                          json=[{'id': mine, 'title': 'Stolen'}],
+                          headers=auth('lamb@example.com', 'dog'))
+    assert response.get_json()['results'][0]['status'] == 403
+
+
+def test_batch_rejects_other_bodies(client, artists):
+    response = client.post('/api/v1/compositions/batch', json={'title': 'x'},
+                           headers=auth('joplin@example.com', 'cat'))
+    assert response.status_code == 400
+
+
+def test_single_create_commits_once(client, artists, commits):
+    response = client.post('/api/v1/compositions/',
+                           json={'title': 'The Entertainer', 'release_type': 1,
+                                 'description': 'a rag'},
+                           headers=auth('joplin@example.com', 'cat'))
+    assert response.status_code == 201
+    assert len(commits) == 1
+    assert response.get_json()['title'] == 'The Entertainer'
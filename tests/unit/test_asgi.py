@@ -0,0 +1,148 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+pytest.importorskip('aiosqlite')
+pytest.importorskip('asgiref')
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app, db, passwords  # noqa: E402
+from app.asgi import AsyncAPI  # noqa: E402
+from app.config import config, TestingConfig  # noqa: E402
+from app.models import Composition, Role, User  # noqa: E402
+from app.ratelimit import Limit  # noqa: E402
+
+
+async def call(asgi_app, path, headers=(), full=False):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi_app({
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '', 'server': ('localhost', 80),
+        'client': ('127.0.0.1', 1234),
+        'headers': [(b'host', b'localhost')] + [(k.encode(), v.encode()) for k, v in headers],
+    }, receive, send)
+    status = sent[0]['status']
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    if full:
+        return status, body, dict(sent[0]['headers'])
+    return status, body
+
+
+@pytest.fixture
+def async_api(tmp_path):
+    config['asgi'] = type('AsgiConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "asgi.sqlite"}',
+        'SECRET_KEY': 'asgi-test',
+    })
+    try:
+        asgi_app = AsyncAPI(create_app('asgi'))
+        with asgi_app.flask_app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            user = User(username='joplin', email='joplin@example.com',
+                        password='cat', confirmed=True)
+            db.session.add(user)
+            db.session.commit()
+            composition = Composition(title='Maple Leaf Rag', release_type=1,
+                                      description='see http://example.com', artist=user)
+            db.session.add(composition)
+            db.session.commit()
+            asgi_app.token = user.generate_auth_token()
+            asgi_app.ids = user.id, composition.id
+        yield asgi_app
+        with asgi_app.flask_app.app_context():
+            db.engine.dispose()
+        asyncio.run(asgi_app.engine.dispose())
+    finally:
+        del config['asgi']
+
+
+def basic(username, password=''):
+    return [('authorization', 'Basic ' + base64.b64encode(
+        f'{username}:{password}'.encode()).decode())]
+
+
+def test_same_json_as_flask(async_api):
+    user_id, composition_id = async_api.ids
+    client = async_api.flask_app.test_client()
+    for path in (f'/api/v1/users/{user_id}',
+                 f'/api/v1/users/{user_id}/compositions/',
+                 f'/api/v1/users/{user_id}/timeline/',
+                 f'/api/v1/compositions/{composition_id}'):
+        for headers in (basic(async_api.token), basic('joplin@example.com', 'cat')):
+            expected = client.get(path, headers=dict(headers))
+            assert expected.status_code == 200
+            status, body = asyncio.run(call(async_api, path, headers))
+            assert status == 200
+            assert json.loads(body) == expected.get_json()
+
+
+def test_fast_path_does_not_touch_flask(async_api, monkeypatch):
+    async def fail(*args):
+        raise AssertionError('fell back to the Flask app')
+    monkeypatch.setattr(async_api, 'wsgi', fail)
+    status, _ = asyncio.run(call(async_api, f'/api/v1/users/{async_api.ids[0]}',
+                                 basic(async_api.token)))
+    assert status == 200
+
+
+def test_fast_path_is_profiled(async_api):
+    status, _, headers = asyncio.run(call(
+        async_api, f'/api/v1/users/{async_api.ids[0]}', basic(async_api.token), full=True))
+    assert status == 200
+    assert '2 queries' in headers[b'server-timing'].decode()
+    stats = async_api.flask_app.extensions['profiler'].snapshot()['endpoints']
+    assert stats['api.get_user']['requests'] == 1
+
+
+def test_outdated_hashes_are_replaced_by_flask(async_api, monkeypatch):
+    with async_api.flask_app.app_context():
+        user = db.session.get(User, async_api.ids[0])
+        user.password_hash = generate_password_hash('cat', 'pbkdf2:sha256:2000')
+        db.session.commit()
+    status, _ = asyncio.run(call(async_api, f'/api/v1/users/{async_api.ids[0]}',
+                                 basic('joplin@example.com', 'cat')))
+    assert status == 200
+    with async_api.flask_app.app_context():
+        user = db.session.get(User, async_api.ids[0])
+        assert not passwords.needs_rehash(user.password_hash)
+
+
+def test_hasher_pool_is_sized_by_the_app(async_api, monkeypatch):
+    monkeypatch.setitem(async_api.flask_app.config, 'RAGTIME_PASSWORD_HASH_WORKERS', 3)
+    monkeypatch.setattr(passwords, '_pool', None)
+    status, _ = asyncio.run(call(async_api, f'/api/v1/users/{async_api.ids[0]}',
+                                 basic('joplin@example.com', 'cat')))
+    assert status == 200
+    assert passwords._pool.workers == 3
+    passwords._pool.shutdown(wait=True)
+
+
+def test_rate_limited_endpoints_are_left_to_flask(async_api, monkeypatch):
+    app = async_api.flask_app
+    monkeypatch.setitem(app.extensions, 'ratelimit', object())
+    monkeypatch.setattr(app.view_functions['api.get_user'], 'rate_limits',
+                        [Limit.parse('1/minute')], raising=False)
+    limited = AsyncAPI(app)
+    asyncio.run(limited.engine.dispose())
+    assert 'api.get_user' not in limited.handlers
+    assert 'api.get_composition' in limited.handlers
+
+
+def test_errors_come_from_flask(async_api):
+    assert asyncio.run(call(async_api, '/api/v1/users/1'))[0] == 401
+    assert asyncio.run(call(async_api, '/api/v1/users/1',
+                            basic('joplin@example.com', 'dog')))[0] == 401
+    assert asyncio.run(call(async_api, '/api/v1/users/999', basic(async_api.token)))[0] == 404
+    assert asyncio.run(call(async_api, '/about'))[0] == 200
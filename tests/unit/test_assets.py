@@ -0,0 +1,88 @@
+import gzip
+import json
+import os
+import re
+
+from app import assets
+from app.assets import build, fingerprint, load, minify_css
+
+
+def test_minify_css_keeps_strings_and_meaning():
+    css = '''/* header */
+    a > b ,  .c:hover {
+        color: #000;
+        content: "a,  b { }";
+    }
+    @media (min-width: 768px) { .d { margin : 0 auto } }
+    '''
+    assert minify_css(css) == (
+        'a>b,.c:hover{color:#000;content:"a,  b { }"}'
+        '@media (min-width:768px){.d{margin :0 auto}}')
+
+
+def test_build_fingerprints_bundles_and_what_they_reference(app, tmp_path):
+    built = build(app, str(tmp_path))
+    assert set(built.bundles) == set(assets.BUNDLES)
+    for name, hashed in built.bundles.items():
+        data = (tmp_path / hashed).read_bytes()
+        assert hashed == fingerprint(name, data)
+        assert gzip.decompress((tmp_path / f'{hashed}.gz').read_bytes()) == data
+    css = (tmp_path / built.bundles['ragtime.css']).read_text()
+    assert 'composition-thumbnail' in css and '/*' not in css
+    js = (tmp_path / built.bundles['ragtime.js']).read_text()
+    assert 'e.moment=t()' in js
+    # the glyphicon fonts sit next to the bundle under their own hashes
+    urls = re.findall(r'url\(([^?#)]+)', css)
+    assert urls and all(url in built.files for url in urls)
+    manifest = json.loads((tmp_path / assets.MANIFEST).read_text())
+    assert manifest['bundles'] == built.bundles
+
+
+def test_load_rebuilds_when_the_sources_change(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'RAGTIME_ASSETS_DIR', str(tmp_path))
+    first = load(app)
+    assert (tmp_path / assets.MANIFEST).exists()
+    os.remove(tmp_path / first.bundles['ragtime.js'])
+    assert load(app).sources == first.sources
+    assert not (tmp_path / first.bundles['ragtime.js']).exists()
+    monkeypatch.setattr(assets, 'BUILD_VERSION', assets.BUILD_VERSION + 1)
+    assert load(app).sources != first.sources
+    assert (tmp_path / first.bundles['ragtime.js']).exists()
+
+
+def test_pages_link_the_bundles(app, client):
+    html = client.get('/about').get_data(as_text=True)
+    for name, hashed in app.extensions['assets'].bundles.items():
+        assert f'/assets/{hashed}' in html
+    assert 'bootstrap.min.css' not in html and 'styles.css' not in html
+    # moment.js comes from the bundle, not a CDN
+    assert 'cdnjs' not in html and 'flask_moment_render_all' in html
+
+
+def test_assets_are_cached_for_good(app, client):
+    hashed = app.extensions['assets'].bundles['ragtime.css']
+    response = client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.content_encoding == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert response.cache_control.immutable and response.cache_control.public
+    assert response.cache_control.max_age == assets.ONE_YEAR
+    assert 'Cookie' not in response.vary and 'Accept-Encoding' in response.vary
+    plain = client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert plain.content_encoding is None
+    assert gzip.decompress(response.data) == plain.data
+
+    again = client.get(f'/assets/{hashed}', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert client.get('/assets/ragtime.css').status_code == 404
+    assert client.get(f'/assets/{assets.MANIFEST}').status_code == 404
+
+
+def test_nginx_sends_the_file_with_accel_redirect(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'RAGTIME_ASSETS_ACCEL_REDIRECT', '/_assets/')
+    hashed = app.extensions['assets'].bundles['ragtime.js']
+    response = client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['X-Accel-Redirect'] == f'/_assets/{hashed}.gz'
+    assert response.content_encoding == 'gzip' and response.data == b''
+    assert response.cache_control.immutable
@@ -0,0 +1,127 @@
+import struct
+import threading
+import zlib
+
+import pytest
+
+from app import avatars, db
+from app.avatars import FALLBACK_MAX_AGE, PNG_SIGNATURE, MappedFiles, identicon, precompute
+from app.models import User
+
+HASH = 'c0ffee0123456789abcdef0123456789'
+
+
+@pytest.fixture
+def avatar_dir(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'RAGTIME_AVATAR_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def owner(app):
+    # a user whose avatar is HASH
+    user = User(username='owner', email='owner@example.com', avatar_hash=HASH)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def pixels(png):
+    """The rows of palette indexes of an identicon()"""
+    width, height = struct.unpack('>II', png[16:24])
+    raw = zlib.decompress(png[png.index(b'IDAT') + 4:png.index(b'IEND') - 8])
+    stride = width + 1
+    return [raw[y * stride + 1:(y + 1) * stride] for y in range(height)]
+
+
+def test_identicon_is_a_symmetric_pattern_of_the_hash():
+    png = identicon(HASH, 64)
+    assert png.startswith(PNG_SIGNATURE)
+    assert struct.unpack('>II', png[16:24]) == (64, 64)
+    assert identicon(HASH, 64) == png
+    assert identicon('f' + HASH[1:], 64) != png
+    rows = pixels(png)
+    assert all(row == row[::-1] for row in rows)
+    # the margin is background, and the pattern has both colours
+    assert set(rows[0]) == {0} and {1} <= set(b''.join(rows))
+
+
+def test_avatars_are_served_from_the_disk_cache(app, client, avatar_dir, owner, monkeypatch):
+    response = client.get(f'/avatar/{HASH}/64')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data == identicon(HASH, 64)
+    assert (avatar_dir / HASH[:2] / f'{HASH}-64.png').read_bytes() == response.data
+    assert response.cache_control.public and response.get_etag()[0]
+
+    # later requests don't render it again
+    monkeypatch.setattr(avatars, 'render', lambda *args: pytest.fail('rendered again'))
+    again = client.get(f'/avatar/{HASH}/64')
+    assert again.data == response.data
+    assert again.headers['ETag'] == response.headers['ETag']
+    cached = client.get(f'/avatar/{HASH}/64', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304 and cached.data == b''
+
+
+@pytest.mark.parametrize('path', [f'/avatar/{HASH}/65', '/avatar/not-a-hash/64',
+                                  f'/avatar/{HASH.upper()}/64'])
+def test_other_avatars_are_not_found(client, avatar_dir, owner, path):
+    assert client.get(path).status_code == 404
+    assert not any(avatar_dir.iterdir())
+
+
+def test_unknown_hashes_are_not_rendered(client, avatar_dir, owner, monkeypatch):
+    monkeypatch.setattr(avatars, 'render', lambda *args: pytest.fail('rendered'))
+    assert client.get(f'/avatar/{"f" * 32}/64').status_code == 404
+    assert not any(avatar_dir.iterdir())
+
+
+def test_unreachable_unicorns_fall_back_to_identicons_for_now(app, client, avatar_dir,
+                                                               owner, monkeypatch):
+    monkeypatch.setitem(app.config, 'RAGTIME_AVATAR_SOURCE', 'unicornify')
+
+    def offline(avatar_hash, size):
+        raise OSError('Network is unreachable')
+    monkeypatch.setattr(avatars, 'fetch_unicorn', offline)
+    response = client.get(f'/avatar/{HASH}/32')
+    assert response.data == identicon(HASH, 32)
+    assert response.cache_control.max_age == FALLBACK_MAX_AGE
+    # the next request fetches again
+    assert not any(avatar_dir.iterdir())
+
+
+def test_evicted_maps_stay_readable(tmp_path):
+    files = MappedFiles(capacity=1)
+    first, second = tmp_path / 'first.png', tmp_path / 'second.png'
+    first.write_bytes(b'first')
+    second.write_bytes(b'second')
+    mapped, etag = files.get(str(first))
+    # another request pushes it out while this one is still serving it
+    thread = threading.Thread(target=files.get, args=[str(second)])
+    thread.start()
+    thread.join()
+    assert mapped[:] == b'first'
+
+
+def test_precompute_renders_the_common_sizes(app, avatar_dir):
+    precompute(app, HASH)
+    assert sorted(path.name for path in (avatar_dir / HASH[:2]).iterdir()) == sorted(
+        f'{HASH}-{size}.png' for size in app.config['RAGTIME_AVATAR_SIZES'])
+
+
+def test_changing_email_moves_the_avatar(app, client, user, monkeypatch):
+    precomputed = []
+    monkeypatch.setattr('app.auth.views.precompute_later', precomputed.append)
+    user.confirmed = True
+    db.session.commit()
+    user_id, old_hash = user.id, user.avatar_hash
+    # a context of its own, so the logged in user doesn't outlive the test
+    with app.app_context():
+        client.post('/auth/login', data={'email': 'unique@example.com', 'password': 'password'})
+        client.post('/auth/change-email', data={'new_email': 'moved@example.com'})
+        moved = db.session.get(User, user_id)
+        assert moved.avatar_hash == User.hash_email('moved@example.com') != old_hash
+        assert precomputed == [moved.avatar_hash]
+        html = client.get('/user/testuser').get_data(as_text=True)
+    assert f'/avatar/{moved.avatar_hash}/128' in html and old_hash not in html
+    assert 'unicornify.pictures' not in html
@@ -0,0 +1,26 @@
+from app import create_app, db
+from app.config import config, TestingConfig, SQLITE_ENGINE_OPTIONS, SQLITE_PRODUCTION_PRAGMAS
+from app.engine import pool_stats
+
+def test_sqlite_production_profile(tmp_path):
+    config['sqlite-profile'] = type('SQLiteProfileConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "profile.sqlite"}',
+        'SQLALCHEMY_ENGINE_OPTIONS': SQLITE_ENGINE_OPTIONS,
+        'RAGTIME_SQLITE_PRAGMAS': SQLITE_PRODUCTION_PRAGMAS,
+    })
+    try:
+        app = create_app('sqlite-profile')
+        with app.app_context():
+            with db.engine.connect() as conn:
+                pragma = lambda name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+                assert pragma('journal_mode') == 'wal'
+                assert pragma('synchronous') == 1  # NORMAL
+                assert pragma('busy_timeout') == 5000
+
+                stats = pool_stats()['default']
+                assert stats['pool'] == 'TimedQueuePool'
+                assert stats['checked_out'] == 1
+                assert stats['checkouts'] >= 1
+            db.engine.dispose()
+    finally:
+        del config['sqlite-profile']
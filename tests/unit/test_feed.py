@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import User, Composition, FeedItem, Follow
+from app.feed import FollowedFeed
+
+def make_user(name):
+    u = User(username=name, email=f'{name}@feed.test')
+    db.session.add(u)
+    db.session.commit()
+    return u
+
+def publish(artist, title, minutes_ago):
+    c = Composition(release_type=1, title=title, description='',
+                    timestamp=datetime.utcnow() - timedelta(minutes=minutes_ago),
+                    artist=artist)
+    db.session.add(c)
+    db.session.commit()
+    return c
+
+def test_compositions_are_pushed_to_followers(app):
+    fan, artist = make_user('fan1'), make_user('artist1')
+    fan.follow(artist)
+    db.session.commit()
+
+    c = publish(artist, 'Maple Leaf Rag', 5)
+
+    assert FeedItem.query.filter_by(owner_id=fan.id, composition_id=c.id).first()
+    assert list(FollowedFeed(fan)) == [c]
+
+def test_follow_backfills_and_unfollow_clears_inbox(app):
+    fan, artist = make_user('fan2'), make_user('artist2')
+    old = publish(artist, 'The Entertainer', 30)
+
+    fan.follow(artist)
+    db.session.commit()
+    assert old in list(FollowedFeed(fan))
+
+    fan.unfollow(artist)
+    db.session.commit()
+    assert FeedItem.query.filter_by(owner_id=fan.id, artist_id=artist.id).count() == 0
+    assert old not in list(FollowedFeed(fan))
+
+def test_high_follower_artists_are_pulled_and_merged(app):
+    app.config['RAGTIME_FEED_FANOUT_THRESHOLD'] = 2
+    try:
+        fan, other = make_user('fan3'), make_user('fan4')
+        star, indie = make_user('star'), make_user('indie')
+        for u in (fan, other):
+            u.follow(star)
+        fan.follow(indie)
+        db.session.commit()
+
+        s1 = publish(star, 'Solace', 40)
+        i1 = publish(indie, 'Elite Syncopations', 30)
+        s2 = publish(star, 'Bethena', 20)
+        i2 = publish(indie, 'Pine Apple Rag', 10)
+
+        # two fans put the star over the threshold
+        assert FeedItem.query.filter_by(artist_id=star.id).count() == 0
+        feed = FollowedFeed(fan)
+        assert feed.pulled_artist_ids == [star.id]
+        assert list(feed) == [i2, s2, i1, s1]
+        assert feed.count() == 4
+
+        pagination = feed.paginate(page=2, per_page=3, error_out=False)
+        assert pagination.items == [s1]
+        assert pagination.pages == 2
+    finally:
+        app.config['RAGTIME_FEED_FANOUT_THRESHOLD'] = 10000
+
+def test_own_compositions_are_in_the_feed_without_a_self_follow(app):
+    fan, artist = make_user('fan5'), make_user('artist5')
+    fan.follow(artist)
+    fan.follow(fan)
+    db.session.commit()
+    # nor through another instance of the same row
+    fan_id = fan.id
+    db.session.expunge(fan)
+    fan, detached = db.session.get(User, fan_id), fan
+    fan.follow(detached)
+    db.session.commit()
+    assert fan.following.count() == 1 and not fan.is_following(fan)
+
+    mine = publish(fan, 'Wall Street Rag', 20)
+    theirs = publish(artist, 'Gladiolus Rag', 10)
+
+    assert FeedItem.query.filter_by(owner_id=fan.id, artist_id=fan.id).count() == 0
+    feed = FollowedFeed(fan)
+    assert list(feed) == [theirs, mine]
+    assert feed.count() == 2
+    assert fan.followed_compositions.order_by(
+        Composition.timestamp.desc()).all() == [theirs, mine]
+    assert list(FollowedFeed(artist)) == [theirs]
+
+def test_following_yourself_is_refused(app, client, user):
+    user.confirmed = True
+    db.session.commit()
+    # a context of its own, so the logged in user doesn't outlive the test
+    with app.app_context():
+        client.post('/auth/login', data={'email': 'unique@example.com', 'password': 'password'})
+        response = client.get('/follow/testuser', follow_redirects=True)
+    html = response.get_data(as_text=True)
+    assert "You can&#39;t follow yourself." in html and 'You are now following' not in html
+    assert user.following.count() == 0
+
+def test_a_leftover_self_follow_is_ignored(app, client):
+    fan, artist = make_user('fan6'), make_user('artist6')
+    fan.follow(artist)
+    # as an install that skipped 5c1e8f3a9d27 still has
+    db.session.add(Follow(follower=fan, following=fan))
+    db.session.commit()
+
+    mine = publish(fan, 'Euphonic Sounds', 10)
+    mine.slug = f'{mine.id}-euphonic-sounds'
+    db.session.commit()
+    assert FeedItem.query.filter_by(owner_id=fan.id, artist_id=fan.id).count() == 0
+    assert list(FollowedFeed(fan)) == [mine]
+    assert fan.other_followers().count() == 0 and fan.other_following().count() == 1
+
+    html = client.get('/user/fan6').get_data(as_text=True)
+    assert '0 Followers' in html and '1 Following' in html
+    assert 'fan6 has no followers yet' in client.get('/followers/fan6').get_data(as_text=True)
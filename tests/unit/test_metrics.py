@@ -0,0 +1,79 @@
+from app.metrics import Registry, record_cache
+
+def test_shards_are_merged_on_scrape():
+    import threading
+    registry = Registry()
+    hits = registry.counter('hits_total', 'Hits.', ('page',))
+    latency = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(1000):
+            hits.inc(('home',))
+        latency.observe(0.05)
+        latency.observe(5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    text = registry.exposition()
+    assert 'hits_total{page="home"} 4000' in text
+    assert 'latency_seconds_bucket{le="0.1"} 4' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 8' in text
+    assert 'latency_seconds_count 8' in text
+
+def test_metrics_endpoint(client):
+    client.get('/about')
+    record_cache('test', hit=True)
+    record_cache('test', hit=False)
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'ragtime_http_requests_total{blueprint="main",endpoint="main.about",method="GET",status="200"}' in text
+    assert 'ragtime_http_request_duration_seconds_bucket{blueprint="main",endpoint="main.about",le="+Inf"}' in text
+    assert 'ragtime_db_pool_checked_out{bind="default"}' in text
+    assert 'ragtime_email_queue_depth 0' in text
+    assert 'ragtime_cache_hit_ratio{cache="test"} 0.5' in text
+
+def test_finished_threads_leave_no_shards_behind():
+    import threading
+    registry = Registry()
+    hits = registry.counter('hits_total', 'Hits.', ('page',))
+    latency = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+
+    def work():
+        hits.inc(('home',))
+        latency.observe(0.05)
+
+    # one thread per request, like the threaded development server
+    for _ in range(200):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    assert len(registry._shards) <= 1
+    text = registry.exposition()
+    assert 'hits_total{page="home"} 200' in text
+    assert 'latency_seconds_count 200' in text
+
+def test_the_app_caches_count_hits(app, client):
+    from app.metrics import registry
+    from app.models import Role
+    from app.serializers import url_template
+
+    def lookups(cache):
+        return [registry.value('ragtime_cache_requests_total', (cache, result))
+                for result in ('hit', 'miss')]
+
+    before = lookups('url_templates'), lookups('default_role')
+    with app.test_request_context():
+        url_template('api.get_user')
+        url_template('api.get_user')
+    Role.default_id()
+    hits, misses = lookups('url_templates')
+    assert hits > before[0][0] and hits + misses == sum(before[0]) + 2
+    assert sum(lookups('default_role')) == sum(before[1]) + 1
+    assert 'ragtime_cache_hit_ratio{cache="url_templates"}' in \
+        client.get('/metrics').get_data(as_text=True)
@@ -0,0 +1,111 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app, db
+from app.models import Composition, Role, User
+from app.pagination import Cursor, KeysetPage, NumberedPage
+
+NOW = datetime(2026, 10, 19, 12, 0, 0, 500)
+
+
+@pytest.fixture
+def catalog(user):
+    # 25 compositions, in pairs published at the same moment
+    compositions = [
+        Composition(title=f'Rag {i}', release_type=1, description='', artist=user,
+                    timestamp=NOW - timedelta(minutes=i // 2))
+        for i in range(25)]
+    db.session.add_all(compositions)
+    db.session.commit()
+    for composition in compositions:
+        composition.generate_slug(commit=False)
+    db.session.commit()
+    return user
+
+
+def test_cursor_round_trip():
+    cursor = Cursor(NOW, 42)
+    assert Cursor.parse(str(cursor)) == cursor
+    for bad in ('', '42', 'yesterday_42', f'{NOW.isoformat()}_x'):
+        with pytest.raises(ValueError):
+            Cursor.parse(bad)
+
+
+def test_pages_continue_after_the_cursor(catalog):
+    query = Composition.query.filter_by(artist=catalog)
+    seen, before = [], None
+    while True:
+        page = KeysetPage(query, Composition.timestamp, Composition.id,
+                          per_page=10, before=before)
+        seen.extend(page)
+        if page.next_cursor is None:
+            break
+        before = page.next_cursor
+    expected = query.order_by(Composition.timestamp.desc(), Composition.id.desc()).all()
+    assert seen == expected
+
+
+def test_profile_is_streamed_a_page_at_a_time(app, client, catalog):
+    per_page = app.config['RAGTIME_COMPS_PER_PAGE']
+    response = client.get('/user/testuser')
+    assert 'Content-Length' not in response.headers
+    html = response.get_data(as_text=True)
+    assert html.count('class="composition"') == per_page
+    assert 'Rag 0' in html and 'Newest' not in html
+
+    older = re.search(r'rel="next" href="([^"]+)"', html).group(1)
+    html = client.get(older.replace('&amp;', '&')).get_data(as_text=True)
+    assert html.count('class="composition"') == per_page
+    assert f'Rag {per_page}\n' in html and 'Newest' in html
+
+
+def test_profile_ignores_a_bad_cursor(client, catalog):
+    html = client.get('/user/testuser?before=nonsense').get_data(as_text=True)
+    assert 'Rag 0\n' in html
+
+
+@pytest.mark.no_transaction
+def test_profile_streams_for_a_logged_in_viewer():
+    # The shared test app context hides the teardown between the view and
+    # its body; an app of its own gets one per request, as in production
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        artist = User(username='joplin', email='joplin@example.com',
+                      password='cat', confirmed=True)
+        db.session.add(artist)
+        db.session.commit()
+        db.session.add(Composition(title='Solace', release_type=1, description='',
+                                   artist=artist, slug='1-solace'))
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'joplin@example.com', 'password': 'cat'})
+    response = client.get('/user/joplin')
+    assert 'Content-Length' not in response.headers
+    html = response.get_data(as_text=True)
+    assert response.status_code == 200 and 'Solace' in html
+    # the viewer's own profile offers to edit their composition
+    assert '/edit/1-solace' in html
+
+
+@pytest.mark.parametrize('page, total', [(1, 0), (1, 5), (3, 95), (10, 200), (20, 200)])
+def test_numbered_page_numbers_like_a_query_page(app, page, total):
+    from flask_sqlalchemy.pagination import Pagination
+
+    class Counted(Pagination):
+        def _query_items(self):
+            return []
+
+        def _query_count(self):
+            return total
+
+    expected = Counted(page=page, per_page=10, error_out=False)
+    numbered = NumberedPage([], page, 10, total)
+    for name in ('pages', 'has_prev', 'prev_num', 'has_next', 'next_num'):
+        assert getattr(numbered, name) == getattr(expected, name), name
+    assert list(numbered.iter_pages(left_edge=1, left_current=5, right_current=5, right_edge=1)) == \
+        list(expected.iter_pages(left_edge=1, left_current=5, right_current=5, right_edge=1))
+    assert list(numbered.iter_pages()) == list(expected.iter_pages())
@@ -0,0 +1,86 @@
+import base64
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import db, passwords
+from app.exceptions import HasherBusy
+from app.metrics import registry
+from app.models import User
+from app.passwords import HasherPool
+
+
+def test_uses_configured_method(app):
+    user = User(username='scott', email='scott@example.com', password='cat')
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert not passwords.needs_rehash(user.password_hash)
+
+
+def test_outdated_hash_is_upgraded_on_login(app, client):
+    user = User(username='joplin', email='joplin@example.com', confirmed=True)
+    user.password_hash = generate_password_hash('cat', 'pbkdf2:sha256:2000')
+    db.session.add(user)
+    db.session.commit()
+    assert passwords.needs_rehash(user.password_hash)
+
+    headers = {'Authorization': 'Basic ' + base64.b64encode(b'joplin@example.com:dog').decode()}
+    assert client.get('/api/v1/', headers=headers).status_code == 401
+    headers = {'Authorization': 'Basic ' + base64.b64encode(b'joplin@example.com:cat').decode()}
+    assert client.get('/api/v1/', headers=headers).status_code == 200
+
+    db.session.expire_all()
+    user = db.session.get(User, user.id)
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert user.verify_password('cat')
+
+
+def test_pool_is_bounded():
+    pool = HasherPool(workers=1, queue=1)
+    release = threading.Event()
+    try:
+        running = pool.submit(release.wait)
+        waiting = pool.submit(lambda: 'done')
+        assert pool.pending == 2
+        with pytest.raises(HasherBusy):
+            pool.submit(lambda: 'rejected')
+        release.set()
+        assert running.result() and waiting.result() == 'done'
+        assert pool.run(lambda: 'again') == 'again'
+    finally:
+        release.set()
+        pool.shutdown(wait=True)
+    assert pool.pending == 0
+    assert registry.value('ragtime_password_hash_rejected_total') >= 1
+
+
+def test_run_hashes_on_the_calling_thread():
+    pool = HasherPool(workers=1, queue=1)
+    assert pool.run(threading.get_ident) == threading.get_ident()
+    release, started = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait()
+    holder = threading.Thread(target=pool.run, args=[hold])
+    holder.start()
+    try:
+        started.wait()
+        # the other thread's hash has the only worker place
+        waiter = threading.Thread(target=pool.run, args=[lambda: None])
+        waiter.start()
+        while pool.pending < 2:
+            time.sleep(0.01)
+        with pytest.raises(HasherBusy):
+            pool.run(lambda: 'rejected')
+    finally:
+        release.set()
+        holder.join()
+    waiter.join()
+    assert pool.pending == 0
+    assert pool._executor is None
+
+
+def test_queue_depth_is_exposed(app):
+    assert 'ragtime_password_hash_queue_depth 0' in registry.exposition()
@@ -0,0 +1,36 @@
+import pytest
+
+from app.profiling import normalize
+
+def test_normalize_groups_repeated_queries():
+    a = normalize("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'bob'\n LIMIT 10")
+    b = normalize("SELECT * FROM users WHERE id IN (?, ?) AND name = 'alice' LIMIT 20")
+    assert a == b == "SELECT * FROM users WHERE id IN (?, ...) AND name = ? LIMIT ?"
+
+@pytest.mark.no_transaction  # the test's SAVEPOINTs would count as queries
+def test_server_timing_header(client):
+    response = client.get('/user/nobody')
+    assert response.status_code == 404
+    assert '1 queries' in response.headers['Server-Timing']
+
+    response = client.get('/about')
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert 'queries"' in timing and 'tpl;dur=' in timing and 'app;dur=' in timing
+
+def test_endpoint_histogram(app, client):
+    client.get('/about')
+    client.get('/about')
+    stats = app.extensions['profiler'].snapshot()['endpoints']['main.about']
+    assert stats['requests'] >= 2
+    assert sum(stats['histogram'].values()) == stats['requests']
+
+def test_profiler_stats_requires_login(client):
+    assert client.get('/admin/profiler').status_code == 401
+
+def test_footer_is_on_streamed_pages(app, client, user, monkeypatch):
+    monkeypatch.setitem(app.config, 'RAGTIME_PROFILER_FOOTER', True)
+    for path in ('/', '/user/testuser', '/followers/testuser', '/following/testuser'):
+        html = client.get(path).get_data(as_text=True)
+        assert 'class="profiler-footer"' in html
@@ -0,0 +1,112 @@
+"""The hot queries must find their rows through an index.
+
+The statements are the ones the app itself sends: each hot path in
+HOT_PATHS is run with the statements recorded, and every SELECT among them
+goes through SQLite's EXPLAIN QUERY PLAN. A ``SCAN`` of a table (even one
+walking an index end to end) means it reads every row, and fails the test.
+Add new hot paths to HOT_PATHS.
+"""
+import base64
+from contextlib import contextmanager
+
+import pytest
+
+from app import db
+from app.feed import FollowedFeed, follower_count
+from app.models import Composition, User
+
+
+def query_plan(query):
+    """The detail column of EXPLAIN QUERY PLAN for a Query or select()"""
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    return explain(str(compiled), params)
+
+
+def explain(statement, params=()):
+    rows = db.session.connection().exec_driver_sql(
+        'EXPLAIN QUERY PLAN ' + statement, params)
+    return [row[3] for row in rows]
+
+
+def full_scans(plan):
+    """The steps of ``plan`` that read a whole table"""
+    return [step for step in plan
+            if step.startswith('SCAN ') and step.split()[1] in db.metadata.tables]
+
+
+@contextmanager
+def recorded_selects():
+    """The SELECTs sent while the block runs, with their parameters"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+    db.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def network(user):
+    """``user`` following a big and a small artist, all with compositions"""
+    user.confirmed = True
+    star = User(username='star', email='star@example.com')
+    indie = User(username='indie', email='indie@example.com')
+    db.session.add_all([star, indie])
+    db.session.flush()
+    user.follow(star)
+    user.follow(indie)
+    star.follow(user)
+    for artist in (user, star, indie):
+        composition = Composition(release_type=1, title='Maple Leaf Rag',
+                                  description='', artist=artist)
+        db.session.add(composition)
+        db.session.flush()
+        composition.generate_slug(commit=False)
+    db.session.commit()
+    return user
+
+
+def api_get(client, user, path):
+    token = base64.b64encode(f'{user.generate_auth_token()}:'.encode()).decode()
+    return client.get(path, headers={'Authorization': f'Basic {token}'})
+
+
+HOT_PATHS = {
+    # star has more followers than this threshold, so it is pulled
+    'feed': lambda client, user: FollowedFeed(user, threshold=1).paginate(
+        page=1, per_page=20),
+    'profile': lambda client, user: client.get(f'/user/{user.username}'),
+    'followers_page': lambda client, user: client.get(f'/followers/{user.username}'),
+    'following_page': lambda client, user: client.get(f'/following/{user.username}'),
+    'composition': lambda client, user: client.get(
+        f'/composition/{user.compositions.first().slug}'),
+    'api_timeline': lambda client, user: api_get(
+        client, user, f'/api/v1/users/{user.id}/timeline/'),
+    'follower_count': lambda client, user: follower_count(
+        db.session.connection(), user.id),
+}
+
+
+@pytest.mark.parametrize('name', HOT_PATHS)
+def test_hot_path_uses_indexes(client, network, name):
+    with recorded_selects() as statements:
+        response = HOT_PATHS[name](client, network)
+        if hasattr(response, 'get_data'):
+            assert response.status_code == 200
+            response.get_data()
+    assert statements
+    for statement, params in statements:
+        plan = explain(statement, params)
+        assert not full_scans(plan), '\n'.join([statement, *plan])
+
+
+def test_full_scans_are_detected(user):
+    # the check itself: filtering on an unindexed column reads everything
+    plan = query_plan(Composition.query.filter_by(title='Maple Leaf Rag'))
+    assert full_scans(plan) == ['SCAN compositions']
@@ -0,0 +1,146 @@
+import base64
+import threading
+
+import pytest
+
+from app import create_app, db
+from app.config import config, TestingConfig
+from app.decorators import rate_limit
+from app.metrics import registry
+from app.models import Role, User
+from app.ratelimit import Limit, Limiter, MemoryBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse():
+    limit = Limit.parse('10/minute')
+    assert (limit.count, limit.period, limit.interval) == (10, 60, 6)
+    assert Limit.parse('100 per hour').period == 3600
+    assert Limit.parse('5/10 seconds').period == 10
+    with pytest.raises(ValueError):
+        Limit.parse('lots')
+
+
+def test_gcra_allows_a_burst_then_one_per_interval():
+    clock = Clock()
+    limiter = Limiter(MemoryBackend(clock=clock))
+    limit = Limit.parse('3/minute')
+    results = [limiter.hit(limit, 'k') for _ in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results[:3]] == [2, 1, 0]
+    assert results[3].retry_after == pytest.approx(20)
+    assert limiter.hit(limit, 'other').allowed
+
+    clock.now += 20
+    assert limiter.hit(limit, 'k').allowed
+    assert not limiter.hit(limit, 'k').allowed
+    clock.now += 60
+    assert limiter.hit(limit, 'k').remaining == 2
+
+
+def test_memory_backend_drops_full_buckets():
+    clock = Clock()
+    backend = MemoryBackend(shards=1, clock=clock)
+    for i in range(1024):
+        backend.hit(f'k{i}', 1, 10)
+    clock.now += 2
+    backend.hit('late', 1, 10)
+    assert len(backend) == 1
+
+
+def test_memory_backend_marks_expire():
+    clock = Clock()
+    backend = MemoryBackend(clock=clock)
+    backend.mark('m', 5)
+    assert backend.marked('m') and not backend.marked('other')
+    clock.now += 5
+    assert not backend.marked('m')
+
+
+def test_memory_backend_is_thread_safe():
+    backend = MemoryBackend(shards=4)
+    limiter = Limiter(backend)
+    limit = Limit(1000, 3600)
+    allowed = []
+
+    def work():
+        allowed.extend(limiter.hit(limit, 'shared').allowed for _ in range(500))
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert allowed.count(True) == 1000
+
+
+@pytest.fixture(scope='module')
+def limited_app():
+    config['ratelimit'] = type('RateLimitConfig', (TestingConfig,), {
+        'RAGTIME_RATELIMIT': True, 'SECRET_KEY': 'secret', 'WTF_CSRF_ENABLED': False,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    try:
+        app = create_app('ratelimit')
+    finally:
+        del config['ratelimit']
+
+    @app.route('/limited')
+    @rate_limit('2/minute')
+    def limited():
+        return 'ok'
+
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(username='joplin', email='joplin@example.com',
+                            password='cat', confirmed=True))
+        db.session.commit()
+        yield app
+
+
+def test_headers_and_429(limited_app):
+    client = limited_app.test_client()
+    first = client.get('/limited')
+    assert first.headers['RateLimit-Limit'] == '2'
+    assert first.headers['RateLimit-Remaining'] == '1'
+    assert client.get('/limited').headers['RateLimit-Remaining'] == '0'
+    refused = client.get('/limited')
+    assert refused.status_code == 429
+    assert refused.headers['Retry-After'] == '30'
+    assert registry.value('ragtime_rate_limited_total', ('limited',)) >= 1
+    # another client has its own bucket
+    other = client.get('/limited', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert other.status_code == 200
+
+
+def test_token_endpoint_is_limited_before_the_password_check(limited_app, monkeypatch):
+    checks = []
+    monkeypatch.setattr(User, 'verify_password',
+                        lambda self, password: checks.append(password) or False)
+    client = limited_app.test_client()
+    headers = {'Authorization': 'Basic ' + base64.b64encode(
+        b'joplin@example.com:wrong').decode()}
+    statuses = [client.post('/api/v1/tokens/', headers=headers).status_code
+                for _ in range(12)]
+    assert statuses == [401] * 10 + [429] * 2
+    assert len(checks) == 10
+    response = client.post('/api/v1/tokens/', headers=headers)
+    assert response.get_json()['error'] == 'too many requests'
+
+
+def test_login_get_is_not_counted(limited_app):
+    client = limited_app.test_client()
+    client.environ_base['REMOTE_ADDR'] = '10.0.0.3'
+    for _ in range(12):
+        assert client.get('/auth/login').status_code == 200
+    statuses = [client.post('/auth/login', data={'email': 'x@example.com',
+                                                 'password': 'x'}).status_code
+                for _ in range(11)]
+    assert statuses[-1] == 429 and 429 not in statuses[:10]
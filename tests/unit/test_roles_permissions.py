@@ -12,7 +12,7 @@ def setup_roles(app):
 
 def create_user(username, email, password="password", role=None):
     """Helper to create a user with password and optional role."""
-    u = User(username=username, email=email)
+    u = User(username=username, email=email, confirmed=True)  # unconfirmed users are redirected
     u.password = password  # automatically hashes the password
     if role:
         u.role = role
@@ -67,14 +67,14 @@ def test_admin_required_view(client, app, setup_roles):
 
         with client:
             # Login as normal user
-            client.post("/login", data={"email": "user@example.com", "password": "password"}, follow_redirects=True)
+            client.post("/auth/login", data={"email": "user@example.com", "password": "password"})
             response = client.get("/admin")
             # Normal users should be forbidden
             assert response.status_code == 403
 
             # Logout and login as admin
-            client.get("/logout", follow_redirects=True)
-            client.post("/login", data={"email": "admin@example.com", "password": "password"}, follow_redirects=True)
+            client.get("/auth/logout")
+            client.post("/auth/login", data={"email": "admin@example.com", "password": "password"})
             response = client.get("/admin")
             # Admin should access successfully
             assert response.status_code == 200
@@ -90,14 +90,14 @@ def test_permission_required_view(client, app, setup_roles):
 
         with client:
             # Login as normal user
-            client.post("/login", data={"email": "user2@example.com", "password": "password"}, follow_redirects=True)
+            client.post("/auth/login", data={"email": "user2@example.com", "password": "password"})
             response = client.get("/moderate")
             # Normal users should be forbidden
             assert response.status_code == 403
 
             # Logout and login as moderator
-            client.get("/logout", follow_redirects=True)
-            client.post("/login", data={"email": "mod@example.com", "password": "password"}, follow_redirects=True)
+            client.get("/auth/logout")
+            client.post("/auth/login", data={"email": "mod@example.com", "password": "password"})
             response = client.get("/moderate")
             # Moderator should access successfully
             assert response.status_code == 200
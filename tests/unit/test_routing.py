@@ -0,0 +1,105 @@
+import base64
+import shutil
+import pytest
+from app import create_app, db
+from app.config import config, TestingConfig
+from app.models import Role, User, Composition
+
+@pytest.fixture
+def replicated_app(tmp_path):
+    primary, replica = tmp_path / 'primary.sqlite', tmp_path / 'replica.sqlite'
+    config['replicated'] = type('ReplicatedConfig', (TestingConfig,), {
+        'SECRET_KEY': 'routing-test',
+        'WTF_CSRF_ENABLED': False,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'RAGTIME_REPLICA_URLS': [f'sqlite:///{replica}'],
+    })
+    app = create_app('replicated')
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        u = User(username='scott', email='scott@example.com',
+                 password='password', confirmed=True)
+        c = Composition(release_type=1, title='Replicated Rag',
+                        description='', artist=u)
+        db.session.add(c)
+        db.session.commit()
+        c.generate_slug()
+        db.engine.dispose()
+        shutil.copy(primary, replica)
+
+        # a write the replica hasn't caught up with yet
+        c = Composition(release_type=1, title='Lagging Rag',
+                        description='', artist=u)
+        db.session.add(c)
+        db.session.commit()
+        c.generate_slug()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+        for engine in app.extensions['replicas'].values():
+            engine.dispose()
+    del config['replicated']
+
+def test_reads_go_to_replica(replicated_app):
+    client = replicated_app.test_client()
+    page = client.get('/').get_data(as_text=True)
+    assert 'Replicated Rag' in page
+    assert 'Lagging Rag' not in page
+
+def test_writes_go_to_primary_and_stick(replicated_app):
+    client = replicated_app.test_client()
+    client.post('/auth/login', data={'email': 'scott@example.com',
+                                     'password': 'password'})
+    response = client.post('/', data={'release_type': 1,
+                                           'title': 'Fresh Rag',
+                                           'description': 'just published'})
+    assert response.status_code == 302
+
+    with replicated_app.app_context():
+        assert Composition.query.filter_by(title='Fresh Rag').first() is not None
+
+    # read-your-writes: the client now reads from the primary
+    page = client.get('/').get_data(as_text=True)
+    assert 'Fresh Rag' in page
+    assert 'Lagging Rag' in page
+
+    # once the window has passed it is back on the replica
+    with client.session_transaction() as sess:
+        sess['_primary_until'] = 0
+    page = client.get('/').get_data(as_text=True)
+    assert 'Fresh Rag' not in page
+
+def test_follow_checks_the_primary(replicated_app):
+    with replicated_app.app_context():
+        # registered after the replica's copy was taken
+        db.session.add(User(username='joplin', email='joplin@example.com',
+                            password='cat', confirmed=True))
+        db.session.commit()
+    client = replicated_app.test_client()
+    client.post('/auth/login', data={'email': 'scott@example.com',
+                                     'password': 'password'})
+    with client.session_transaction() as sess:
+        sess['_primary_until'] = 0
+    response = client.get('/follow/joplin', follow_redirects=True)
+    assert 'You are now following joplin' in response.get_data(as_text=True)
+
+def basic_auth(username, password=''):
+    credentials = base64.b64encode(f'{username}:{password}'.encode()).decode()
+    return {'Authorization': f'Basic {credentials}'}
+
+def test_api_clients_read_their_writes(replicated_app):
+    with replicated_app.app_context():
+        token = User.query.filter_by(username='scott').first().generate_auth_token()
+    # API clients send no cookies back
+    client = replicated_app.test_client(use_cookies=False)
+    response = client.post('/api/v1/compositions/', headers=basic_auth(token), json={
+        'release_type': 1, 'title': 'Api Rag', 'description': 'posted'})
+    assert response.status_code == 201
+    url = response.headers['Location']
+    assert client.get(url, headers=basic_auth(token)).json['title'] == 'Api Rag'
+
+    # other credentials still read the replica
+    password = basic_auth('scott@example.com', 'password')
+    assert client.get(url, headers=password).status_code == 404
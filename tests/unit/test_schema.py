@@ -0,0 +1,111 @@
+import os
+
+import pytest
+import sqlalchemy as sa
+from alembic.script import ScriptDirectory
+from flask_migrate import Migrate
+
+from app import create_app, db
+from app.config import config, TestingConfig
+from app.models import User
+from app.schema import fill_feeds, upgrade_schema
+
+MIGRATIONS = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'migrations')
+
+# What create_app()'s create_all() made before the migrations ran on deploy
+BASELINE_SCHEMA = [
+    'CREATE TABLE roles (id INTEGER NOT NULL, name VARCHAR(64), "default" BOOLEAN, '
+    'permissions INTEGER, PRIMARY KEY (id), UNIQUE (name))',
+    'CREATE INDEX ix_roles_default ON roles ("default")',
+    'CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR(64), '
+    'email VARCHAR(65) NOT NULL, role_id INTEGER, password_hash VARCHAR(128), '
+    'confirmed BOOLEAN, name VARCHAR(64), location VARCHAR(64), bio TEXT, '
+    'last_seen DATETIME, avatar_hash VARCHAR(32), PRIMARY KEY (id), '
+    'FOREIGN KEY(role_id) REFERENCES roles (id))',
+    'CREATE UNIQUE INDEX ix_users_email ON users (email)',
+    'CREATE UNIQUE INDEX ix_users_username ON users (username)',
+    'CREATE TABLE follows (follower_id INTEGER NOT NULL, following_id INTEGER NOT NULL, '
+    'timestamp DATETIME, PRIMARY KEY (follower_id, following_id), '
+    'FOREIGN KEY(follower_id) REFERENCES users (id), '
+    'FOREIGN KEY(following_id) REFERENCES users (id))',
+    'CREATE TABLE compositions (id INTEGER NOT NULL, release_type INTEGER, '
+    'title VARCHAR(64), description TEXT, description_html TEXT, slug VARCHAR(128), '
+    'timestamp DATETIME, artist_id INTEGER, PRIMARY KEY (id), '
+    'FOREIGN KEY(artist_id) REFERENCES users (id))',
+    'CREATE UNIQUE INDEX ix_compositions_slug ON compositions (slug)',
+    'CREATE INDEX ix_compositions_timestamp ON compositions (timestamp)',
+    # the rows of an install from then, self-follows included
+    "INSERT INTO users (id, username, email) VALUES "
+    "(1, 'joplin', 'Joplin@example.com'), (2, 'lamb', 'lamb@example.com')",
+    "INSERT INTO follows (follower_id, following_id, timestamp) VALUES "
+    "(1, 1, '2020-01-01'), (2, 2, '2020-01-01'), (2, 1, '2020-01-01')",
+    "INSERT INTO compositions (id, release_type, title, timestamp, artist_id) "
+    "VALUES (1, 1, 'Solace', '2020-01-02', 1)",
+]
+
+
+@pytest.fixture
+def deploy_app(tmp_path, monkeypatch):
+    # migrations/env.py would apply alembic.ini's logging config, which
+    # disables the loggers of the rest of the session
+    monkeypatch.setattr('logging.config.fileConfig', lambda *args, **kwargs: None)
+    config['deploy'] = type('DeployConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "deploy.sqlite"}',
+    })
+    try:
+        app = create_app('deploy')
+    finally:
+        del config['deploy']
+    Migrate(app, db, directory=MIGRATIONS, render_as_batch=True)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def revision():
+    return db.session.execute(sa.text('SELECT version_num FROM alembic_version')).scalar()
+
+
+@pytest.mark.no_transaction
+def test_deploy_migrates_a_baseline_database(deploy_app):
+    with db.engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(sa.text(statement))
+
+    assert upgrade_schema() == 'upgraded from b01334907d82'
+    assert revision() == ScriptDirectory(MIGRATIONS).get_current_head()
+    rows = lambda sql: db.session.execute(sa.text(sql)).all()
+    assert rows('SELECT follower_id, following_id FROM follows') == [(2, 1)]
+    assert rows('SELECT owner_id, composition_id FROM feed_items') == [(2, 1)]
+    assert rows('SELECT avatar_hash FROM users ORDER BY id') == [
+        (User.hash_email('Joplin@example.com'),), (User.hash_email('lamb@example.com'),)]
+    columns = {column['name']: column['type']
+               for column in db.inspect(db.engine).get_columns('users')}
+    assert columns['password_hash'].length == 256
+
+
+@pytest.mark.no_transaction
+def test_deploy_builds_an_empty_database(deploy_app):
+    assert upgrade_schema() == 'created'
+    assert revision() == ScriptDirectory(MIGRATIONS).get_current_head()
+    assert db.inspect(db.engine).has_table('feed_items')
+    # a second deploy only upgrades
+    assert upgrade_schema() == 'upgraded'
+
+
+@pytest.mark.no_transaction
+def test_deploy_fills_empty_inboxes(deploy_app):
+    # tables a create_all() made, rows that never went through the fan-out
+    db.create_all()
+    with db.engine.begin() as connection:
+        for statement in BASELINE_SCHEMA[-3:]:
+            connection.execute(sa.text(statement))
+    assert upgrade_schema() == 'upgraded from b01334907d82'
+    assert db.session.execute(sa.text('SELECT count(*) FROM feed_items')).scalar() == 0
+
+    assert fill_feeds()
+    assert db.session.execute(
+        sa.text('SELECT owner_id, composition_id FROM feed_items')).all() == [(2, 1)]
+    # only ever an empty one
+    assert not fill_feeds()
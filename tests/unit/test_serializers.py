@@ -0,0 +1,96 @@
+import base64
+from datetime import datetime
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+from app import db
+from app.models import Composition, User
+from app.serializers import (CompositionSerializer, OrjsonProvider, UserSerializer,
+                             orjson, url_template)
+
+
+@pytest.fixture
+def artist(app):
+    joplin = User(username='joplin', email='joplin@example.com',
+                  password='cat', confirmed=True)
+    db.session.add(joplin)
+    db.session.add_all(Composition(title=f'Rag {i}', release_type=i % 4,
+                                   description='see example.com', artist=joplin)
+                       for i in range(12))
+    db.session.commit()
+    return joplin
+
+
+def test_matches_to_json(app, artist):
+    with app.test_request_context(base_url='https://ragtime.example.com/'):
+        serializer = CompositionSerializer()
+        rows = db.session.execute(serializer.select().order_by(Composition.id)).all()
+        expected = [c.to_json() for c in Composition.query.order_by(Composition.id)]
+        assert serializer.many(rows) == expected
+
+        serializer = UserSerializer()
+        row = db.session.execute(serializer.select().where(User.id == artist.id)).one()
+        assert serializer(row) == artist.to_json()
+
+
+def test_url_templates_are_per_host(app):
+    with app.test_request_context(base_url='http://a.example.com/'):
+        assert url_template('api.get_user', external=True)(7) == \
+            'http://a.example.com/api/v1/users/7'
+    with app.test_request_context(base_url='http://b.example.com/'):
+        assert url_template('api.get_user', external=True)(7) == \
+            'http://b.example.com/api/v1/users/7'
+
+
+@pytest.mark.skipif(orjson is None, reason='orjson not installed')
+def test_orjson_provider_matches_default(app):
+    data = {'b': [1, 2.5, None, True], 'a': 'naïve', 'c': {'nested': 1},
+            'when': datetime(2020, 1, 2, 3, 4, 5)}
+    fast, default = OrjsonProvider(app), DefaultJSONProvider(app)
+    assert fast.loads(fast.dumps(data)) == default.loads(default.dumps(data))
+    assert isinstance(app.json, OrjsonProvider)
+
+
+def test_compositions_endpoint_pages(app, client, artist):
+    headers = {'Authorization': 'Basic ' + base64.b64encode(
+        b'joplin@example.com:cat').decode()}
+    data = client.get('/api/v1/compositions/?page=2', headers=headers).get_json()
+    per_page = app.config['RAGTIME_COMPS_PER_PAGE']
+    assert data['count'] == 12
+    assert len(data['compositions']) == min(per_page, 12 - per_page)
+    assert data['prev'] == '/api/v1/compositions/?page=1'
+
+
+def basic_auth():
+    return {'Authorization': 'Basic ' + base64.b64encode(b'joplin@example.com:cat').decode()}
+
+
+def test_sparse_fieldsets(app, client, artist):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    db.event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        data = client.get('/api/v1/compositions/?fields=title,timestamp',
+                          headers=basic_auth()).get_json()
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', listener)
+    assert all(set(item) == {'title', 'timestamp'} for item in data['compositions'])
+    assert 'fields=title' in data['next']
+    select = next(s for s in statements if 'FROM compositions' in s and 'LIMIT' in s)
+    assert 'description' not in select and 'compositions.title' in select
+
+
+def test_include_artist(client, artist):
+    data = client.get(f'/api/v1/users/{artist.id}/compositions/'
+                      f'?include=artist&fields=title', headers=basic_auth()).get_json()
+    assert data['count'] == 12
+    assert data['compositions'][0]['artist'] == {
+        'url': f'http://localhost/api/v1/users/{artist.id}',
+        'username': 'joplin', 'name': None}
+
+
+def test_unknown_fields_are_rejected(client, artist):
+    for query in ('fields=title,password_hash', 'include=followers'):
+        response = client.get(f'/api/v1/compositions/?{query}', headers=basic_auth())
+        assert response.status_code == 400
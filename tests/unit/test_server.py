@@ -0,0 +1,79 @@
+import os
+import re
+import signal
+import subprocess
+import sys
+import urllib.request
+
+import pytest
+
+from app import db
+from app.models import Role, _default_role_ids
+from app.server import RESPAWN_DELAY_MAX, memory_usage, respawn_delay, warm_up
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SERVE = '''
+from app import create_app
+from app.server import serve
+serve(create_app('testing'), port=0, workers=2)
+'''
+
+
+@pytest.mark.no_transaction  # warm_up checks every connection is back in the pool
+def test_warm_up(app):
+    _default_role_ids.clear()
+    timings = warm_up(app)
+    assert set(timings) == {'templates', 'mappers', 'url_map', 'role_cache'}
+    assert db.engine.pool.checkedout() == 0
+    assert 'index.html' in {key[1] for key in app.jinja_env.cache.keys()}
+    assert _default_role_ids[db.engine] == Role.query.filter_by(default=True).one().id
+
+
+def test_memory_usage():
+    memory = memory_usage()
+    assert memory['rss_kb'] > 0
+
+
+def test_serve_forks_workers():
+    proc = subprocess.Popen(
+        [sys.executable, '-c', SERVE], cwd=ROOT, text=True,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        env=dict(os.environ, DATABASE_TEST_URL='sqlite://'))
+    try:
+        lines = []
+        for line in proc.stdout:
+            lines.append(line)
+            if line.startswith('Listening on'):
+                break
+        assert 'threaded workers' in lines[-1]
+        port = int(re.search(r':(\d+) ', lines[-1]).group(1))
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/about') as response:
+            assert response.status == 200
+        for line in proc.stdout:
+            if 'first request' in line:
+                assert 'rss' in line
+                break
+
+        # a worker that dies is replaced
+        worker = int(re.search(r'\[worker (\d+)\]', line).group(1))
+        os.kill(worker, signal.SIGKILL)
+        for line in proc.stdout:
+            if line.startswith(f'Worker {worker} exited'):
+                assert 'respawning in 0.0 s' in line
+                break
+        for line in proc.stdout:
+            if 'ready' in line:
+                break
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/about') as response:
+            assert response.status == 200
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=10) == 0
+
+
+def test_respawns_back_off_as_crashes_pile_up():
+    delays = [respawn_delay(crashes) for crashes in range(1, 10)]
+    assert delays[0] == 0
+    assert all(b == min(2 * a, RESPAWN_DELAY_MAX) for a, b in zip(delays[1:], delays[2:]))
+    assert delays[-1] == RESPAWN_DELAY_MAX
@@ -0,0 +1,93 @@
+import pytest
+
+from app import create_app, db
+from app.metrics import registry
+from app.models import Composition, Role, User
+from app.streaming import FLUSH, _buffered
+
+
+def test_buffered_sends_at_flush_points_and_size():
+    chunks = ['<head>', f'</nav>{FLUSH}<div>', 'a' * 10, 'b' * 10, 'c', '</div>']
+    assert list(_buffered(chunks, 16)) == [
+        '<head></nav>', '<div>' + 'a' * 10 + 'b' * 10, 'c</div>']
+    assert list(_buffered([FLUSH, 'x', FLUSH], 16)) == ['x']
+
+
+def test_layout_is_sent_before_the_queries_run(app, client, user):
+    db.session.add(Composition(title='Solace', release_type=1, description='',
+                               artist=user, slug='1-solace'))
+    db.session.commit()
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    db.event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get('/')
+        assert 'Content-Length' not in response.headers
+        chunks = response.iter_encoded()
+        head = next(chunks).decode()
+        assert '</head>' in head and 'navbar' in head and 'Solace' not in head
+        assert not any('FROM compositions' in s for s in statements)
+        body = b''.join(chunks).decode()
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', listener)
+    assert 'Solace' in body and FLUSH not in head + body
+    assert any('FROM compositions' in s for s in statements)
+
+
+def test_flashes_are_popped_before_streaming(client):
+    with client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Published!')]
+    assert 'Published!' in client.get('/').get_data(as_text=True)
+    assert 'Published!' not in client.get('/').get_data(as_text=True)
+
+
+def test_errors_while_streaming_are_counted(app, client, user, monkeypatch, caplog):
+    class Broken:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __iter__(self):
+            raise OSError('the database went away')
+    monkeypatch.setattr('app.main.views.KeysetPage', Broken)
+    before = registry.value('ragtime_stream_errors_total', ('main.user',))
+    response = client.get('/user/testuser')
+    assert response.status_code == 200
+    with pytest.raises(OSError):
+        response.get_data()
+    assert registry.value('ragtime_stream_errors_total', ('main.user',)) == before + 1
+    assert 'Error streaming /user/testuser' in caplog.text
+
+
+def test_pages_render_whole_when_streaming_is_off(app, client, user, monkeypatch):
+    monkeypatch.setitem(app.config, 'RAGTIME_STREAM_TEMPLATES', False)
+    response = client.get('/followers/testuser')
+    assert 'Content-Length' in response.headers
+    assert FLUSH not in response.get_data(as_text=True)
+
+
+@pytest.mark.no_transaction
+@pytest.mark.parametrize('stream', [True, False])
+def test_body_renders_after_the_views_session_is_removed(stream):
+    # The shared test app context hides the teardown between the view and
+    # its body; an app of its own gets one per request, as in production
+    app = create_app('testing')
+    app.config['RAGTIME_STREAM_TEMPLATES'] = stream
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        artist = User(username='joplin', email='joplin@example.com',
+                      password='cat', confirmed=True)
+        db.session.add(artist)
+        db.session.commit()
+        db.session.add(Composition(title='Solace', release_type=1, description='',
+                                   artist=artist, slug='1-solace'))
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'joplin@example.com', 'password': 'cat'})
+    for path in ('/', '/user/joplin', '/followers/joplin', '/following/joplin'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert ('Content-Length' in response.headers) is not stream
+        assert 'joplin' in response.get_data(as_text=True)
+    # the artist's own profile offers to edit their composition
+    assert '/edit/1-solace' in client.get('/user/joplin').get_data(as_text=True)
@@ -0,0 +1,35 @@
+import os
+
+from jinja2 import Environment
+
+from app import create_app
+from app.config import config, TestingConfig
+from app.templating import TemplateBytecodeCache, compile_templates
+
+
+def test_bytecode_cache_skips_compilation(tmp_path, monkeypatch):
+    config['template-cache'] = type('TemplateCacheConfig', (TestingConfig,), {
+        'RAGTIME_TEMPLATE_CACHE_DIR': str(tmp_path),
+    })
+    try:
+        names = compile_templates(create_app('template-cache'))
+        assert 'index.html' in names
+        assert len(os.listdir(tmp_path)) == len(names)
+
+        compiled = []
+        original = Environment.compile
+        monkeypatch.setattr(Environment, 'compile', lambda self, *args, **kwargs:
+                            compiled.append(args) or original(self, *args, **kwargs))
+        create_app('template-cache').jinja_env.get_template('index.html')
+        assert compiled == []
+    finally:
+        del config['template-cache']
+
+
+def test_cache_key_follows_mtime(tmp_path):
+    template = tmp_path / 'page.html'
+    template.write_text('hello')
+    cache = TemplateBytecodeCache(str(tmp_path))
+    before = cache.get_cache_key('page.html', str(template))
+    os.utime(template, ns=(0, 0))
+    assert cache.get_cache_key('page.html', str(template)) != before
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from app import create_app, db
+from app.config import config, TestingConfig
+from app.models import Composition, Follow, Role, User
+from app.transfer import TABLES, export_tables, import_tables
+
+# the exports read through their own connections
+pytestmark = pytest.mark.no_transaction
+
+
+@pytest.fixture
+def catalog(app):
+    joplin = User(username='joplin', email='joplin@example.com', password='cat',
+                  confirmed=True, bio='Comma, "quotes"\nand newlines',
+                  # text that looks like the CSV NULL marker
+                  location=r'\N', name=r'\\ragtime\joplin')
+    lamb = User(username='lamb', email='lamb@example.com', password='dog')
+    db.session.add_all([joplin, lamb])
+    db.session.commit()
+    lamb.follow(joplin)
+    db.session.add_all(Composition(title=f'Rag {i}', release_type=1,
+                                   description='see example.com', artist=joplin)
+                       for i in range(5))
+    db.session.commit()
+
+
+def dump(table):
+    with db.engine.connect() as connection:
+        return connection.execute(db.select(table).order_by(
+            *table.primary_key.columns)).all()
+
+
+@pytest.fixture
+def target(tmp_path):
+    config['transfer'] = type('TransferConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "target.sqlite"}',
+    })
+    try:
+        app = create_app('transfer')
+        with app.app_context():
+            db.create_all()
+            Role.insert_roles()
+        yield app
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        del config['transfer']
+
+
+@pytest.mark.parametrize('fmt, compress', [('ndjson', False), ('csv', True)])
+def test_round_trip(app, catalog, target, tmp_path, fmt, compress):
+    exported = {table: rows for table, rows, _ in
+                export_tables(tmp_path / 'dump', fmt=fmt, compress=compress, batch_size=2)}
+    assert exported['compositions'] == 5
+    source = {name: dump(table) for name, table in TABLES.items()}
+
+    with target.app_context():
+        imported = dict((table, rows) for table, rows, _ in
+                        import_tables(tmp_path / 'dump', batch_size=2))
+        assert imported['roles'] == 0  # already there
+        for name, table in TABLES.items():
+            assert dump(table) == source[name]
+
+
+def test_resume_from_checkpoint(app, catalog, target, tmp_path):
+    list(export_tables(tmp_path / 'dump'))
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    with target.app_context():
+        # first run stops after the users
+        list(import_tables(tmp_path / 'dump', tables=('roles', 'users'),
+                           checkpoint_path=checkpoint))
+        with open(checkpoint) as f:
+            assert json.load(f)['users'] == 'complete'
+        imported = {table: rows for table, rows, _ in
+                    import_tables(tmp_path / 'dump', checkpoint_path=checkpoint)}
+        assert 'users' not in imported
+        assert imported['compositions'] == 5
+        assert User.query.count() == 2
+        assert Follow.query.count() == len(dump(Follow.__table__))
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_roles_are_matched_by_name(app, catalog, target, tmp_path, fmt):
+    curator = Role(name='Curator', permissions=0)
+    db.session.add(curator)
+    User.query.filter_by(username='lamb').one().role = curator
+    db.session.commit()
+    try:
+        list(export_tables(tmp_path / 'dump', fmt=fmt))
+        source = {user.username: user.role.name for user in User.query}
+    finally:
+        User.query.filter_by(username='lamb').one().role = None
+        db.session.delete(curator)
+        db.session.commit()
+
+    with target.app_context():
+        # the target's deploy numbered its roles the other way round
+        with db.engine.begin() as connection:
+            connection.execute(Role.__table__.update().values(id=100 - Role.id))
+        imported = {table: rows for table, rows, _ in import_tables(tmp_path / 'dump')}
+        assert imported['roles'] == 1
+        assert {user.username: user.role.name for user in User.query} == source
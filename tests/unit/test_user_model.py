@@ -1,16 +1,6 @@
 import pytest
-from app import create_app, db
-from app.models import User
-from datetime import datetime, timedelta
-
-@pytest.fixture
-def app():
-    app = create_app('testing')
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.session.remove()
-        db.drop_all()
+from app import db
+from app.models import Follow, Role, User
 
 @pytest.fixture
 def user(app): 
@@ -25,12 +15,51 @@ def test_confirmation_token_valid(user):
     assert user.confirmed is True
 
 def test_confirmation_token_expired(user, monkeypatch):
-    token = user.generate_confirmation_token(expiration_sec=1)
-    # Simular que pasa tiempo para que caduque
-    import time
-    time.sleep(2)
+    # Issued already expired, rather than sleeping until it is
+    token = user.generate_confirmation_token(expiration_sec=-10)
     assert user.confirm(token) is False
 
 def test_confirmation_token_invalid(user):
     fake_token = "invalid.token.here"
     assert user.confirm(fake_token) is False
+
+@pytest.fixture
+def statements(app):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    db.event.listen(db.engine, 'before_cursor_execute', listener)
+    yield statements
+    db.event.remove(db.engine, 'before_cursor_execute', listener)
+
+def test_constructor_runs_no_sql(app, statements):
+    role_id = Role.default_id()  # cached from here on
+    del statements[:]
+    u = User(username='pure', email='pure@example.com')
+    assert statements == []
+    assert u not in db.session
+    assert u.role_id == role_id
+
+    db.session.add(u)
+    db.session.commit()
+    assert u.role.default
+    assert u.following.count() == 0
+
+def test_create_many(app, statements):
+    Role.default_id()
+    del statements[:]
+    ids = User.create_many(
+        [{'username': f'bulk{i}', 'email': f'bulk{i}@example.com'} for i in range(2000)] +
+        [{'username': 'bulkpw', 'email': 'bulkpw@example.com', 'password': 'cat',
+          'confirmed': True}])
+    db.session.commit()
+    assert len(ids) == 2001
+    # users in batches of 1000 (one more for the differently-keyed row)
+    assert len(statements) <= 5
+
+    first = User.query.filter_by(username='bulk0').one()
+    last = User.query.filter_by(username='bulkpw').one()
+    assert first.username == 'bulk0' and first.role.default
+    assert first.avatar_hash == first.email_hash()
+    assert not first.confirmed
+    assert last.verify_password('cat') and last.confirmed
+    assert Follow.query.filter(Follow.follower_id.in_(ids)).count() == 0